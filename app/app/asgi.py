@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_asgi_application()
+from core.asgi import get_pooled_asgi_application  # noqa: E402
+
+application = get_pooled_asgi_application()
+
+# Imported once the app registry is ready.
+from django.conf import settings  # noqa: E402
+from core.warmup import warmup  # noqa: E402
+
+if settings.WARMUP:
+    warmup()
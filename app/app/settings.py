@@ -53,6 +53,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.admission.AdmissionControlMiddleware',
+    'core.instrumentation.RequestTimingMiddleware',
+    'core.memory.MemoryProfilingMiddleware',
+    'core.db.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,6 +66,19 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Token-authenticated API routes skip sessions, CSRF, the auth middleware
+# and messages, see core.handlers.RouteAwareWSGIHandler
+API_MIDDLEWARE_PREFIXES = ['/api/']
+API_MIDDLEWARE = [
+    'core.admission.AdmissionControlMiddleware',
+    'core.instrumentation.RequestTimingMiddleware',
+    'core.memory.MemoryProfilingMiddleware',
+    'core.db.replicas.ReplicaRoutingMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -88,13 +105,106 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # Keep connections open across requests, check them before reuse
+        # and spread their expiry so workers don't reconnect together.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': bool(
+            int(os.environ.get('DB_CONN_HEALTH_CHECKS', 1))
+        ),
+        'CONN_MAX_AGE_JITTER': float(
+            os.environ.get('DB_CONN_MAX_AGE_JITTER', 0.2)
+        ),
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+        },
+    }
+}
+
+# Read replicas, one alias per host in DB_REPLICA_HOSTS. Safe requests
+# read from a replica unless the client wrote in the last
+# REPLICA_PIN_SECONDS, tracked per token in REPLICA_PIN_FILE and by a
+# cookie. Unreachable replicas are retried after REPLICA_RETRY_SECONDS.
+
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))
+):
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
     }
+    DATABASE_REPLICAS.append(alias)
+
+# Recipe data shards, one alias per host in DB_SHARD_HOSTS. Each user's
+# recipes, tags and ingredients live on one shard, see core.db.sharding.
+
+DATABASE_SHARDS = ['default']
+for index, host in enumerate(
+    filter(None, os.environ.get('DB_SHARD_HOSTS', '').split(','))
+):
+    alias = f'shard{index + 1}'
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host.strip()}
+    DATABASE_SHARDS.append(alias)
+
+DATABASE_ROUTERS = [
+    'core.db.sharding.ShardRouter',
+    'core.db.replicas.ReplicaRouter',
+]
+REPLICA_PIN_SECONDS = float(os.environ.get('REPLICA_PIN_SECONDS', 5))
+REPLICA_RETRY_SECONDS = float(os.environ.get('REPLICA_RETRY_SECONDS', 30))
+REPLICA_PIN_FILE = os.environ.get(
+    'REPLICA_PIN_FILE', '/vol/replicas/pins.db'
+)
+REPLICA_PIN_SLOTS = int(os.environ.get('REPLICA_PIN_SLOTS', 65536))
+
+# Statement timeouts of the recipe views, by URL name, see
+# core.db.timeouts. Filters take at most RECIPE_FILTER_MAX_IDS IDs, and
+# ?ids= multi-gets of recipes at most RECIPE_MULTI_GET_MAX_IDS.
+
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 5000))
+DB_STATEMENT_TIMEOUTS = {
+    'recipe:recipe-list': 2000,
+    'recipe:recipe-detail': 1000,
+    'recipe:tag-list': 1000,
+    'recipe:ingredient-list': 1000,
+    'recipe:sync': 2000,
 }
+RECIPE_FILTER_MAX_IDS = int(os.environ.get('RECIPE_FILTER_MAX_IDS', 50))
+RECIPE_MULTI_GET_MAX_IDS = int(
+    os.environ.get('RECIPE_MULTI_GET_MAX_IDS', 100)
+)
+
+# Responses to writes sent with an Idempotency-Key are kept this long and
+# replayed to retries, requests still running hold their key for the
+# lease, see core.idempotency
+
+IDEMPOTENCY_TTL_SECONDS = int(
+    os.environ.get('IDEMPOTENCY_TTL_SECONDS', 24 * 60 * 60)
+)
+IDEMPOTENCY_WAIT_SECONDS = float(
+    os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 10)
+)
+IDEMPOTENCY_LEASE_SECONDS = int(
+    os.environ.get('IDEMPOTENCY_LEASE_SECONDS', 60)
+)
+
+# Change feed of /api/recipe/sync/, see core.sync. Changes show up after
+# SYNC_SETTLE_SECONDS, cursors older than SYNC_TOMBSTONE_TTL_DAYS expire.
+
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', 500))
+SYNC_SETTLE_SECONDS = float(os.environ.get('SYNC_SETTLE_SECONDS', 5))
+SYNC_TOMBSTONE_TTL_DAYS = int(os.environ.get('SYNC_TOMBSTONE_TTL_DAYS', 30))
+
+# Sub-requests per /api/batch/ request, see core.batch
+
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 10))
 
 
 # Password validation
@@ -115,6 +225,35 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# Hashes run on a bounded executor per process, at most
+# PASSWORD_HASHING_HOST_SLOTS at once on the host, and outdated hashes are
+# upgraded on login, so PASSWORD_HASH_ITERATIONS can be tuned freely
+
+PASSWORD_HASHERS = [
+    'core.hashing.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = int(
+    os.environ.get('PASSWORD_HASH_ITERATIONS', 260000)
+)
+
+AUTHENTICATION_BACKENDS = ['core.hashing.OffloadedHashingBackend']
+
+PASSWORD_HASHING_THREADS = int(os.environ.get('PASSWORD_HASHING_THREADS', 2))
+PASSWORD_HASHING_QUEUE = int(os.environ.get('PASSWORD_HASHING_QUEUE', 8))
+PASSWORD_HASHING_TIMEOUT = float(
+    os.environ.get('PASSWORD_HASHING_TIMEOUT', 10)
+)
+PASSWORD_HASHING_HOST_SLOTS = int(
+    os.environ.get('PASSWORD_HASHING_HOST_SLOTS', os.cpu_count() or 2)
+)
+PASSWORD_HASHING_SLOTS_FILE = os.environ.get(
+    'PASSWORD_HASHING_SLOTS_FILE', '/vol/hashing/slots.lock'
+)
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
@@ -148,8 +287,152 @@ AUTH_USER_MODEL = "core.User"
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_THROTTLE_CLASSES': ['core.throttling.ScopedBucketThrottle'],
+    'DEFAULT_THROTTLE_RATES': {
+        'login': os.environ.get('THROTTLE_RATE_LOGIN', '10/min'),
+        'signup': os.environ.get('THROTTLE_RATE_SIGNUP', '5/min'),
+        'recipe-write': os.environ.get('THROTTLE_RATE_RECIPE_WRITE', '60/min'),
+    },
+    # The proxy appends the client address to X-Forwarded-For, anything
+    # before it was sent by the client and is not trusted.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 1)),
 }
 
+# Throttling
+# Token buckets shared by the workers of a host, in a memory-mapped file
+
+THROTTLE_ENABLED = bool(int(os.environ.get('THROTTLE_ENABLED', 1)))
+THROTTLE_FILE = os.environ.get('THROTTLE_FILE', '/vol/throttle/buckets.db')
+THROTTLE_SLOTS = int(os.environ.get('THROTTLE_SLOTS', 65536))
+
+# Disables throttling, tests enable it where they need it
+TEST_RUNNER = 'core.testing.TestRunner'
+
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST':True,
-}
\ No newline at end of file
+}
+
+# Request instrumentation
+# A JSON log line per request, sampled profiles and Server-Timing headers
+# for staff users
+
+SERVER_TIMING = bool(int(os.environ.get('SERVER_TIMING', 0)))
+REQUEST_PROFILE_SAMPLE_RATE = float(
+    os.environ.get('REQUEST_PROFILE_SAMPLE_RATE', 0)
+)
+REQUEST_PROFILE_THRESHOLD_MS = float(
+    os.environ.get('REQUEST_PROFILE_THRESHOLD_MS', 500)
+)
+REQUEST_PROFILE_DIR = os.environ.get(
+    'REQUEST_PROFILE_DIR', '/vol/profiles'
+)
+
+# Health probes
+# /api/health/live/ and /api/health/ready/ are answered before Django's
+# middleware, readiness results are reused for this many seconds
+
+READINESS_CACHE_SECONDS = float(os.environ.get('READINESS_CACHE_SECONDS', 5))
+
+# Startup warmup
+# app.wsgi imports apps, resolves URLs and builds serializer fields in the
+# uWSGI master so the forked workers share them
+
+WARMUP = bool(int(os.environ.get('WARMUP', 1)))
+
+# ASGI mode (SERVER_MODE=asgi in scripts/run.sh)
+# Requests run on a bounded thread pool per process, GET and HEAD requests
+# to ASGI_READ_ROUTES on a separate one
+
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 8))
+ASGI_READ_THREADS = int(os.environ.get('ASGI_READ_THREADS', 8))
+ASGI_READ_ROUTES = [
+    'health-check',
+    'recipe:recipe-list',
+    'recipe:recipe-detail',
+    'recipe:tag-list',
+    'recipe:ingredient-list',
+    'recipe:sync',
+]
+
+# Admission control
+# Overloaded workers shed ADMISSION_LOW_PRIORITY_PATHS at the 'low' limits
+# and other routes only at the 'normal' ones, see core.admission. Queue
+# time comes from the X-Request-Start header set by the proxy.
+
+ADMISSION_CONTROL = bool(int(os.environ.get('ADMISSION_CONTROL', 1)))
+ADMISSION_EXEMPT_PATHS = ['/api/health-check/', '/api/metrics/']
+ADMISSION_LOW_PRIORITY_PATHS = ['/api/schema/', '/api/docs/', '/api/memory/']
+ADMISSION_LIMITS = {
+    'low': {
+        'in_flight': int(os.environ.get('ADMISSION_LOW_IN_FLIGHT', 4)),
+        'queue_ms': float(os.environ.get('ADMISSION_LOW_QUEUE_MS', 100)),
+    },
+    'normal': {
+        'in_flight': int(os.environ.get('ADMISSION_IN_FLIGHT', 64)),
+        'queue_ms': float(os.environ.get('ADMISSION_QUEUE_MS', 5000)),
+    },
+}
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 5))
+
+# Multi-process metrics
+# Each worker writes to its own files in METRICS_DIR, /api/metrics/ sums them
+# and is only served with METRICS_TOKEN as a bearer token
+
+METRICS_DIR = os.environ.get('METRICS_DIR', '/vol/metrics')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Slow query log
+# Queries over the threshold are explained and appended to SLOW_QUERY_LOG,
+# `manage.py slow_queries` aggregates them per fingerprint
+
+SLOW_QUERY_THRESHOLD_MS = float(
+    os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200)
+)
+SLOW_QUERY_ANALYZE_SAMPLE_RATE = float(
+    os.environ.get('SLOW_QUERY_ANALYZE_SAMPLE_RATE', 0)
+)
+SLOW_QUERY_LOG = os.environ.get(
+    'SLOW_QUERY_LOG', '/vol/logs/slow_queries.jsonl'
+)
+
+# Memory profiling
+# Off by default. When on, tracemalloc runs in every worker, /api/memory/
+# reports allocation growth and MEMORY_SNAPSHOT_SIGNAL writes a report
+
+MEMORY_PROFILING = bool(int(os.environ.get('MEMORY_PROFILING', 0)))
+MEMORY_PROFILE_FRAMES = int(os.environ.get('MEMORY_PROFILE_FRAMES', 5))
+MEMORY_SNAPSHOT_DIR = os.environ.get(
+    'MEMORY_SNAPSHOT_DIR', '/vol/profiles/memory'
+)
+MEMORY_SNAPSHOT_SIGNAL = os.environ.get('MEMORY_SNAPSHOT_SIGNAL', 'SIGUSR2')
+MEMORY_TRACKED_ROUTES = [
+    'recipe:recipe-list',
+    'recipe:recipe-upload-image',
+]
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.instrumentation': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        'core.warmup': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'core.slow_queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
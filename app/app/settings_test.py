@@ -0,0 +1,13 @@
+"""
+Django settings for running the tests
+
+Adds shard_test, a second shard database for the tests that move data
+between shards. Run the tests with --settings=app.settings_test.
+"""
+from app.settings import *  # noqa: F401,F403
+from app.settings import DATABASES
+
+DATABASES['shard_test'] = {
+    **DATABASES['default'],
+    'TEST': {'NAME': 'test_shard'},
+}
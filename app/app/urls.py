@@ -26,6 +26,13 @@ from core import views as core_views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/health-check/', core_views.health_check, name='health-check'),
+    path('api/metrics/', core_views.metrics_view, name='metrics'),
+    path(
+        'api/memory/',
+        core_views.MemoryProfileView.as_view(),
+        name='memory-profile'
+    ),
+    path('api/batch/', core_views.BatchView.as_view(), name='batch'),
     path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
     path(
         'api/docs/',
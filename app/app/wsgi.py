@@ -9,8 +9,18 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 
 import os
 
-from django.core.wsgi import get_wsgi_application
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_wsgi_application()
+from core.handlers import get_route_aware_wsgi_application  # noqa: E402
+
+application = get_route_aware_wsgi_application()
+
+# Imported once the app registry is ready.
+from django.conf import settings  # noqa: E402
+from core.probes import ProbeWSGIApplication  # noqa: E402
+from core.warmup import warmup  # noqa: E402
+
+application = ProbeWSGIApplication(application)
+
+if settings.WARMUP:
+    warmup()
@@ -0,0 +1,114 @@
+"""
+Admission control and load shedding
+
+Under overload it is better to answer some requests with a fast 503
+than to answer all of them slowly. Each worker tracks two signals:
+
+- requests in flight in the process, which matters when one process
+  serves several requests at once, as in the ASGI mode,
+- how long requests queued before reaching a worker, from the
+  X-Request-Start header stamped by nginx, smoothed over recent
+  requests. This is the signal under uWSGI, where a busy worker leaves
+  requests waiting in the listen queue.
+
+Routes under ADMISSION_LOW_PRIORITY_PATHS are shed first, at the 'low'
+limits of ADMISSION_LIMITS. Other routes, such as the recipe API, are
+only shed at the much higher 'normal' limits. ADMISSION_EXEMPT_PATHS,
+like the health check and metrics, are never shed.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+
+from core import metrics
+
+# Weight of the latest request in the smoothed queue time.
+SMOOTHING = 0.3
+
+REQUEST_QUEUE = metrics.Histogram(
+    'request_queue_seconds',
+    'Time requests waited between the proxy and a worker.',
+)
+ADMISSION_REJECTED = metrics.Counter(
+    'admission_rejected',
+    'Requests shed by admission control, by priority and reason.',
+    ['priority', 'reason'],
+)
+
+
+def queue_seconds(meta, now=None):
+    """Return how long a request queued, from X-Request-Start"""
+    value = meta.get('HTTP_X_REQUEST_START', '')
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        started = float(value)
+    except ValueError:
+        return 0.0
+    now = time.time() if now is None else now
+    return max(0.0, now - started)
+
+
+class Load:
+    """Requests in flight and smoothed queue time of this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.queue_ms = 0.0
+
+    def admit(self, priority, queue_ms):
+        """Count a request in if within the limits, else say why not"""
+        limits = settings.ADMISSION_LIMITS[priority]
+        with self.lock:
+            self.queue_ms += SMOOTHING * (queue_ms - self.queue_ms)
+            if self.in_flight >= limits['in_flight']:
+                return 'in_flight'
+            if self.queue_ms > limits['queue_ms']:
+                return 'queue'
+            self.in_flight += 1
+            return None
+
+    def done(self):
+        with self.lock:
+            self.in_flight -= 1
+
+
+load = Load()
+
+
+class AdmissionControlMiddleware:
+    """Shed low-priority requests first when the worker is overloaded"""
+
+    def __init__(self, get_response):
+        if not settings.ADMISSION_CONTROL:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.exempt = tuple(settings.ADMISSION_EXEMPT_PATHS)
+        self.low = tuple(settings.ADMISSION_LOW_PRIORITY_PATHS)
+
+    def __call__(self, request):
+        path = request.path_info
+        if path.startswith(self.exempt):
+            return self.get_response(request)
+        priority = 'low' if path.startswith(self.low) else 'normal'
+
+        queued = queue_seconds(request.META)
+        REQUEST_QUEUE.observe(queued)
+        reason = load.admit(priority, queued * 1000)
+        if reason:
+            ADMISSION_REJECTED.labels(priority, reason).inc()
+            response = JsonResponse(
+                {'detail': 'The server is overloaded, please retry later.'},
+                status=503,
+            )
+            response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER)
+            return response
+
+        try:
+            return self.get_response(request)
+        finally:
+            load.done()
@@ -1,6 +1,31 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from core import memory, slow_queries, sync
+        from core.db import sharding
+        from core.models import Ingredient, Recipe, Tag
+        connection_created.connect(slow_queries.install)
+        post_save.connect(
+            sharding.assign_shard, sender=settings.AUTH_USER_MODEL
+        )
+        # Before the sharded data is deleted.
+        pre_delete.connect(
+            sync.user_deleting, sender=settings.AUTH_USER_MODEL
+        )
+        pre_delete.connect(
+            sharding.delete_sharded_data, sender=settings.AUTH_USER_MODEL
+        )
+        post_delete.connect(
+            sync.user_deleted, sender=settings.AUTH_USER_MODEL
+        )
+        for model in (Recipe, Tag, Ingredient):
+            post_delete.connect(sync.record_deletion, sender=model)
+        memory.setup()
@@ -0,0 +1,184 @@
+"""
+ASGI handler running Django's synchronous stack on bounded thread pools
+
+Django 3.2 and DRF 3.12 views are synchronous, and Django's ASGIHandler
+runs every synchronous middleware and view on one shared thread. This
+handler keeps the client I/O on the event loop instead - reading request
+bodies and sending responses, however slow the client - and runs each
+request's middleware, view and ORM queries on a bounded thread pool.
+GET and HEAD requests to ASGI_READ_ROUTES get a pool of their own, so
+slow writes and uploads can't starve the hot read endpoints.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+
+import django
+from django.conf import settings
+from django.core import signals
+from django.core.exceptions import RequestAborted
+from django.core.handlers import base
+from django.core.handlers.asgi import ASGIHandler
+from django.urls import Resolver404, resolve, set_script_prefix
+
+from core import metrics, probes
+from core.handlers import RouteAwareWSGIHandler
+
+READ_METHODS = ('GET', 'HEAD')
+
+POOL_WAIT = metrics.Histogram(
+    'asgi_pool_wait_seconds',
+    'Time requests waited for a thread, by pool.',
+    ['pool'],
+)
+
+
+class PooledASGIHandler(ASGIHandler):
+    """ASGI handler offloading each request's Django work to a pool"""
+
+    def __init__(self):
+        # Not ASGIHandler.__init__: the middleware runs synchronously,
+        # with the same stacks as under uWSGI.
+        base.BaseHandler.__init__(self)
+        self.stacks = RouteAwareWSGIHandler()
+        self.read_routes = set(settings.ASGI_READ_ROUTES)
+        self.pools = {
+            'read': ThreadPoolExecutor(
+                settings.ASGI_READ_THREADS, thread_name_prefix='asgi-read'
+            ),
+            'default': ThreadPoolExecutor(
+                settings.ASGI_THREADS, thread_name_prefix='asgi'
+            ),
+        }
+
+    async def run(self, pool, func, *args):
+        """Run a blocking call on a pool, recording the wait for a thread"""
+        submitted = time.perf_counter()
+
+        def call():
+            POOL_WAIT.labels(pool).observe(time.perf_counter() - submitted)
+            return func(*args)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pools[pool], call)
+
+    def pool_for(self, request):
+        """Return the name of the pool serving a request"""
+        if request.method not in READ_METHODS:
+            return 'default'
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'default'
+        return 'read' if match.view_name in self.read_routes else 'default'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(
+                f'Django can only handle ASGI/HTTP connections, '
+                f'not {scope["type"]}.'
+            )
+
+        if scope['path'] == probes.LIVENESS_PATH:
+            return await self.send_probe(send, probes.probe(scope['path']))
+        if scope['path'] == probes.READINESS_PATH:
+            answer = await self.run('read', probes.probe, scope['path'])
+            return await self.send_probe(send, answer)
+
+        try:
+            body_file = await self.read_body(receive)
+        except RequestAborted:
+            return
+        request, response = self.create_request(scope, body_file)
+        pool = 'default'
+        if request is not None:
+            pool = self.pool_for(request)
+            response = await self.run(
+                pool, self.handle_request, scope, request
+            )
+        response._handler_class = self.__class__
+        await self.send_response(response, send, pool)
+
+    def handle_request(self, scope, request):
+        """Run the request through the middleware and view, on a pool"""
+        set_script_prefix(self.get_script_prefix(scope))
+        signals.request_started.send(sender=self.__class__, scope=scope)
+        handler = self.stacks.handler_for(request.path_info)
+        return handler.get_response(request)
+
+    async def send_response(self, response, send, pool='default'):
+        """Send a response, reading streamed content on the pool"""
+        headers = [
+            (str(header).encode('ascii'), str(value).encode('latin1'))
+            for header, value in response.items()
+        ]
+        for cookie in response.cookies.values():
+            headers.append((
+                b'Set-Cookie',
+                cookie.output(header='').encode('ascii').strip(),
+            ))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': headers,
+            })
+            if response.streaming:
+                # Streamed lists run their queries while being read.
+                parts = iter(response)
+                part = await self.run(pool, next, parts, None)
+                while part is not None:
+                    for chunk, _ in self.chunk_bytes(part):
+                        await send({
+                            'type': 'http.response.body',
+                            'body': chunk,
+                            'more_body': True,
+                        })
+                    part = await self.run(pool, next, parts, None)
+                await send({'type': 'http.response.body'})
+            else:
+                for chunk, last in self.chunk_bytes(response.content):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': not last,
+                    })
+        finally:
+            # Sends request_finished, which cleans up DB connections of
+            # the thread it runs on.
+            await self.run(pool, response.close)
+
+    async def send_probe(self, send, answer):
+        """Send a probe answer without going through Django"""
+        status, body = answer
+        content = json.dumps(body).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (name.lower().encode(), value.encode())
+                for name, value in probes.HEADERS
+            ] + [(b'content-length', str(len(content)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def lifespan(self, receive, send):
+        """Answer the server's startup and shutdown events"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for pool in self.pools.values():
+                    pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def get_pooled_asgi_application():
+    """Like get_asgi_application(), with the pooled handler"""
+    django.setup(set_prefix=False)
+    return PooledASGIHandler()
@@ -0,0 +1,156 @@
+"""
+Batched API requests
+
+POST /api/batch/ takes a list of sub-requests, e.g.
+
+    [{"method": "GET", "path": "/api/user/me"},
+     {"method": "GET", "path": "/api/recipe/tags/?assigned_only=1"}]
+
+The batch is authenticated once. Sub-requests are resolved and handed
+to their views in-process, one after the other, without another pass
+through the middleware. Views authenticating with
+BatchTokenAuthentication run them as the batch's user. Their responses
+come back in order in one body, each with its own status code:
+
+    [{"status": 200, "body": {...}}, {"status": 200, "body": [...]}]
+
+A batch holds at most BATCH_MAX_REQUESTS sub-requests.
+"""
+from io import BytesIO
+import json
+import logging
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.http import Http404
+from django.urls import resolve, reverse
+from rest_framework import serializers
+from rest_framework.authentication import TokenAuthentication
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+# Headers of the batch that must not be passed on to its sub-requests.
+DROPPED_META = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_IDEMPOTENCY_KEY')
+
+BATCH_SIZE = metrics.Histogram(
+    'batch_size',
+    'Sub-requests per batch request.',
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+
+
+class BatchTokenAuthentication(TokenAuthentication):
+    """Token authentication reusing the batch's for its sub-requests"""
+
+    def authenticate(self, request):
+        # Set on the Django request by build_request().
+        batch_auth = getattr(request, 'batch_auth', None)
+        if batch_auth is not None:
+            return batch_auth
+        return super().authenticate(request)
+
+
+class SubRequestSerializer(serializers.Serializer):
+    """One request of a batch"""
+    method = serializers.ChoiceField(choices=METHODS)
+    path = serializers.CharField(max_length=2048)
+    body = serializers.JSONField(required=False)
+
+    def validate_path(self, value):
+        """Only allow API routes, and no nested batches"""
+        path = value.partition('?')[0]
+        if not path.startswith(tuple(settings.API_MIDDLEWARE_PREFIXES)):
+            raise serializers.ValidationError('Must be an API path.')
+        if path == reverse('batch'):
+            raise serializers.ValidationError('Batches cannot be nested.')
+        return value
+
+
+class SubResponseSerializer(serializers.Serializer):
+    """The response to one request of a batch"""
+    status = serializers.IntegerField()
+    body = serializers.JSONField(allow_null=True)
+
+
+def build_request(request, method, path, body=None):
+    """Build a Django request for a sub-request of a DRF request"""
+    path, _, query = path.partition('?')
+    content = b'' if body is None else json.dumps(body).encode()
+    environ = {
+        key: value for key, value in request._request.META.items()
+        if key not in DROPPED_META
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_LENGTH': str(len(content)),
+        'wsgi.input': BytesIO(content),
+    })
+    if content:
+        environ['CONTENT_TYPE'] = 'application/json'
+    subrequest = WSGIRequest(environ)
+    subrequest.batch_auth = (request.user, request.auth)
+    subrequest.user = request.user
+    return subrequest
+
+
+def dispatch(subrequest):
+    """Run a sub-request through its view and return the response"""
+    try:
+        match = resolve(subrequest.path_info)
+    except Http404:
+        return None
+    subrequest.resolver_match = match
+    response = match.func(subrequest, *match.args, **match.kwargs)
+    if callable(getattr(response, 'render', None)):
+        response = response.render()
+    return response
+
+
+def encode(status_code, response):
+    """Encode the status and body of one response of a batch"""
+    if response is None:
+        body = b'null'
+    else:
+        content = (
+            b''.join(response.streaming_content) if response.streaming
+            else response.content
+        )
+        if not content:
+            body = b'null'
+        elif response.get('Content-Type', '').startswith('application/json'):
+            # Spliced in as rendered, not parsed and dumped again.
+            body = content
+        else:
+            body = json.dumps(content.decode('utf-8', 'replace')).encode()
+    return b'{"status":%d,"body":%s}' % (status_code, body)
+
+
+def run(request, subrequests):
+    """Run the validated sub-requests of a batch, return the JSON body"""
+    BATCH_SIZE.observe(len(subrequests))
+    parts = []
+    for item in subrequests:
+        subrequest = build_request(
+            request, item['method'], item['path'], item.get('body')
+        )
+        try:
+            response = dispatch(subrequest)
+        except Exception:
+            logger.exception('Batched %s %s failed', item['method'],
+                             item['path'])
+            parts.append(encode(500, None))
+            continue
+        if response is None:
+            parts.append(encode(404, None))
+            continue
+        try:
+            parts.append(encode(response.status_code, response))
+        finally:
+            # Closes streamed content and sends request_finished.
+            response.close()
+    return b'[' + b','.join(parts) + b']'
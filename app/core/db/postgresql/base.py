@@ -0,0 +1,137 @@
+"""
+PostgreSQL backend with health-checked persistent connections
+
+Django 3.2 can keep connections open with CONN_MAX_AGE, but it reuses
+them blindly and every worker started together reconnects at the same
+moment. This wrapper adds, through extra DATABASES keys:
+
+- CONN_HEALTH_CHECKS: check that a reused connection still works the
+  first time a request needs it, and reconnect if it doesn't.
+- CONN_MAX_AGE_JITTER: shorten each connection's lifetime by a random
+  fraction of CONN_MAX_AGE, up to this value, to spread reconnects.
+"""
+import os
+import random
+import time
+
+from django.db.backends.postgresql import base
+
+from core import metrics
+
+DB_CONNECTIONS_OPENED = metrics.Counter(
+    'db_connections_opened',
+    'Database connections opened, by alias and worker.',
+    ['alias', 'worker'],
+)
+DB_CONNECTIONS_CLOSED = metrics.Counter(
+    'db_connections_closed',
+    'Database connections closed, by alias, worker and reason.',
+    ['alias', 'worker', 'reason'],
+)
+DB_CONNECTION_REUSE = metrics.Counter(
+    'db_connection_requests',
+    'Requests using the database, by alias, worker and whether the '
+    'connection was new or reused.',
+    ['alias', 'worker', 'connection'],
+)
+DB_CONNECT_DURATION = metrics.Histogram(
+    'db_connect_duration_seconds',
+    'Time spent opening database connections, by alias.',
+    ['alias'],
+)
+DB_CONNECTION_AGE = metrics.Histogram(
+    'db_connection_age_seconds',
+    'Age of database connections when they were closed, by alias.',
+    ['alias'],
+    buckets=[1, 10, 60, 300, 600, 1800, 3600],
+)
+
+
+def worker_id():
+    """Return the uWSGI worker id, or the pid outside of uWSGI"""
+    try:
+        import uwsgi
+    except ImportError:
+        return str(os.getpid())
+    return str(uwsgi.worker_id())
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL connections that are checked before being reused"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.settings_dict.setdefault('CONN_HEALTH_CHECKS', False)
+        self.settings_dict.setdefault('CONN_MAX_AGE_JITTER', 0)
+        self.health_check_done = False
+        self.connected_at = None
+        self.close_reason = None
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        self.connected_at = time.monotonic()
+        DB_CONNECT_DURATION.labels(self.alias).observe(
+            time.perf_counter() - start
+        )
+        DB_CONNECTIONS_OPENED.labels(self.alias, worker_id()).inc()
+
+        max_age = self.settings_dict['CONN_MAX_AGE']
+        jitter = self.settings_dict['CONN_MAX_AGE_JITTER']
+        if self.close_at is not None and max_age and jitter:
+            self.close_at -= max_age * random.uniform(0, jitter)
+        # A new connection doesn't need checking in this request.
+        self.health_check_done = True
+
+    def ensure_connection(self):
+        if self.connection is not None and not self.health_check_done:
+            self.health_check_done = True
+            if (self.settings_dict['CONN_HEALTH_CHECKS']
+                    and not self.in_atomic_block
+                    and not self.is_usable()):
+                self._close_for('health_check')
+            else:
+                DB_CONNECTION_REUSE.labels(
+                    self.alias, worker_id(), 'reused'
+                ).inc()
+        if self.connection is None:
+            DB_CONNECTION_REUSE.labels(self.alias, worker_id(), 'new').inc()
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        """Like Django's, recording why connections are closed"""
+        if self.connection is None:
+            return
+        # Not get_autocommit(): it would run the health check here.
+        if self.autocommit != self.settings_dict['AUTOCOMMIT']:
+            self._close_for('autocommit')
+            return
+        if self.errors_occurred:
+            if self.is_usable():
+                self.errors_occurred = False
+            else:
+                self._close_for('error')
+                return
+        if self.close_at is not None and time.monotonic() >= self.close_at:
+            self._close_for('max_age')
+            return
+        # Called when requests start and finish: check on next use.
+        self.health_check_done = False
+
+    def _close_for(self, reason):
+        self.close_reason = reason
+        try:
+            self.close()
+        finally:
+            self.close_reason = None
+
+    def close(self):
+        if self.connection is not None and not self.closed_in_transaction:
+            DB_CONNECTIONS_CLOSED.labels(
+                self.alias, worker_id(), self.close_reason or 'closed'
+            ).inc()
+            if self.connected_at is not None:
+                DB_CONNECTION_AGE.labels(self.alias).observe(
+                    time.monotonic() - self.connected_at
+                )
+        super().close()
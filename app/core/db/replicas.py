@@ -0,0 +1,196 @@
+"""
+Read-replica routing with read-your-writes stickiness
+
+ReplicaRoutingMiddleware decides, per request, whether reads may go to
+a replica in DATABASE_REPLICAS, and ReplicaRouter applies the decision.
+Writes always go to the primary. Reads stay on the primary when:
+
+- the request is not a safe method,
+- the client wrote within REPLICA_PIN_SECONDS. Pins are kept by
+  Authorization header in REPLICA_PIN_FILE, a table every worker on the
+  host maps, so token clients are pinned without keeping cookies. A
+  cookie is also set, for browsers and requests served by another host,
+- the request already wrote or is inside a transaction on the primary,
+- no replica is reachable. A replica that fails to connect is skipped
+  for REPLICA_RETRY_SECONDS.
+"""
+import contextvars
+import random
+import struct
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from core import metrics
+from core.shared_tables import SharedTable, key_hash
+
+PIN_COOKIE = 'primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+DB_READ_ROUTES = metrics.Counter(
+    'db_read_routes',
+    'Requests by the database their reads went to, and why.',
+    ['alias', 'reason'],
+)
+
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+_down_until = {}
+
+
+class PinTable(SharedTable):
+    """
+    Primary pins of every worker, in a shared memory-mapped file.
+
+    Each slot holds a key hash and the time its pin ends. A key takes
+    over the probed slot ending first when none is its own; an ended pin
+    is as good as a free slot.
+    """
+    slot = struct.Struct('<Qd')
+    file_setting = 'REPLICA_PIN_FILE'
+    slots_setting = 'REPLICA_PIN_SLOTS'
+
+    def _find(self, key_hash):
+        """Return the offset of a key's slot and the end of its pin"""
+        first, first_until = None, None
+        for offset, (slot_hash, until) in self.probe(key_hash):
+            if slot_hash == key_hash:
+                return offset, until
+            if first_until is None or until < first_until:
+                first, first_until = offset, until
+        return first, 0.0
+
+    def pin(self, key, until):
+        """Keep a key's reads on the primary until a time"""
+        hashed = key_hash(key)
+        with self.locked():
+            offset, _ = self._find(hashed)
+            self.write(offset, hashed, until)
+
+    def pinned_until(self, key):
+        """Return the time a key's pin ends, 0 if it has none"""
+        hashed = key_hash(key)
+        with self.locked():
+            return self._find(hashed)[1]
+
+
+_pins = PinTable()
+
+
+def reset():
+    """Map the pin table again, used in tests"""
+    global _pins
+    _pins = PinTable()
+
+
+def read_alias():
+    """Return the replica reads go to in this context, if any"""
+    return _read_alias.get()
+
+
+def replica_available(alias):
+    """Return whether a replica accepts connections, remembering failures"""
+    if _down_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        _down_until[alias] = (
+            time.monotonic() + settings.REPLICA_RETRY_SECONDS
+        )
+        return False
+    _down_until.pop(alias, None)
+    return True
+
+
+def choose_replica():
+    """Return a reachable replica alias, or None"""
+    replicas = list(settings.DATABASE_REPLICAS)
+    random.shuffle(replicas)
+    for alias in replicas:
+        if replica_available(alias):
+            return alias
+    return None
+
+
+class ReplicaRouter:
+    """Send reads to the replica chosen for the request"""
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Read your own writes for the rest of the request.
+        _read_alias.set(None)
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            if instance._state.db not in settings.DATABASE_REPLICAS:
+                return instance._state.db
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Choose where the reads of each request go and pin recent writers"""
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def _pinned(self, request):
+        now = time.time()
+        key = request.META.get('HTTP_AUTHORIZATION')
+        if key and _pins.pinned_until(key) > now:
+            return True
+        try:
+            until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            return False
+        return now < until <= now + settings.REPLICA_PIN_SECONDS
+
+    def _route(self, request):
+        if request.method not in SAFE_METHODS:
+            return None, 'write'
+        if self._pinned(request):
+            return None, 'pinned'
+        alias = choose_replica()
+        return alias, 'replica' if alias else 'unavailable'
+
+    def __call__(self, request):
+        alias, reason = self._route(request)
+        DB_READ_ROUTES.labels(alias or DEFAULT_DB_ALIAS, reason).inc()
+
+        token = _read_alias.set(alias)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            until = time.time() + settings.REPLICA_PIN_SECONDS
+            key = request.META.get('HTTP_AUTHORIZATION')
+            if key:
+                _pins.pin(key, until)
+            response.set_cookie(
+                PIN_COOKIE,
+                f'{until:.3f}',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,272 @@
+"""
+Sharding of recipe data by user
+
+Users and their tokens live on the default database. Recipes, tags,
+ingredients, their join tables and tombstones live on the shard named
+by the owner's `shard` field, so every query of a user's recipe data
+stays on one database. New users are placed with a consistent-hashing ring over
+DATABASE_SHARDS. Users created before sharding have an empty `shard`
+and stay on the default database until they are moved with
+`manage.py rebalance_user`.
+"""
+from bisect import bisect
+from contextlib import ExitStack
+import contextvars
+import functools
+import hashlib
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, migrations, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+SHARDED_MODELS = {
+    'core.recipe',
+    'core.tag',
+    'core.ingredient',
+    'core.recipe_tags',
+    'core.recipe_ingredients',
+    'core.tombstone',
+}
+RING_POINTS_PER_SHARD = 64
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# First key of the advisory locks guarding a user's data during a move.
+MOVE_LOCK = 4040
+
+_shard = contextvars.ContextVar('shard', default=None)
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent-hashing ring mapping keys to shard aliases"""
+
+    def __init__(self, shards, points=RING_POINTS_PER_SHARD):
+        ring = sorted(
+            (_hash(f'{shard}#{point}'), shard)
+            for shard in shards
+            for point in range(points)
+        )
+        self._hashes = [item[0] for item in ring]
+        self._shards = [item[1] for item in ring]
+
+    def shard_for(self, key):
+        """Return the shard owning a key"""
+        index = bisect(self._hashes, _hash(str(key))) % len(self._hashes)
+        return self._shards[index]
+
+
+@functools.lru_cache(maxsize=None)
+def _ring(shards):
+    return HashRing(shards)
+
+
+def ring_shard(user_id):
+    """Return the shard the ring assigns to a user id"""
+    return _ring(tuple(settings.DATABASE_SHARDS)).shard_for(user_id)
+
+
+def shard_for_user(user):
+    """Return the database holding a user's recipe data"""
+    return user.shard or DEFAULT_DB_ALIAS
+
+
+def is_sharded(model):
+    """Return whether a model's rows live on their owner's shard"""
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def _primary(alias):
+    """Map read replicas of the default database to it"""
+    if alias in settings.DATABASE_REPLICAS:
+        return DEFAULT_DB_ALIAS
+    return alias
+
+
+class ShardAlterField(migrations.AlterField):
+    """
+    AlterField applied to the shards other than the default database.
+
+    Sharded rows point at users kept on the default database, so their
+    foreign key constraints are dropped on the other shards only. The
+    default database, the only one of a single-shard deployment, keeps
+    them.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.alias != DEFAULT_DB_ALIAS:
+            super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.alias != DEFAULT_DB_ALIAS:
+            super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+
+
+class ShardRouter:
+    """
+    Send sharded models to the current user's shard.
+
+    Saved instances stay on the database they came from. Otherwise the
+    shard set by ShardedViewMixin is used. Queries for the default
+    database are left to the next router so replicas still apply.
+    """
+
+    def _shard(self, hints):
+        instance = hints.get('instance')
+        if (instance is not None and is_sharded(type(instance))
+                and instance._state.db):
+            return _primary(instance._state.db)
+        return _shard.get()
+
+    def db_for_read(self, model, **hints):
+        if is_sharded(model):
+            shard = self._shard(hints)
+            return None if shard == DEFAULT_DB_ALIAS else shard
+        instance = hints.get('instance')
+        if instance is not None and is_sharded(type(instance)):
+            # Users are only on the default database.
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        if is_sharded(model):
+            shard = self._shard(hints)
+            return None if shard == DEFAULT_DB_ALIAS else shard
+        instance = hints.get('instance')
+        if instance is not None and is_sharded(type(instance)):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        sharded = is_sharded(type(obj1)), is_sharded(type(obj2))
+        if all(sharded):
+            return (_primary(obj1._state.db or DEFAULT_DB_ALIAS)
+                    == _primary(obj2._state.db or DEFAULT_DB_ALIAS))
+        if any(sharded):
+            # Sharded rows point at their owner on the default database.
+            return True
+        return None
+
+
+def placement(user):
+    """Return the stored shard of a user, None while its data is moved"""
+    row = type(user).objects.using(DEFAULT_DB_ALIAS).filter(
+        pk=user.pk
+    ).values_list('shard', 'shard_moving').first()
+    if row is None or row[1]:
+        return None
+    return row[0] or DEFAULT_DB_ALIAS
+
+
+def hold_writes(user, using):
+    """Keep a move of a user's data waiting until the transaction ends"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock_shared(%s, %s)',
+            [MOVE_LOCK, user.pk],
+        )
+
+
+def wait_for_writes(user, using):
+    """Wait for the transactions holding writes of a user to end"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(%s, %s)', [MOVE_LOCK, user.pk]
+        )
+
+
+class ShardMoving(APIException):
+    """The user's data is being moved to another shard"""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Your data is being moved, please retry shortly.'
+    default_code = 'shard_moving'
+    wait = 5
+
+
+class ShardedViewMixin:
+    """
+    Route the sharded models of a view to the request user's shard.
+
+    Writes run in a transaction on the shard that holds off moves of
+    the user's data, see hold_writes(), and are refused with a 503 if
+    the data is being moved or has just been.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user = request.user
+        if not user.is_authenticated:
+            return
+        if user.shard_moving and request.method not in SAFE_METHODS:
+            raise ShardMoving
+        shard = shard_for_user(user)
+        self._shard_token = _shard.set(shard)
+        if request.method in SAFE_METHODS:
+            return
+
+        self._shard_stack = ExitStack()
+        self._shard_stack.enter_context(transaction.atomic(using=shard))
+        hold_writes(user, shard)
+        # The user was loaded before the lock, a move may have started.
+        if placement(user) != shard:
+            raise ShardMoving
+
+    def _end_shard_transaction(self, exc=None):
+        stack = getattr(self, '_shard_stack', None)
+        if stack is None:
+            return
+        self._shard_stack = None
+        if exc is None:
+            stack.close()
+        else:
+            stack.__exit__(type(exc), exc, exc.__traceback__)
+
+    def handle_exception(self, exc):
+        self._end_shard_transaction(exc)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        self._end_shard_transaction()
+        token = getattr(self, '_shard_token', None)
+        if token is not None:
+            _shard.reset(token)
+            self._shard_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def assign_shard(sender, instance, created, raw=False, **kwargs):
+    """Place new users on the shard picked by the ring"""
+    if not created or raw or instance.shard:
+        return
+    if len(settings.DATABASE_SHARDS) < 2:
+        return
+    instance.shard = ring_shard(instance.pk)
+    type(instance).objects.filter(pk=instance.pk).update(
+        shard=instance.shard
+    )
+
+
+def delete_sharded_data(sender, instance, **kwargs):
+    """Delete a user's recipe data kept outside the default database"""
+    from core.models import Ingredient, Recipe, Tag, Tombstone
+
+    shard = shard_for_user(instance)
+    if shard == DEFAULT_DB_ALIAS:
+        return
+    # Deleting the others leaves no tombstones, see sync.user_deleting.
+    for model in (Recipe, Tag, Ingredient, Tombstone):
+        model.objects.using(shard).filter(user=instance).delete()
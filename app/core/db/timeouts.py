@@ -0,0 +1,145 @@
+"""
+Per-view statement timeouts
+
+StatementTimeoutMixin runs a view in a transaction on the database its
+model routes to, and sets `statement_timeout` for that transaction with
+SET LOCAL. The budget is DB_STATEMENT_TIMEOUTS[url name], or
+DB_STATEMENT_TIMEOUT_MS. A statement running past it is cancelled by
+Postgres, so one pathological filter cannot hold a backend for minutes,
+and the client gets a 504.
+"""
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, router
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+
+from core import metrics
+
+QUERY_CANCELED = '57014'
+
+STATEMENT_TIMEOUTS = metrics.Counter(
+    'db_statement_timeouts',
+    'Requests whose statements ran past their timeout, by route.',
+    ['route'],
+)
+
+
+class StatementTimeout(APIException):
+    """A statement of the request ran past its timeout"""
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    default_detail = 'The request took too long, try narrowing it down.'
+    default_code = 'statement_timeout'
+
+
+def is_statement_timeout(exc):
+    """Return whether an exception is Postgres cancelling a statement"""
+    return (
+        isinstance(exc, OperationalError)
+        and getattr(exc.__cause__, 'pgcode', None) == QUERY_CANCELED
+    )
+
+
+def timeout_for(request):
+    """Return the statement timeout in milliseconds for a request"""
+    match = getattr(request, 'resolver_match', None)
+    name = match.view_name if match else None
+    return settings.DB_STATEMENT_TIMEOUTS.get(
+        name, settings.DB_STATEMENT_TIMEOUT_MS
+    )
+
+
+class SetLocalTimeout:
+    """Database execute wrapper setting the timeout before the first query"""
+
+    def __init__(self, timeout_ms):
+        self.timeout_ms = int(timeout_ms)
+        self.pending = True
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.pending:
+            self.pending = False
+            context['cursor'].cursor.execute(
+                'SET LOCAL statement_timeout = %s', [self.timeout_ms]
+            )
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def statement_timeout(using, timeout_ms):
+    """
+    Run a block in a transaction whose statements time out.
+
+    SET LOCAL goes out with the block's first query, so a block
+    rejected before touching the database runs no SQL at all. Inside a
+    transaction already, e.g. a write on its shard, the timeout applies
+    to that one instead of a savepoint costing two more queries.
+    """
+    connection = connections[using]
+    with ExitStack() as stack:
+        if not connection.in_atomic_block:
+            stack.enter_context(transaction.atomic(using=using))
+        if connection.vendor == 'postgresql' and timeout_ms:
+            stack.enter_context(
+                connection.execute_wrapper(SetLocalTimeout(timeout_ms))
+            )
+        yield
+
+
+class StatementTimeoutMixin:
+    """Give each request of a view a statement timeout budget"""
+
+    def _timeout_alias(self, request):
+        queryset = getattr(self, 'queryset', None)
+        if queryset is None:
+            return DEFAULT_DB_ALIAS
+        if request.method in SAFE_METHODS:
+            return router.db_for_read(queryset.model)
+        return router.db_for_write(queryset.model)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # After the mixins choosing the database, e.g. the shard.
+        self.statement_timeout_ms = timeout_for(request)
+        self._timeout_stack = ExitStack()
+        self._timeout_stack.enter_context(statement_timeout(
+            self._timeout_alias(request), self.statement_timeout_ms
+        ))
+
+    def _end_transaction(self, exc=None):
+        stack = getattr(self, '_timeout_stack', None)
+        if stack is None:
+            return
+        self._timeout_stack = None
+        if exc is None:
+            stack.close()
+        else:
+            stack.__exit__(type(exc), exc, exc.__traceback__)
+
+    def read_chunk(self, queryset):
+        """Read later chunks of streamed lists within the budget too"""
+        try:
+            with statement_timeout(queryset.db, self.statement_timeout_ms):
+                return super().read_chunk(queryset)
+        except OperationalError as exc:
+            if is_statement_timeout(exc):
+                STATEMENT_TIMEOUTS.labels(
+                    self.request.resolver_match.view_name
+                ).inc()
+            raise
+
+    def handle_exception(self, exc):
+        self._end_transaction(exc)
+        if is_statement_timeout(exc):
+            STATEMENT_TIMEOUTS.labels(
+                self.request.resolver_match.view_name
+            ).inc()
+            exc = StatementTimeout()
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        self._end_transaction()
+        return super().finalize_response(request, response, *args, **kwargs)
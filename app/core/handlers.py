@@ -0,0 +1,81 @@
+"""
+WSGI handler choosing a middleware stack by route
+"""
+import django
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.handlers.wsgi import WSGIHandler
+from django.utils.module_loading import import_string
+
+
+class StackWSGIHandler(WSGIHandler):
+    """
+    WSGI handler built from an explicit list of middleware.
+
+    Like BaseHandler.load_middleware(), for synchronous stacks, without
+    reading settings.MIDDLEWARE.
+    """
+
+    def __init__(self, middleware):
+        self.middleware = list(middleware)
+        super().__init__()
+
+    def load_middleware(self, is_async=False):
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+
+        handler = convert_exception_to_response(self._get_response)
+        for middleware_path in reversed(self.middleware):
+            middleware = import_string(middleware_path)
+            try:
+                instance = middleware(handler)
+            except MiddlewareNotUsed:
+                continue
+            if instance is None:
+                raise ImproperlyConfigured(
+                    f'Middleware factory {middleware_path} returned None.'
+                )
+            if hasattr(instance, 'process_view'):
+                self._view_middleware.insert(0, instance.process_view)
+            if hasattr(instance, 'process_template_response'):
+                self._template_response_middleware.append(
+                    instance.process_template_response
+                )
+            if hasattr(instance, 'process_exception'):
+                self._exception_middleware.append(instance.process_exception)
+            handler = convert_exception_to_response(instance)
+        self._middleware_chain = handler
+
+
+class RouteAwareWSGIHandler:
+    """
+    Dispatch API requests to a lean middleware stack.
+
+    Token-authenticated API routes under API_MIDDLEWARE_PREFIXES do not
+    need sessions, CSRF, the auth middleware or messages, so they go
+    through API_MIDDLEWARE. Everything else, such as the admin, keeps
+    the full MIDDLEWARE stack.
+    """
+
+    def __init__(self):
+        self.full_handler = StackWSGIHandler(settings.MIDDLEWARE)
+        self.api_handler = StackWSGIHandler(settings.API_MIDDLEWARE)
+        self.api_prefixes = tuple(settings.API_MIDDLEWARE_PREFIXES)
+
+    def handler_for(self, path):
+        """Return the handler whose middleware serves a path"""
+        if path.startswith(self.api_prefixes):
+            return self.api_handler
+        return self.full_handler
+
+    def __call__(self, environ, start_response):
+        handler = self.handler_for(environ.get('PATH_INFO', ''))
+        return handler(environ, start_response)
+
+
+def get_route_aware_wsgi_application():
+    """Like get_wsgi_application(), with route-aware middleware"""
+    django.setup(set_prefix=False)
+    return RouteAwareWSGIHandler()
@@ -0,0 +1,214 @@
+"""
+Password hashing off the request thread
+
+Checking a password runs PBKDF2 for a few hundred milliseconds of CPU.
+OffloadedHashingBackend runs every hash on a small per-process executor
+of PASSWORD_HASHING_THREADS threads, with at most PASSWORD_HASHING_QUEUE
+logins waiting for it. Every worker on the host also shares
+PASSWORD_HASHING_HOST_SLOTS slots, kept as byte locks on
+PASSWORD_HASHING_SLOTS_FILE, and a hash only starts once it holds one.
+Logins finding no slot, or waiting longer than PASSWORD_HASHING_TIMEOUT,
+get a 503 instead of tying up the threads serving recipe traffic. The
+Django admin shows them as a login error.
+
+Hashes made with other parameters, e.g. after PASSWORD_HASH_ITERATIONS
+changed, are replaced on the next successful login.
+"""
+from concurrent import futures
+import fcntl
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model, hashers
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import ValidationError
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from core import metrics
+
+HASHING_QUEUE_WAIT = metrics.Histogram(
+    'password_hashing_queue_seconds',
+    'Time password hashes waited for an executor thread.',
+)
+HASHING_DURATION = metrics.Histogram(
+    'password_hashing_seconds',
+    'Time spent computing password hashes.',
+)
+HASHING_REJECTED = metrics.Counter(
+    'password_hashing_rejected',
+    'Password hashes refused because the executor was busy.',
+    ['reason'],
+)
+PASSWORD_REHASHES = metrics.Counter(
+    'password_rehashes',
+    'Stored password hashes upgraded on login.',
+)
+
+_lock = threading.Lock()
+_pool = (None, None, None, None)
+
+
+class HashingBusy(APIException):
+    """Too many password hashes are queued"""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins in progress, please retry shortly.'
+    default_code = 'hashing_busy'
+    wait = 1
+
+
+class TunablePBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """PBKDF2 with the iteration count from PASSWORD_HASH_ITERATIONS"""
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
+
+
+class HostSlots:
+    """
+    Hashing slots shared by every worker on the host.
+
+    Slot i is a lock on byte i of PASSWORD_HASHING_SLOTS_FILE. Record
+    locks belong to the process, so the slots its threads hold are also
+    tracked here, and the kernel frees them if the process dies.
+    """
+
+    def __init__(self):
+        path = settings.PASSWORD_HASHING_SLOTS_FILE
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self.held = set()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a free slot without waiting, return it or None"""
+        with self.lock:
+            for slot in range(settings.PASSWORD_HASHING_HOST_SLOTS):
+                if slot in self.held:
+                    continue
+                try:
+                    fcntl.lockf(
+                        self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot
+                    )
+                except OSError:
+                    continue
+                self.held.add(slot)
+                return slot
+        return None
+
+    def release(self, slot):
+        """Give a slot back"""
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, slot)
+            self.held.discard(slot)
+
+
+def _executor():
+    """Return this process's executor and slots, made after forking"""
+    global _pool
+    with _lock:
+        pid, executor, slots, host_slots = _pool
+        if pid != os.getpid():
+            threads = settings.PASSWORD_HASHING_THREADS
+            executor = futures.ThreadPoolExecutor(
+                threads, thread_name_prefix='hashing'
+            )
+            slots = threading.BoundedSemaphore(
+                threads + settings.PASSWORD_HASHING_QUEUE
+            )
+            host_slots = HostSlots()
+            _pool = (os.getpid(), executor, slots, host_slots)
+        return executor, slots, host_slots
+
+
+def run(func, *args):
+    """Run a hashing function on the executor and wait for its result"""
+    executor, slots, host_slots = _executor()
+    if not slots.acquire(blocking=False):
+        HASHING_REJECTED.labels('full').inc()
+        raise HashingBusy
+    host_slot = host_slots.acquire()
+    if host_slot is None:
+        slots.release()
+        HASHING_REJECTED.labels('host').inc()
+        raise HashingBusy
+    submitted = time.perf_counter()
+
+    def release():
+        host_slots.release(host_slot)
+        slots.release()
+
+    def call():
+        started = time.perf_counter()
+        HASHING_QUEUE_WAIT.observe(started - submitted)
+        try:
+            return func(*args)
+        finally:
+            HASHING_DURATION.observe(time.perf_counter() - started)
+            # Before the result is set, so the caller can hash again.
+            release()
+
+    def done(future):
+        if future.cancelled():
+            release()
+
+    future = executor.submit(call)
+    # The slots are held until the hash is done, even if we stop waiting,
+    # and given back here if it never started.
+    future.add_done_callback(done)
+    try:
+        return future.result(settings.PASSWORD_HASHING_TIMEOUT)
+    except futures.TimeoutError:
+        future.cancel()
+        HASHING_REJECTED.labels('timeout').inc()
+        raise HashingBusy
+
+
+def check_password(user, raw_password):
+    """Check a user's password, upgrading its hash if outdated"""
+    outdated = []
+    correct = run(
+        hashers.check_password, raw_password, user.password, outdated.append
+    )
+    if outdated:
+        try:
+            user.password = run(hashers.make_password, raw_password)
+        except HashingBusy:
+            # Upgraded on a later login instead.
+            return correct
+        user.save(update_fields=['password'])
+        PASSWORD_REHASHES.inc()
+    return correct
+
+
+class OffloadedHashingBackend(ModelBackend):
+    """ModelBackend checking passwords on the hashing executor"""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        try:
+            return self._authenticate(username, password, **kwargs)
+        except HashingBusy as exc:
+            if isinstance(request, Request):
+                raise
+            # Forms such as the admin login show it as a form error.
+            raise ValidationError(str(exc.detail), code=exc.default_code)
+
+    def _authenticate(self, username, password, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash anyway, so unknown emails answer as slowly as known ones.
+            run(hashers.make_password, password)
+            return None
+        if check_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,232 @@
+"""
+Idempotency keys for retried writes
+
+A client retrying a write sends the same Idempotency-Key header. The
+first request claims the key by inserting an IdempotencyKey row before
+the view runs, and stores its rendered, compressed response on the row
+once done. Retries get that response replayed. A retry arriving while
+the first request is still in flight polls the row until the response
+is stored, for up to IDEMPOTENCY_WAIT_SECONDS, instead of running the
+write again. A claim without a response is a lease of
+IDEMPOTENCY_LEASE_SECONDS: past it the first request is taken for dead
+and a retry claims the key, and the first request can no longer store
+its response. Stored keys expire after IDEMPOTENCY_TTL_SECONDS, see
+`manage.py purge_idempotency_keys`.
+
+Requests are told apart by their method, path and parsed data, with
+uploaded files hashed by content, so large uploads are never read into
+memory whole.
+
+Server errors and refused requests (409, 429, 5xx) are not stored, the
+key is released so a retry runs the write.
+"""
+from datetime import timedelta
+import hashlib
+import json
+import time
+import zlib
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from core import metrics
+from core.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+POLL_SECONDS = 0.05
+UNSTORED_STATUSES = (409, 429)
+
+IDEMPOTENT_REQUESTS = metrics.Counter(
+    'idempotent_requests',
+    'Writes sent with an Idempotency-Key, by outcome.',
+    ['outcome'],
+)
+
+
+class IdempotencyKeyInUse(APIException):
+    """The first request with this key is still running"""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is in progress.'
+    default_code = 'idempotency_key_in_use'
+    wait = 1
+
+
+class IdempotencyKeyReused(APIException):
+    """The key was first sent with a different request"""
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was used for another request.'
+    default_code = 'idempotency_key_reused'
+
+
+class Replay(Exception):
+    """Answer the request with the response stored for its key"""
+
+    def __init__(self, record):
+        super().__init__(record.key)
+        self.record = record
+
+
+def _encode(value):
+    """JSON encoder hook standing uploaded files in by their digest"""
+    if not isinstance(value, File):
+        return str(value)
+    digest = hashlib.sha256()
+    for chunk in value.chunks():
+        digest.update(chunk)
+    value.seek(0)
+    return f'{value.name}:{digest.hexdigest()}'
+
+
+def fingerprint(request):
+    """Hash the method, path and parsed data of a DRF request"""
+    data = request.data
+    if hasattr(data, 'lists'):
+        # Form data, keeping repeated fields.
+        data = dict(data.lists())
+    digest = hashlib.sha256(
+        f'{request.method} {request.get_full_path()}\n'.encode()
+    )
+    digest.update(
+        json.dumps(data, sort_keys=True, default=_encode).encode()
+    )
+    return digest.hexdigest()
+
+
+def claim(user, key, request_hash):
+    """
+    Claim a key for this request.
+
+    Return (record, True) if claimed, otherwise (record holding the
+    key, False), the record being None if the key was just released.
+    """
+    now = timezone.now()
+    IdempotencyKey.objects.filter(
+        user=user, key=key, expires_at__lte=now
+    ).delete()
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=user,
+                key=key,
+                fingerprint=request_hash,
+                expires_at=now + timedelta(
+                    seconds=settings.IDEMPOTENCY_LEASE_SECONDS
+                ),
+            )
+    except IntegrityError:
+        return IdempotencyKey.objects.filter(user=user, key=key).first(), False
+    return record, True
+
+
+def wait_for(record):
+    """Wait for the response of an in-flight request, None if released"""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while record is not None and record.status_code is None:
+        if record.expires_at <= timezone.now():
+            # The lease ran out, the key can be claimed again.
+            return None
+        if time.monotonic() >= deadline:
+            raise IdempotencyKeyInUse
+        time.sleep(POLL_SECONDS)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+    return record
+
+
+def store(record, response):
+    """Save the rendered response of the request that claimed a key"""
+    # Nothing is stored if the claim was taken over meanwhile.
+    IdempotencyKey.objects.filter(
+        pk=record.pk, status_code__isnull=True
+    ).update(
+        status_code=response.status_code,
+        content_type=response.get('Content-Type', ''),
+        body=zlib.compress(response.content),
+        expires_at=timezone.now() + timedelta(
+            seconds=settings.IDEMPOTENCY_TTL_SECONDS
+        ),
+    )
+
+
+def release(record):
+    """Give up a claimed key so a retry runs the request"""
+    IdempotencyKey.objects.filter(
+        pk=record.pk, status_code__isnull=True
+    ).delete()
+
+
+def replay(record):
+    """Build the response stored for a key"""
+    response = HttpResponse(
+        zlib.decompress(record.body),
+        status=record.status_code,
+        content_type=record.content_type or None,
+    )
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+class IdempotentViewMixin:
+    """Honour Idempotency-Key headers on a view's write actions"""
+    idempotent_actions = ('create', 'update', 'partial_update')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._idempotency_claim = None
+        key = request.headers.get(HEADER)
+        if not key or self.action not in self.idempotent_actions:
+            return
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            raise ValidationError({HEADER: 'Too long.'})
+
+        request_hash = fingerprint(request)
+        while True:
+            record, claimed = claim(request.user, key, request_hash)
+            if claimed:
+                IDEMPOTENT_REQUESTS.labels('new').inc()
+                self._idempotency_claim = record
+                return
+            if record is None:
+                continue
+            if record.fingerprint != request_hash:
+                IDEMPOTENT_REQUESTS.labels('reused').inc()
+                raise IdempotencyKeyReused
+            record = wait_for(record)
+            if record is not None:
+                IDEMPOTENT_REQUESTS.labels('replayed').inc()
+                raise Replay(record)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Replay):
+            return replay(exc.record)
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            self._finish(None)
+            raise
+
+    def _finish(self, response):
+        record = getattr(self, '_idempotency_claim', None)
+        if record is None:
+            return
+        self._idempotency_claim = None
+        if (response is None or response.status_code >= 500
+                or response.status_code in UNSTORED_STATUSES):
+            release(record)
+        elif hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(
+                lambda rendered: store(record, rendered)
+            )
+        else:
+            store(record, response)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        self._finish(response)
+        return response
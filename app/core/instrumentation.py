@@ -0,0 +1,187 @@
+"""
+Per-request performance instrumentation
+"""
+from contextlib import ExitStack, contextmanager
+import cProfile
+import json
+import logging
+import os
+import random
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from core import metrics as app_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetrics:
+    """Phase timings and SQL statistics collected for one request"""
+
+    def __init__(self):
+        self.timings = {}
+        self.queries = 0
+        self.sql_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper counting and timing every query"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - start
+
+    def add(self, name, duration):
+        """Add a duration in seconds to a named phase"""
+        self.timings[name] = self.timings.get(name, 0.0) + duration
+
+    def server_timing(self):
+        """Return the value of the Server-Timing header"""
+        metrics = [
+            f'{name};dur={duration * 1000:.2f}'
+            for name, duration in self.timings.items()
+        ]
+        metrics.append(
+            f'db;dur={self.sql_time * 1000:.2f};desc="{self.queries} queries"'
+        )
+        return ', '.join(metrics)
+
+
+def get_metrics(request):
+    """Return the metrics of a Django or DRF request, if instrumented"""
+    request = getattr(request, '_request', request)
+    return getattr(request, 'metrics', None)
+
+
+@contextmanager
+def phase(request, name):
+    """Time the wrapped block as a phase of the request"""
+    metrics = get_metrics(request)
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - start)
+
+
+class InstrumentedViewMixin:
+    """
+    Record DRF phases of a view in the request metrics.
+
+    `auth` covers authentication, `view` the handler including its SQL,
+    and `python` the handler time not spent waiting on the database.
+    """
+
+    def perform_authentication(self, request):
+        with phase(request, 'auth'):
+            super().perform_authentication(request)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        metrics = get_metrics(request)
+        if metrics is not None:
+            self._handler_start = (time.perf_counter(), metrics.sql_time)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        metrics = get_metrics(request)
+        handler_start = getattr(self, '_handler_start', None)
+        if metrics is not None and handler_start is not None:
+            start, sql_time = handler_start
+            duration = time.perf_counter() - start
+            metrics.add('view', duration)
+            metrics.add(
+                'python', duration - (metrics.sql_time - sql_time)
+            )
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class RequestTimingMiddleware:
+    """
+    Time each request and expose the result.
+
+    Timings are logged as one JSON line. With SERVER_TIMING set they
+    are also sent to staff users as a Server-Timing header. A sampled
+    fraction of requests is run under cProfile and the profile is saved
+    when the request exceeds a threshold.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def process_template_response(self, request, response):
+        """Time rendering of DRF and template responses"""
+        metrics = get_metrics(request)
+        if metrics is not None:
+            start = time.perf_counter()
+            response.add_post_render_callback(
+                lambda r: metrics.add('render', time.perf_counter() - start)
+            )
+        return response
+
+    def _save_profile(self, profiler, request, duration):
+        """Write a profile to disk if the request was slow enough"""
+        if duration * 1000 < settings.REQUEST_PROFILE_THRESHOLD_MS:
+            return
+        os.makedirs(settings.REQUEST_PROFILE_DIR, exist_ok=True)
+        slug = request.path.strip('/').replace('/', '_') or 'root'
+        filename = (
+            f'{int(time.time() * 1000)}-{os.getpid()}-'
+            f'{request.method}-{slug}.prof'
+        )
+        profiler.dump_stats(os.path.join(settings.REQUEST_PROFILE_DIR,
+                                         filename))
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        request.metrics = metrics
+
+        profiler = None
+        rate = settings.REQUEST_PROFILE_SAMPLE_RATE
+        if rate and random.random() < rate:
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+        duration = time.perf_counter() - start
+        metrics.add('total', duration)
+
+        if profiler is not None:
+            self._save_profile(profiler, request, duration)
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unmatched'
+        app_metrics.REQUEST_LATENCY.labels(route, request.method).observe(
+            duration
+        )
+        app_metrics.DB_QUERIES.labels(route).inc(metrics.queries)
+
+        user = getattr(request, 'user', None)
+        if settings.SERVER_TIMING and getattr(user, 'is_staff', False):
+            response['Server-Timing'] = metrics.server_timing()
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'sql_ms': round(metrics.sql_time * 1000, 2),
+            **{
+                f'{name}_ms': round(value * 1000, 2)
+                for name, value in metrics.timings.items()
+            },
+        }))
+        return response
@@ -0,0 +1,423 @@
+"""
+Django command to benchmark the API endpoints in-process
+"""
+from contextlib import ExitStack
+from decimal import Decimal
+from io import BytesIO
+import itertools
+import json
+import math
+import tempfile
+import time
+import tracemalloc
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_databases,
+    teardown_databases,
+)
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from core.db.sharding import shard_for_user
+from core.testing import url_names
+
+BENCH_PASSWORD = 'benchpass123'
+
+
+def _image_file():
+    """Return a small in-memory JPEG for the image upload endpoint"""
+    buffer = BytesIO()
+    Image.new('RGB', (10, 10)).save(buffer, format='JPEG')
+    buffer.seek(0)
+    buffer.name = 'bench.jpg'
+    return buffer
+
+
+# Each entry drives one URL name with one HTTP method. `url` receives the
+# seeded objects of the benchmark user, `data` also receives the iteration
+# number so create endpoints can use unique values.
+ENDPOINTS = [
+    {
+        'name': 'recipe:api-root',
+        'method': 'get',
+        'url': lambda ctx: reverse('recipe:api-root'),
+    },
+    {
+        'name': 'recipe:recipe-list',
+        'method': 'get',
+        'url': lambda ctx: reverse('recipe:recipe-list'),
+    },
+    {
+        'name': 'recipe:recipe-list',
+        'method': 'post',
+        'url': lambda ctx: reverse('recipe:recipe-list'),
+        'data': lambda ctx, i: {
+            'title': f'Bench recipe {i}',
+            'time_minutes': 10,
+            'price': '4.50',
+            'tags': [{'name': 'bench'}],
+            'ingredients': [{'name': 'salt'}],
+        },
+    },
+    {
+        'name': 'recipe:recipe-detail',
+        'method': 'get',
+        'url': lambda ctx: reverse(
+            'recipe:recipe-detail', args=[ctx['recipe'].id]
+        ),
+    },
+    {
+        'name': 'recipe:recipe-detail',
+        'method': 'patch',
+        'url': lambda ctx: reverse(
+            'recipe:recipe-detail', args=[ctx['recipe'].id]
+        ),
+        'data': lambda ctx, i: {'title': f'Bench title {i}'},
+    },
+    {
+        'name': 'recipe:recipe-upload-image',
+        'method': 'post',
+        'format': 'multipart',
+        'url': lambda ctx: reverse(
+            'recipe:recipe-upload-image', args=[ctx['recipe'].id]
+        ),
+        'data': lambda ctx, i: {'image': _image_file()},
+    },
+    {
+        'name': 'recipe:tag-list',
+        'method': 'get',
+        'url': lambda ctx: reverse('recipe:tag-list'),
+    },
+    {
+        'name': 'recipe:tag-detail',
+        'method': 'patch',
+        'url': lambda ctx: reverse('recipe:tag-detail', args=[ctx['tag'].id]),
+        'data': lambda ctx, i: {'name': f'Tag {i}'},
+    },
+    {
+        'name': 'recipe:ingredient-list',
+        'method': 'get',
+        'url': lambda ctx: reverse('recipe:ingredient-list'),
+    },
+    {
+        'name': 'recipe:ingredient-detail',
+        'method': 'patch',
+        'url': lambda ctx: reverse(
+            'recipe:ingredient-detail', args=[ctx['ingredient'].id]
+        ),
+        'data': lambda ctx, i: {'name': f'Ingredient {i}'},
+    },
+    {
+        'name': 'recipe:sync',
+        'method': 'get',
+        'url': lambda ctx: reverse('recipe:sync'),
+    },
+    {
+        'name': 'user:create',
+        'method': 'post',
+        'anonymous': True,
+        'url': lambda ctx: reverse('user:create'),
+        'data': lambda ctx, i: {
+            'email': f'bench-new-{i}@example.com',
+            'password': BENCH_PASSWORD,
+            'name': 'Bench',
+        },
+    },
+    {
+        'name': 'user:token',
+        'method': 'post',
+        'anonymous': True,
+        'url': lambda ctx: reverse('user:token'),
+        'data': lambda ctx, i: {
+            'email': ctx['user'].email,
+            'password': BENCH_PASSWORD,
+        },
+    },
+    {
+        'name': 'user:me',
+        'method': 'get',
+        'url': lambda ctx: reverse('user:me'),
+    },
+    {
+        'name': 'user:me',
+        'method': 'patch',
+        'url': lambda ctx: reverse('user:me'),
+        'data': lambda ctx, i: {'name': f'Bench user {i}'},
+    },
+]
+
+BENCHMARKED_URLCONFS = ['recipe.urls', 'user.urls']
+
+
+def _percentile(values, percent):
+    """Return the nearest-rank percentile of a list of values"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def seed(users, recipes, tags, ingredients):
+    """
+    Create benchmark data and return the objects the endpoints need.
+
+    Each user's data is written to the shard the user was placed on.
+    """
+    User = get_user_model()
+    created_users = [
+        User.objects.create_user(
+            email=f'bench-{i}@example.com',
+            password=BENCH_PASSWORD,
+            name=f'Bench {i}',
+        )
+        for i in range(users)
+    ]
+    for user in created_users:
+        shard = shard_for_user(user)
+        Tag.objects.using(shard).bulk_create(
+            Tag(user=user, name=f'Tag {i}') for i in range(tags)
+        )
+        Ingredient.objects.using(shard).bulk_create(
+            Ingredient(user=user, name=f'Ingredient {i}')
+            for i in range(ingredients)
+        )
+        Recipe.objects.using(shard).bulk_create(
+            Recipe(
+                user=user,
+                title=f'Recipe {i}',
+                time_minutes=10 + i % 50,
+                price=Decimal('5.25'),
+                description='Benchmark recipe',
+            )
+            for i in range(recipes)
+        )
+        # Not every backend returns primary keys from bulk_create,
+        # so read them back before linking the join tables.
+        recipe_ids = Recipe.objects.using(shard).filter(
+            user=user
+        ).values_list('id', flat=True)
+        tag_ids = list(
+            Tag.objects.using(shard).filter(user=user).values_list(
+                'id', flat=True
+            )
+        )
+        ingredient_ids = list(
+            Ingredient.objects.using(shard).filter(user=user).values_list(
+                'id', flat=True
+            )
+        )
+        recipe_tags, recipe_ingredients = [], []
+        for i, recipe_id in enumerate(recipe_ids):
+            if tag_ids:
+                recipe_tags.append(Recipe.tags.through(
+                    recipe_id=recipe_id,
+                    tag_id=tag_ids[i % len(tag_ids)],
+                ))
+            if ingredient_ids:
+                recipe_ingredients.append(Recipe.ingredients.through(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_ids[i % len(ingredient_ids)],
+                ))
+        Recipe.tags.through.objects.using(shard).bulk_create(recipe_tags)
+        Recipe.ingredients.through.objects.using(shard).bulk_create(
+            recipe_ingredients
+        )
+
+    user = created_users[0]
+    shard = shard_for_user(user)
+    return {
+        'user': user,
+        'recipe': Recipe.objects.using(shard).filter(user=user).first() or
+        Recipe.objects.using(shard).create(
+            user=user,
+            title='Bench recipe',
+            time_minutes=10,
+            price=Decimal('5.25'),
+        ),
+        'tag': Tag.objects.using(shard).filter(user=user).first() or
+        Tag.objects.using(shard).create(user=user, name='Bench tag'),
+        'ingredient':
+        Ingredient.objects.using(shard).filter(user=user).first() or
+        Ingredient.objects.using(shard).create(
+            user=user, name='Bench ingredient'
+        ),
+    }
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the recipe and user APIs"""
+    help = 'Seed data and report per-endpoint latency, SQL and memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5)
+        parser.add_argument('--recipes', type=int, default=100)
+        parser.add_argument('--tags', type=int, default=20)
+        parser.add_argument('--ingredients', type=int, default=20)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument(
+            '--output',
+            help='Write the JSON report to this file instead of stdout.',
+        )
+        parser.add_argument(
+            '--in-place',
+            action='store_true',
+            help=(
+                'Seed and benchmark the configured database instead of '
+                'a throwaway test database.'
+            ),
+        )
+
+    def _request(self, client, endpoint, ctx, i):
+        """Issue one request for an endpoint"""
+        kwargs = {}
+        if 'data' in endpoint:
+            kwargs['data'] = endpoint['data'](ctx, i)
+            kwargs['format'] = endpoint.get('format', 'json')
+        return getattr(client, endpoint['method'])(
+            endpoint['url'](ctx), **kwargs
+        )
+
+    def _measure(self, clients, endpoint, ctx, iterations, counter):
+        """Run an endpoint repeatedly and return its statistics"""
+        client = clients['anonymous' if endpoint.get('anonymous') else 'auth']
+        # Warm up caches and lazily built objects before measuring.
+        self._request(client, endpoint, ctx, next(counter))
+
+        latencies, queries, sql_times = [], [], []
+        for _ in range(iterations):
+            # Queries of every shard and replica, not only the default.
+            with ExitStack() as stack:
+                captured = [
+                    stack.enter_context(
+                        CaptureQueriesContext(connections[alias])
+                    )
+                    for alias in {
+                        *settings.DATABASE_SHARDS, *settings.DATABASE_REPLICAS
+                    }
+                ]
+                start = time.perf_counter()
+                res = self._request(client, endpoint, ctx, next(counter))
+                latencies.append(time.perf_counter() - start)
+            if res.status_code >= 400:
+                raise CommandError(
+                    f'{endpoint["method"].upper()} {endpoint["name"]} '
+                    f'returned {res.status_code}'
+                )
+            captured = [
+                query for context in captured
+                for query in context.captured_queries
+            ]
+            queries.append(len(captured))
+            sql_times.append(sum(float(q['time']) for q in captured))
+
+        # Memory is measured separately so tracing does not skew latency.
+        tracemalloc.start()
+        try:
+            self._request(client, endpoint, ctx, next(counter))
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'name': endpoint['name'],
+            'method': endpoint['method'].upper(),
+            'iterations': iterations,
+            'p50_ms': _percentile(latencies, 50) * 1000,
+            'p95_ms': _percentile(latencies, 95) * 1000,
+            'p99_ms': _percentile(latencies, 99) * 1000,
+            'queries': max(queries),
+            'sql_ms': sum(sql_times) / len(sql_times) * 1000,
+            'peak_memory_bytes': peak_memory,
+        }
+
+    def _run(self, options):
+        """Seed the database and benchmark every endpoint"""
+        if options['users'] < 1 or options['iterations'] < 1:
+            raise CommandError('--users and --iterations must be positive.')
+
+        ctx = seed(
+            options['users'],
+            options['recipes'],
+            options['tags'],
+            options['ingredients'],
+        )
+        token, _ = Token.objects.get_or_create(user=ctx['user'])
+        auth_client = APIClient()
+        auth_client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        clients = {'auth': auth_client, 'anonymous': APIClient()}
+
+        counter = itertools.count()
+        results = {}
+        for endpoint in ENDPOINTS:
+            key = f'{endpoint["method"].upper()} {endpoint["name"]}'
+            results[key] = self._measure(
+                clients, endpoint, ctx, options['iterations'], counter
+            )
+        return results
+
+    def handle(self, *args, **options):
+        """Entrypoint for the command"""
+        expected = set()
+        for urlconf in BENCHMARKED_URLCONFS:
+            expected |= url_names(urlconf)
+        missing = expected - {endpoint['name'] for endpoint in ENDPOINTS}
+        if missing:
+            raise CommandError(
+                f'No benchmark defined for: {", ".join(sorted(missing))}'
+            )
+
+        old_config = None
+        if not options['in_place']:
+            # Every database the bench touches, with replicas mirroring
+            # the default one as in the test suite.
+            old_config = setup_databases(
+                verbosity=0, interactive=False, aliases=set(connections),
+            )
+
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(
+                        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                        MEDIA_ROOT=media_root,
+                        # One client sends every request, far beyond
+                        # the rates meant for real users.
+                        THROTTLE_ENABLED=False,
+                    ):
+                results = self._run(options)
+        finally:
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+
+        report = json.dumps(
+            {
+                'dataset': {
+                    key: options[key]
+                    for key in ['users', 'recipes', 'tags', 'ingredients']
+                },
+                'endpoints': results,
+            },
+            indent=2,
+            sort_keys=True,
+        )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report + '\n')
+            self.stdout.write(
+                self.style.SUCCESS(f'Report written to {options["output"]}')
+            )
+        else:
+            self.stdout.write(report)
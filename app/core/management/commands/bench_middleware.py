@@ -0,0 +1,62 @@
+"""
+Django command to measure per-request middleware overhead
+"""
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from core.handlers import StackWSGIHandler
+
+
+class Command(BaseCommand):
+    """Compare the full and the API middleware stacks on one route"""
+    help = 'Report mean per-request time through each middleware stack.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/health-check/')
+        parser.add_argument('--iterations', type=int, default=2000)
+
+    def _measure(self, handler, path, iterations):
+        """Return the mean request time through a handler in microseconds"""
+        factory = RequestFactory()
+
+        def start_response(status, headers):
+            pass
+
+        def call():
+            environ = factory.get(path).environ
+            response = handler(environ, start_response)
+            b''.join(response)
+            response.close()
+
+        for _ in range(min(iterations, 100)):
+            call()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            call()
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    def handle(self, *args, **options):
+        """Entrypoint for the command"""
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        ):
+            full = self._measure(
+                StackWSGIHandler(settings.MIDDLEWARE),
+                options['path'], options['iterations'],
+            )
+            api = self._measure(
+                StackWSGIHandler(settings.API_MIDDLEWARE),
+                options['path'], options['iterations'],
+            )
+        self.stdout.write(json.dumps({
+            'path': options['path'],
+            'iterations': options['iterations'],
+            'full_stack_us': round(full, 1),
+            'api_stack_us': round(api, 1),
+            'saved_us': round(full - api, 1),
+        }, indent=2))
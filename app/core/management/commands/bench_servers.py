@@ -0,0 +1,236 @@
+"""
+Django command to compare app server throughput under concurrent clients
+"""
+from decimal import Decimal
+import http.client
+import json
+import os
+import signal
+import subprocess
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_framework.authtoken.models import Token
+
+from core.management.commands.bench import _percentile
+from core.db.sharding import shard_for_user
+from core.models import Recipe
+from core.probes import LIVENESS_PATH
+
+BENCH_EMAIL = 'bench-servers@example.com'
+
+# Started by --spawn, mirroring scripts/run.sh but speaking HTTP.
+SERVERS = {
+    'uwsgi': [
+        'uwsgi', '--http', '127.0.0.1:{port}', '--workers', '4',
+        '--master', '--enable-threads', '--py-call-osafterfork',
+        '--module', 'app.wsgi', '--http-keepalive', '--disable-logging',
+        '--die-on-term',
+    ],
+    'asgi': [
+        'uvicorn', 'app.asgi:application', '--port', '{port}',
+        '--workers', '{asgi_workers}', '--no-access-log',
+    ],
+}
+
+
+def bench_token(recipes):
+    """Return the token of the benchmark user, creating its data once"""
+    user, created = get_user_model().objects.get_or_create(
+        email=BENCH_EMAIL, defaults={'name': 'Bench'},
+    )
+    if created:
+        # Placed on a shard by the ring, like any new user.
+        Recipe.objects.using(shard_for_user(user)).bulk_create(
+            Recipe(
+                user=user,
+                title=f'Recipe {i}',
+                time_minutes=10,
+                price=Decimal('5.25'),
+            )
+            for i in range(recipes)
+        )
+    return Token.objects.get_or_create(user=user)[0].key
+
+
+def _get(host, port, path, headers=None, timeout=30):
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        conn.request('GET', path, headers=headers or {})
+        res = conn.getresponse()
+        res.read()
+        return res.status
+    finally:
+        conn.close()
+
+
+def wait_until_live(url, timeout=60):
+    """Wait for a server to answer its liveness probe"""
+    parts = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if _get(parts.hostname, parts.port, LIVENESS_PATH, timeout=1) \
+                    == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise CommandError(f'{url} did not start within {timeout}s')
+
+
+def stop(process, timeout=10):
+    """Stop a spawned server and its workers"""
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        # Some servers' supervisors hang on shutdown; take the whole
+        # process group down.
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def run_clients(url, path, headers, concurrency, duration):
+    """Hammer a URL from concurrent keep-alive clients for a while"""
+    parts = urlsplit(url)
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+
+    def client():
+        conn = http.client.HTTPConnection(
+            parts.hostname, parts.port, timeout=30
+        )
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers)
+                res = conn.getresponse()
+                res.read()
+                ok = res.status == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(1)
+        conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+    }
+    if latencies:
+        for percent in (50, 95, 99):
+            result[f'p{percent}_ms'] = round(
+                _percentile(latencies, percent) * 1000, 2
+            )
+    return result
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the app servers"""
+    help = (
+        'Compare throughput and latency of app servers under concurrent '
+        'clients, e.g. uWSGI with 4 workers against the ASGI mode.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', default=[],
+            help='NAME=URL of a running server, can be repeated.',
+        )
+        parser.add_argument(
+            '--spawn', action='store_true',
+            help='Start uWSGI and uvicorn locally and benchmark both.',
+        )
+        parser.add_argument('--port', type=int, default=9100)
+        parser.add_argument('--asgi-workers', type=int, default=2)
+        parser.add_argument('--path', default='/api/recipe/recipes/')
+        parser.add_argument(
+            '--concurrency', default='1,16,64',
+            help='Comma separated numbers of concurrent clients.',
+        )
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--recipes', type=int, default=50)
+        parser.add_argument(
+            '--token', default=None,
+            help='API token to use. Defaults to a benchmark user.',
+        )
+
+    def _spawn(self, options):
+        env = dict(
+            os.environ,
+            ALLOWED_HOSTS='127.0.0.1',
+            REQUEST_LOG_LEVEL='WARNING',
+        )
+        processes, targets = [], []
+        for offset, (name, command) in enumerate(SERVERS.items()):
+            port = options['port'] + offset
+            args = [
+                arg.format(port=port, asgi_workers=options['asgi_workers'])
+                for arg in command
+            ]
+            processes.append(subprocess.Popen(
+                args, cwd=settings.BASE_DIR, env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            ))
+            targets.append((name, f'http://127.0.0.1:{port}'))
+        return processes, targets
+
+    def handle(self, *args, **options):
+        """Entrypoint for the command"""
+        targets = []
+        for target in options['target']:
+            name, _, url = target.partition('=')
+            if not url:
+                raise CommandError(f'Expected NAME=URL, got {target}')
+            targets.append((name, url))
+
+        processes = []
+        if options['spawn']:
+            processes, spawned = self._spawn(options)
+            targets.extend(spawned)
+        if not targets:
+            raise CommandError('Give at least one --target or --spawn')
+
+        token = options['token'] or bench_token(options['recipes'])
+        headers = {'Authorization': f'Token {token}'}
+        levels = [int(value) for value in options['concurrency'].split(',')]
+        report = {}
+        try:
+            for name, url in targets:
+                wait_until_live(url)
+                # Warm up every worker before measuring.
+                run_clients(url, options['path'], headers, max(levels), 1)
+                report[name] = [
+                    run_clients(url, options['path'], headers, level,
+                                options['duration'])
+                    for level in levels
+                ]
+        finally:
+            for process in processes:
+                stop(process)
+
+        self.stdout.write(json.dumps({
+            'path': options['path'],
+            'duration': options['duration'],
+            'servers': report,
+        }, indent=2))
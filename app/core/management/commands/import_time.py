@@ -0,0 +1,98 @@
+"""
+Django command to report the startup cost of the application
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+# Run in a fresh interpreter: imports the WSGI module without warming up,
+# then warms up and prints the step timings.
+SCRIPT = '''
+import json, time
+start = time.perf_counter()
+import {module}
+imported = (time.perf_counter() - start) * 1000
+from core.warmup import warmup
+print(json.dumps({{'import_ms': imported, 'warmup_ms': warmup()}}))
+'''
+
+
+def parse_importtime(output):
+    """Return the imports in `python -X importtime` output"""
+    imports = []
+    for line in output.splitlines():
+        match = LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            imports.append({
+                'module': name,
+                'self_us': int(own),
+                'cumulative_us': int(cumulative),
+                'depth': len(indent) // 2,
+            })
+    return imports
+
+
+class Command(BaseCommand):
+    """Django command to measure import and warmup time"""
+    help = (
+        'Import the WSGI application in a new interpreter and report the '
+        'slowest imports and the warmup steps.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default='app.wsgi')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument(
+            '--sort', choices=['cumulative', 'self'], default='cumulative',
+        )
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Print the report as JSON.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for the command"""
+        env = dict(os.environ, WARMUP='0')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c',
+             SCRIPT.format(module=options['module'])],
+            cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(
+                f'Importing {options["module"]} failed:\n{result.stderr}'
+            )
+
+        imports = parse_importtime(result.stderr)
+        key = f'{options["sort"]}_us'
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        report['modules'] = len(imports)
+        report['top'] = sorted(
+            imports, key=lambda item: -item[key]
+        )[:options['limit']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            f'{report["modules"]} modules imported in '
+            f'{report["import_ms"]:.1f}ms'
+        )
+        for step, ms in report['warmup_ms'].items():
+            self.stdout.write(f'  warmup {step:<12} {ms:>8.1f}ms')
+        self.stdout.write(f'{"self ms":>9} {"cumul ms":>9}  module')
+        for item in report['top']:
+            self.stdout.write(
+                f'{item["self_us"] / 1000:>9.1f} '
+                f'{item["cumulative_us"] / 1000:>9.1f}  {item["module"]}'
+            )
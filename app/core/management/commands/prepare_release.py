@@ -0,0 +1,128 @@
+"""
+Django command to collect static files and migrate only when needed
+"""
+from contextlib import contextmanager
+import hashlib
+import os
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+# Arbitrary key shared by every replica running this command.
+LOCK_ID = 7_225_091_847_303_102_001
+STATIC_MARKER = '.release-fingerprint'
+IGNORE_PATTERNS = ['CVS', '.*', '*~']
+
+
+def static_fingerprint():
+    """Return a hash of the names and contents of all static sources"""
+    files = []
+    for finder in finders.get_finders():
+        files.extend(finder.list(IGNORE_PATTERNS))
+
+    digest = hashlib.sha256()
+    for path, storage in sorted(files, key=lambda item: item[0]):
+        digest.update(path.encode())
+        with storage.open(path) as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def migration_fingerprint(executor):
+    """Return a hash of the applied migrations"""
+    applied = sorted(
+        f'{app}.{name}' for app, name in executor.loader.applied_migrations
+    )
+    return hashlib.sha256('\n'.join(applied).encode()).hexdigest()
+
+
+@contextmanager
+def advisory_lock(connection, timeout):
+    """Hold a PostgreSQL advisory lock so one replica prepares at a time"""
+    if connection.vendor != 'postgresql':
+        yield
+        return
+
+    deadline = time.monotonic() + timeout
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [LOCK_ID])
+            if cursor.fetchone()[0]:
+                break
+            if time.monotonic() > deadline:
+                raise CommandError('Timed out waiting for the release lock')
+            time.sleep(1)
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [LOCK_ID])
+
+
+class Command(BaseCommand):
+    """Django command to prepare static files and the database schema"""
+    help = (
+        'Run collectstatic and migrate only when static sources or '
+        'migrations changed, one replica at a time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Collect static files and migrate even if nothing changed.',
+        )
+        parser.add_argument(
+            '--lock-timeout', type=float, default=600,
+            help='Seconds to wait for another replica to finish.',
+        )
+
+    def _prepare_static(self, force):
+        marker = os.path.join(settings.STATIC_ROOT, STATIC_MARKER)
+        fingerprint = static_fingerprint()
+        if not force and os.path.exists(marker):
+            with open(marker) as f:
+                if f.read().strip() == fingerprint:
+                    self.stdout.write('Static files unchanged, skipping.')
+                    return
+
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(marker, 'w') as f:
+            f.write(fingerprint)
+        self.stdout.write(f'Static files collected ({fingerprint[:12]}).')
+
+    def _prepare_database(self, alias, force):
+        executor = MigrationExecutor(connections[alias])
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        if not plan and not force:
+            self.stdout.write(
+                f'Migrations of {alias} up to date '
+                f'({migration_fingerprint(executor)[:12]}), skipping.'
+            )
+            return
+
+        call_command(
+            'migrate', database=alias, interactive=False, verbosity=0
+        )
+        executor = MigrationExecutor(connections[alias])
+        self.stdout.write(
+            f'Applied {len(plan)} migrations to {alias} '
+            f'({migration_fingerprint(executor)[:12]}).'
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for the command"""
+        connection = connections[DEFAULT_DB_ALIAS]
+        # Replicas starting together wait here, and find nothing left
+        # to do once the first one is done.
+        with advisory_lock(connection, options['lock_timeout']):
+            self._prepare_static(options['force'])
+            # Every shard holds the full schema, the default one included.
+            for alias in settings.DATABASE_SHARDS:
+                self._prepare_database(alias, options['force'])
+        self.stdout.write(self.style.SUCCESS('Release prepared!'))
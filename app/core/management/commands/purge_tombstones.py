@@ -0,0 +1,41 @@
+"""
+Django command to delete expired tombstones
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Tombstone
+
+
+class Command(BaseCommand):
+    """Django command to purge tombstones older than the sync cursor TTL"""
+    help = (
+        'Delete tombstones older than SYNC_TOMBSTONE_TTL_DAYS on every '
+        'shard in batches, e.g. from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        """Entrypoint for the command"""
+        expiry = timezone.now() - timedelta(
+            days=settings.SYNC_TOMBSTONE_TTL_DAYS
+        )
+        for shard in settings.DATABASE_SHARDS:
+            tombstones = Tombstone.objects.using(shard)
+            deleted = 0
+            while True:
+                ids = list(
+                    tombstones.filter(deleted_at__lt=expiry)
+                    .values_list('pk', flat=True)[:options['batch_size']]
+                )
+                if not ids:
+                    break
+                deleted += tombstones.filter(pk__in=ids).delete()[0]
+            self.stdout.write(self.style.SUCCESS(
+                f'Deleted {deleted} expired tombstones on {shard}.'
+            ))
@@ -0,0 +1,154 @@
+"""
+Django command to move one user's recipe data to another shard
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from core.db.sharding import ring_shard, shard_for_user, wait_for_writes
+from core.models import Ingredient, Recipe, Tag, Tombstone
+
+
+def _insert(model, objs, using, batch_size):
+    """Insert new rows and set their primary keys"""
+    if connections[using].features.can_return_rows_from_bulk_insert:
+        model.objects.using(using).bulk_create(objs, batch_size=batch_size)
+    else:
+        for obj in objs:
+            obj.save(using=using, force_insert=True)
+
+
+def copy_user_data(user, source, target, batch_size=500):
+    """
+    Copy a user's recipes, tags and ingredients to another database.
+
+    Rows get new ids on the target, since each shard has its own
+    sequences. Tombstones are copied too, and the old ids get new ones
+    so syncing clients drop them before the rows show up again under
+    their new ids. Return the number of rows copied per model.
+    """
+    copied = {}
+    new_ids = {}
+    objects = {
+        model: list(
+            model.objects.using(source).filter(user=user).order_by('pk')
+        )
+        for model in (Tag, Ingredient, Recipe)
+    }
+
+    tombstones = list(
+        Tombstone.objects.using(source).filter(user=user).order_by('pk')
+    )
+    for tombstone in tombstones:
+        tombstone.pk = None
+    copied[Tombstone._meta.label] = len(tombstones)
+    tombstones += [
+        Tombstone(user=user, model=model._meta.model_name, object_id=obj.pk)
+        for model, objs in objects.items()
+        for obj in objs
+    ]
+    Tombstone.objects.using(target).bulk_create(
+        tombstones, batch_size=batch_size
+    )
+
+    # Inserting sets updated_at, after the tombstones' deleted_at.
+    for model, objs in objects.items():
+        old_ids = [obj.pk for obj in objs]
+        for obj in objs:
+            obj.pk = None
+            obj._state.adding = True
+        _insert(model, objs, target, batch_size)
+        new_ids[model] = {
+            old: obj.pk for old, obj in zip(old_ids, objs)
+        }
+        copied[model._meta.label] = len(objs)
+
+    for field, related in (('tags', Tag), ('ingredients', Ingredient)):
+        through = getattr(Recipe, field).through
+        column = f'{related._meta.model_name}_id'
+        rows = through.objects.using(source).filter(
+            recipe__user=user
+        ).values_list('recipe_id', column)
+        through.objects.using(target).bulk_create(
+            [
+                through(**{
+                    'recipe_id': new_ids[Recipe][recipe_id],
+                    column: new_ids[related][related_id],
+                })
+                for recipe_id, related_id in rows
+            ],
+            batch_size=batch_size,
+        )
+        copied[through._meta.label] = len(rows)
+    return copied
+
+
+def delete_user_data(user, using):
+    """Delete a user's recipe data from a database"""
+    # Tombstones last, deleting the others leaves new ones.
+    for model in (Recipe, Tag, Ingredient, Tombstone):
+        model.objects.using(using).filter(user=user).delete()
+
+
+class Command(BaseCommand):
+    """Django command to move a user's recipe data between shards"""
+    help = (
+        "Move a user's recipes, tags and ingredients to another shard. "
+        'Reads keep working during the move, writes are refused with a '
+        '503 until it is done.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='Email or id of the user.')
+        parser.add_argument(
+            '--to', dest='target', default=None,
+            help='Target shard. Defaults to the one the ring assigns.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def _get_user(self, value):
+        User = get_user_model()
+        lookup = {'pk': value} if value.isdigit() else {'email': value}
+        try:
+            return User.objects.using(DEFAULT_DB_ALIAS).get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f'No user {value}')
+
+    def _set(self, user, **fields):
+        type(user).objects.using(DEFAULT_DB_ALIAS).filter(
+            pk=user.pk
+        ).update(**fields)
+
+    def handle(self, *args, **options):
+        """Entrypoint for the command"""
+        user = self._get_user(options['user'])
+        source = shard_for_user(user)
+        target = options['target'] or ring_shard(user.pk)
+        if target not in settings.DATABASE_SHARDS:
+            raise CommandError(f'{target} is not in DATABASE_SHARDS')
+        if target == source:
+            self.stdout.write(f'{user.email} is already on {target}.')
+            return
+
+        self._set(user, shard_moving=True)
+        try:
+            # Writes that started before the flag was set hold a lock
+            # until they commit, later ones see the flag and back off.
+            wait_for_writes(user, source)
+            with transaction.atomic(using=target):
+                copied = copy_user_data(
+                    user, source, target, options['batch_size']
+                )
+            self._set(user, shard=target)
+        finally:
+            self._set(user, shard_moving=False)
+
+        with transaction.atomic(using=source):
+            delete_user_data(user, source)
+
+        for label, count in copied.items():
+            self.stdout.write(f'  {label}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {user.email} from {source} to {target}.'
+        ))
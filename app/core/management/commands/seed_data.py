@@ -0,0 +1,302 @@
+"""
+Django command to generate skewed synthetic data for load testing
+"""
+from decimal import Decimal
+from io import BytesIO
+import itertools
+import os
+import random
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+
+SEED_PASSWORD = 'seedpass123'
+PLACEHOLDER_IMAGES = 16
+
+
+def zipf_sizes(count, maximum, exponent, heavy=0, minimum=0):
+    """
+    Return `count` sizes following a Zipf curve that starts at `maximum`.
+
+    The first `heavy` sizes are pinned to `maximum`, the rest decay as
+    maximum / rank ** exponent and never drop below `minimum`.
+    """
+    sizes = []
+    for rank in range(1, count + 1):
+        if rank <= heavy:
+            sizes.append(maximum)
+        else:
+            zipf_rank = rank - heavy + 1
+            sizes.append(max(minimum, int(maximum / zipf_rank ** exponent)))
+    return sizes
+
+
+def zipf_weights(count, exponent):
+    """Return cumulative Zipf weights for `count` ranked items"""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+def insert_rows(model, fields, rows, batch_size):
+    """Insert tuples of field values with multi-row INSERT statements"""
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = ', '.join(
+        quote(model._meta.get_field(name).column) for name in fields
+    )
+    max_params = connection.features.max_query_params
+    if max_params:
+        batch_size = min(batch_size, max_params // len(fields))
+    placeholder = '(%s)' % ', '.join(['%s'] * len(fields))
+
+    inserted = 0
+    rows = iter(rows)
+    with connection.cursor() as cursor:
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) VALUES '
+                + ', '.join([placeholder] * len(batch)),
+                [value for row in batch for value in row],
+            )
+            inserted += len(batch)
+    return inserted
+
+
+class Command(BaseCommand):
+    """Django command to seed skewed synthetic recipe data"""
+    help = (
+        'Bulk-insert users, recipes, tags, ingredients and their join rows '
+        'with Zipf-distributed sizes. Output is deterministic for a seed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument(
+            '--max-recipes', type=int, default=50000,
+            help='Recipes owned by the heaviest users.',
+        )
+        parser.add_argument(
+            '--heavy-users', type=int, default=2,
+            help='Number of users that own --max-recipes recipes.',
+        )
+        parser.add_argument(
+            '--recipe-exponent', type=float, default=1.1,
+            help='Zipf exponent for recipes per user.',
+        )
+        parser.add_argument(
+            '--vocabulary', type=int, default=5000,
+            help='Size of the shared tag and ingredient name vocabulary.',
+        )
+        parser.add_argument(
+            '--vocabulary-exponent', type=float, default=1.0,
+            help='Zipf exponent for how popular vocabulary names are.',
+        )
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=6)
+        parser.add_argument(
+            '--image-fraction', type=float, default=0.0,
+            help='Fraction of recipes that get a placeholder image file.',
+        )
+        parser.add_argument(
+            '--email-prefix', default='seed-user-',
+            help='Prefix for generated user emails.',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def _create_users(self, options):
+        """Create the users and return their ids in rank order"""
+        User = get_user_model()
+        prefix = options['email_prefix']
+        emails = [
+            f'{prefix}{i}@example.com' for i in range(options['users'])
+        ]
+        if User.objects.filter(email__startswith=prefix).exists():
+            raise CommandError(
+                f'Users with email prefix "{prefix}" already exist.'
+            )
+        # Hash once, every seeded user shares the same password.
+        password = make_password(SEED_PASSWORD)
+        User.objects.bulk_create(
+            (
+                User(email=email, name=f'Seed user {i}', password=password)
+                for i, email in enumerate(emails)
+            ),
+            batch_size=options['batch_size'],
+        )
+        ids = dict(
+            User.objects.filter(email__in=emails).values_list('email', 'id')
+        )
+        return [ids[email] for email in emails]
+
+    def _create_vocabulary(self, rng, model, user_ids, recipe_counts,
+                           names, cum_weights, options):
+        """Give each user a Zipf-sampled slice of the name vocabulary"""
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+        def rows():
+            for user_id, recipes in zip(user_ids, recipe_counts):
+                size = min(len(names), 5 + int(recipes ** 0.5) * 2)
+                chosen = set(rng.choices(names, cum_weights=cum_weights,
+                                         k=size))
+                for name in sorted(chosen):
+                    yield (user_id, name, now)
+
+        insert_rows(
+            model, ['user', 'name', 'updated_at'], rows(),
+            options['batch_size'],
+        )
+
+        by_user = {}
+        queryset = model.objects.filter(user_id__in=user_ids)
+        for pk, user_id in queryset.order_by('id').values_list(
+                'id', 'user_id').iterator():
+            by_user.setdefault(user_id, []).append(pk)
+        return by_user
+
+    def _write_placeholder_images(self):
+        """Write a pool of placeholder images and return their paths"""
+        directory = os.path.join('uploads', 'recipe')
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, directory),
+                    exist_ok=True)
+        paths = []
+        for i in range(PLACEHOLDER_IMAGES):
+            path = os.path.join(directory, f'seed-placeholder-{i}.jpg')
+            buffer = BytesIO()
+            Image.new('RGB', (64, 64), color=(i * 16, 80, 160)).save(
+                buffer, format='JPEG'
+            )
+            with open(os.path.join(settings.MEDIA_ROOT, path), 'wb') as f:
+                f.write(buffer.getvalue())
+            paths.append(path)
+        return paths
+
+    def _create_recipes(self, rng, user_ids, recipe_counts, options):
+        """Insert the recipes of every user"""
+        images = []
+        if options['image_fraction'] > 0:
+            images = self._write_placeholder_images()
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+        def rows():
+            for user_id, count in zip(user_ids, recipe_counts):
+                for i in range(count):
+                    image = None
+                    if images and rng.random() < options['image_fraction']:
+                        image = rng.choice(images)
+                    yield (
+                        user_id,
+                        f'Recipe {i}',
+                        'Seeded recipe description. ' * rng.randint(1, 8),
+                        rng.randint(5, 240),
+                        Decimal(rng.randint(100, 99999)) / 100,
+                        '',
+                        image,
+                        now,
+                    )
+
+        return insert_rows(
+            Recipe,
+            ['user', 'title', 'description', 'time_minutes', 'price',
+             'link', 'image', 'updated_at'],
+            rows(),
+            options['batch_size'],
+        )
+
+    def _link(self, rng, through, target, user_ids, attrs_by_user,
+              per_recipe, exponent, options):
+        """Insert join rows from each recipe to its owner's attributes"""
+        weights = {}
+
+        def rows():
+            recipes = Recipe.objects.filter(user_id__in=user_ids).order_by(
+                'id').values_list('id', 'user_id')
+            for recipe_id, user_id in recipes.iterator():
+                attrs = attrs_by_user.get(user_id)
+                if not attrs or per_recipe <= 0:
+                    continue
+                if len(attrs) not in weights:
+                    weights[len(attrs)] = zipf_weights(len(attrs), exponent)
+                k = rng.randint(0, per_recipe * 2)
+                chosen = set(rng.choices(
+                    attrs, cum_weights=weights[len(attrs)], k=k
+                ))
+                for attr_id in sorted(chosen):
+                    yield (recipe_id, attr_id)
+
+        return insert_rows(
+            through, ['recipe', target], rows(), options['batch_size']
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for the command"""
+        if options['users'] < 1:
+            raise CommandError('--users must be positive.')
+        if options['heavy_users'] > options['users']:
+            raise CommandError('--heavy-users cannot exceed --users.')
+
+        rng = random.Random(options['seed'])
+        recipe_counts = zipf_sizes(
+            options['users'],
+            options['max_recipes'],
+            options['recipe_exponent'],
+            heavy=options['heavy_users'],
+        )
+        rng.shuffle(recipe_counts)
+        exponent = options['vocabulary_exponent']
+        cum_weights = zipf_weights(options['vocabulary'], exponent)
+        tag_names = [f'tag-{i}' for i in range(options['vocabulary'])]
+        ingredient_names = [
+            f'ingredient-{i}' for i in range(options['vocabulary'])
+        ]
+
+        with transaction.atomic():
+            user_ids = self._create_users(options)
+            self.stdout.write(f'Users: {len(user_ids)}')
+            tags = self._create_vocabulary(
+                rng, Tag, user_ids, recipe_counts, tag_names,
+                cum_weights, options,
+            )
+            ingredients = self._create_vocabulary(
+                rng, Ingredient, user_ids, recipe_counts, ingredient_names,
+                cum_weights, options,
+            )
+            self.stdout.write(
+                f'Tags: {sum(map(len, tags.values()))}, '
+                f'ingredients: {sum(map(len, ingredients.values()))}'
+            )
+            recipes = self._create_recipes(
+                rng, user_ids, recipe_counts, options
+            )
+            self.stdout.write(f'Recipes: {recipes}')
+            recipe_tags = self._link(
+                rng, Recipe.tags.through, 'tag', user_ids, tags,
+                options['tags_per_recipe'], exponent, options,
+            )
+            recipe_ingredients = self._link(
+                rng, Recipe.ingredients.through, 'ingredient', user_ids,
+                ingredients, options['ingredients_per_recipe'], exponent,
+                options,
+            )
+            self.stdout.write(
+                f'Recipe tags: {recipe_tags}, '
+                f'recipe ingredients: {recipe_ingredients}'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Seed data created!'))
@@ -0,0 +1,57 @@
+"""
+Django command to report logged slow queries
+"""
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.slow_queries import read_log
+
+
+class Command(BaseCommand):
+    """Django command to aggregate the slow query log per fingerprint"""
+    help = 'Report slow queries grouped by fingerprint, worst first.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--log', default=None,
+            help='Slow query log to read. Defaults to SLOW_QUERY_LOG.',
+        )
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Print the report as JSON.',
+        )
+        parser.add_argument(
+            '--plans', action='store_true',
+            help='Include the captured query plans.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for the command"""
+        path = options['log'] or settings.SLOW_QUERY_LOG
+        if not os.path.exists(path):
+            raise CommandError(f'No slow query log at {path}')
+
+        report = read_log(path)[:options['limit']]
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for stats in report:
+            self.stdout.write(self.style.WARNING(
+                f'{stats["fingerprint"]}  count={stats["count"]}  '
+                f'total={stats["total_ms"]:.1f}ms  '
+                f'avg={stats["avg_ms"]:.1f}ms  max={stats["max_ms"]:.1f}ms'
+            ))
+            self.stdout.write(f'  {stats["normalized"]}')
+            for site, count in sorted(stats['call_sites'].items(),
+                                      key=lambda item: -item[1]):
+                self.stdout.write(f'  {count:>6}  {site}')
+            if options['plans'] and stats['plan']:
+                label = 'EXPLAIN ANALYZE' if stats['analyzed'] else 'EXPLAIN'
+                self.stdout.write(f'  {label}:')
+                for line in stats['plan'].splitlines():
+                    self.stdout.write(f'    {line}')
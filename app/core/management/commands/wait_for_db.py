@@ -1,7 +1,8 @@
 """
 Django command to wait for the db to be available
 """
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+import random
 import time
 
 from django.db.utils import OperationalError
@@ -10,15 +11,45 @@ from psycopg2 import OperationalError as Psycopg2Error
 
 class Command(BaseCommand):
     """ Django Command to wait for database"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--initial-delay', type=float, default=0.1,
+            help='Seconds to wait after the first failed attempt.',
+        )
+        parser.add_argument(
+            '--max-delay', type=float, default=5,
+            help='Upper bound for the delay between attempts.',
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=0,
+            help='Give up after this many seconds, 0 waits forever.',
+        )
+
     def handle(self, *args, **options):
         """Entrypoint for the command"""
         self.stdout.write('Waiting for the database...')
+        start = time.monotonic()
+        attempt = 0
         db_up = False
         while db_up is False:
             try:
                 self.check(databases=['default'])
                 db_up = True
             except (Psycopg2Error, OperationalError):
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
+                elapsed = time.monotonic() - start
+                if options['timeout'] and elapsed >= options['timeout']:
+                    raise CommandError('Database still unavailable, giving up')
+                # Exponential backoff with jitter so replicas starting
+                # together do not retry in lockstep.
+                delay = min(
+                    options['max_delay'],
+                    options['initial_delay'] * 2 ** attempt,
+                )
+                delay *= random.uniform(0.5, 1)
+                attempt += 1
+                self.stdout.write(
+                    f'Database unavailable, waiting {delay:.2f} seconds...'
+                )
+                time.sleep(delay)
         self.stdout.write(self.style.SUCCESS('Database available!'))
@@ -0,0 +1,151 @@
+"""
+Memory profiling for long-running workers
+
+When MEMORY_PROFILING is off nothing here is installed: tracemalloc is
+not started, the middleware removes itself and no signal handler is set.
+"""
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import signal
+import tracemalloc
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+_baseline = None
+
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+REQUEST_PEAK_MEMORY = metrics.Histogram(
+    'request_peak_memory_bytes',
+    'Peak traced memory above the start of the request, by route name.',
+    ['route'],
+    buckets=[2 ** n for n in range(16, 31, 2)],
+)
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces(_IGNORED)
+
+
+def take_baseline():
+    """Remember the current allocations to diff later snapshots against"""
+    global _baseline
+    _baseline = _snapshot() if tracemalloc.is_tracing() else None
+
+
+def start(frames=1):
+    """Start tracing allocations and take the baseline"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    take_baseline()
+
+
+def stop():
+    """Stop tracing allocations"""
+    global _baseline
+    _baseline = None
+    tracemalloc.stop()
+
+
+def _site(traceback):
+    return [f'{frame.filename}:{frame.lineno}' for frame in traceback]
+
+
+def report(limit=20, key_type='lineno'):
+    """Return the top allocation sites of this worker since the baseline"""
+    snapshot = _snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    if _baseline is not None:
+        stats = snapshot.compare_to(_baseline, key_type)
+        top = [
+            {
+                'site': _site(stat.traceback),
+                'size': stat.size,
+                'size_diff': stat.size_diff,
+                'count': stat.count,
+                'count_diff': stat.count_diff,
+            }
+            for stat in stats[:limit]
+        ]
+    else:
+        top = [
+            {'site': _site(stat.traceback), 'size': stat.size,
+             'count': stat.count}
+            for stat in snapshot.statistics(key_type)[:limit]
+        ]
+    return {
+        'pid': os.getpid(),
+        'time': datetime.now(timezone.utc).isoformat(),
+        'traced_current_bytes': current,
+        'traced_peak_bytes': peak,
+        'top': top,
+    }
+
+
+def write_report(*args):
+    """Signal handler writing this worker's report to MEMORY_SNAPSHOT_DIR"""
+    try:
+        os.makedirs(settings.MEMORY_SNAPSHOT_DIR, exist_ok=True)
+        data = report()
+        path = os.path.join(
+            settings.MEMORY_SNAPSHOT_DIR,
+            f'memory-{data["pid"]}-{data["time"].replace(":", "")}.json',
+        )
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+    except Exception:
+        logger.exception('Could not write the memory report')
+
+
+def setup():
+    """Install memory profiling if it is enabled in the settings"""
+    if not settings.MEMORY_PROFILING:
+        return
+    start(settings.MEMORY_PROFILE_FRAMES)
+    # Each forked worker diffs against its own starting point.
+    os.register_at_fork(after_in_child=take_baseline)
+    try:
+        signal.signal(
+            getattr(signal, settings.MEMORY_SNAPSHOT_SIGNAL), write_report
+        )
+    except ValueError:
+        # Signal handlers can only be set from the main thread.
+        logger.warning('Memory report signal handler not installed')
+
+
+class MemoryProfilingMiddleware:
+    """Record the peak memory of requests to MEMORY_TRACKED_ROUTES"""
+
+    def __init__(self, get_response):
+        if not settings.MEMORY_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.routes = set(settings.MEMORY_TRACKED_ROUTES)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route = request.resolver_match.view_name
+        if route in self.routes and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            request.memory_start = (route, tracemalloc.get_traced_memory()[0])
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        memory_start = getattr(request, 'memory_start', None)
+        if memory_start is not None and tracemalloc.is_tracing():
+            route, start = memory_start
+            peak = tracemalloc.get_traced_memory()[1] - start
+            REQUEST_PEAK_MEMORY.labels(route).observe(peak)
+            response['X-Peak-Memory'] = str(peak)
+        return response
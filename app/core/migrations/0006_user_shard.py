@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-19 02:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+import core.db.sharding
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recipe_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='shard',
+            field=models.CharField(blank=True, max_length=63),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='shard_moving',
+            field=models.BooleanField(default=False),
+        ),
+        core.db.sharding.ShardAlterField(
+            model_name='ingredient',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        core.db.sharding.ShardAlterField(
+            model_name='recipe',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        core.db.sharding.ShardAlterField(
+            model_name='tag',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
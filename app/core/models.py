@@ -2,7 +2,9 @@ import uuid
 import os
 
 from django.db import models
+from django.db.models.fields.files import FieldFile
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -16,6 +18,96 @@ def recipe_image_file_path(instance, filename):
 
     return os.path.join('uploads','recipe', filename)
 
+class DirtyFieldsMixin:
+    """
+    Track the fields of a model changed since it was loaded or saved.
+
+    `save_changes()` writes only the changed columns, so a large column
+    left alone is not rewritten, and skips the UPDATE if nothing changed.
+    Values are kept as loaded and only prepared for the database when
+    compared, so loading rows costs no more than a dict copy.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {}
+        instance._remember(instance._tracked_fields())
+        return instance
+
+    def _tracked_fields(self):
+        return [
+            field for field in self._meta.concrete_fields
+            if not field.primary_key and not getattr(field, 'auto_now', False)
+        ]
+
+    def _remember(self, fields):
+        for field in fields:
+            # Deferred fields are not loaded, so not known to be clean.
+            if field.attname in self.__dict__:
+                value = self.__dict__[field.attname]
+                if isinstance(value, FieldFile):
+                    # Changed in place when a new file is saved.
+                    value = value.name
+                self._loaded_values[field.attname] = value
+
+    def _changed(self, field, loaded):
+        value = self.__dict__[field.attname]
+        if value == loaded:
+            return False
+        # Prepared values compare files by name and decimals by value.
+        return field.get_prep_value(value) != field.get_prep_value(loaded)
+
+    def changed_fields(self):
+        """Return the names of changed fields, None if not tracked"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        return [
+            field.name for field in self._tracked_fields()
+            if field.attname in self.__dict__ and (
+                field.attname not in loaded
+                or self._changed(field, loaded[field.attname])
+            )
+        ]
+
+    def _remember_written(self, names):
+        """Remember the fields just saved or read, all if `names` is None"""
+        if names is None or not hasattr(self, '_loaded_values'):
+            self._loaded_values = {}
+            self._remember(self._tracked_fields())
+        else:
+            self._remember(self._meta.get_field(name) for name in names)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._remember_written(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self._remember_written(fields)
+
+    def save_changes(self, touch=False):
+        """
+        Save only the changed fields and return whether a row was written.
+
+        Unchanged instances are not saved unless `touch` is set, which
+        still updates auto_now fields such as `updated_at`.
+        """
+        changed = self.changed_fields()
+        if changed is None or self._state.adding:
+            self.save()
+            return True
+        if not changed and not touch:
+            return False
+        auto_now = [
+            field.name for field in self._meta.concrete_fields
+            if getattr(field, 'auto_now', False)
+        ]
+        self.save(update_fields=changed + auto_now)
+        return True
+
+
 class UserManager(BaseUserManager):
     """ Manager for users """
 
@@ -42,23 +134,29 @@ class UserManager(BaseUserManager):
         return user
 
 
-class User(AbstractBaseUser, PermissionsMixin):
+class User(DirtyFieldsMixin, AbstractBaseUser, PermissionsMixin):
     """ User in the system """
     email = models.EmailField(max_length=255, unique=True)
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Database alias holding the user's recipe data, see core.db.sharding
+    shard = models.CharField(max_length=63, blank=True)
+    shard_moving = models.BooleanField(default=False)
     # This line connects your manager to your model
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
 
 
-class Recipe(models.Model):
+class Recipe(DirtyFieldsMixin, models.Model):
     """Recipe Object"""
+    # Recipes may live on another shard than their owner, the constraint
+    # is only kept on the default database.
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_constraint=False,
     )
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
@@ -68,6 +166,11 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # Position in the change feed, see core.sync
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'updated_at'])]
 
     def __str__(self):
         return self.title
@@ -79,7 +182,12 @@ class Tag(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_constraint=False,
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'updated_at'])]
 
     def __str__(self):
         return self.name
@@ -89,8 +197,60 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, 
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'updated_at'])]
+
+    def __str__(self):
+        return self.name
+
+
+class Tombstone(models.Model):
+    """Deleted recipe, tag or ingredient, for the change feed"""
+    # Kept on the owner's shard, next to the deleted row.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    # Model name of the deleted object, e.g. 'recipe'
+    model = models.CharField(max_length=63)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'deleted_at'])]
+
+    def __str__(self):
+        return f'{self.model} {self.object_id}'
+
+
+class IdempotencyKey(models.Model):
+    """First response to a write sent with an Idempotency-Key header"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
     )
+    key = models.CharField(max_length=255)
+    # Hash of the request the key was first used for
+    fingerprint = models.CharField(max_length=64)
+    # Empty while the first request is in flight
+    status_code = models.PositiveSmallIntegerField(null=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    # zlib-compressed response body
+    body = models.BinaryField(default=b'')
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'key'], name='unique_idempotency_key'
+            ),
+        ]
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.key
@@ -0,0 +1,150 @@
+"""
+Liveness and readiness probes served in front of Django
+
+The probes are answered by a WSGI wrapper before the request reaches
+Django's handler, so they skip the middleware stack, URL resolution
+and DRF entirely.
+"""
+from http import HTTPStatus
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.db.migrations.executor import MigrationExecutor
+
+from core import metrics
+
+LIVENESS_PATH = '/api/health/live/'
+READINESS_PATH = '/api/health/ready/'
+
+_lock = threading.Lock()
+_cached = (0.0, None)
+_migrated = False
+
+
+def check_database():
+    """Return whether the default database answers a trivial query"""
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return True
+
+
+def check_media():
+    """Return whether the media volume accepts new files"""
+    os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=settings.MEDIA_ROOT):
+        pass
+    return True
+
+
+def check_migrations():
+    """
+    Return whether every migration has been applied on every shard.
+
+    A running release never unapplies migrations, so once they are all
+    applied the migration graph is not loaded again.
+    """
+    global _migrated
+    if _migrated:
+        return True
+    for alias in settings.DATABASE_SHARDS:
+        executor = MigrationExecutor(connections[alias])
+        if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+            return False
+    _migrated = True
+    return True
+
+
+CHECKS = {
+    'database': check_database,
+    'media': check_media,
+    'migrations': check_migrations,
+}
+
+
+def run_checks():
+    """Run every readiness check, treating errors as failures"""
+    results = {}
+    for name, check in CHECKS.items():
+        try:
+            results[name] = bool(check())
+        except Exception:
+            results[name] = False
+    return results
+
+
+def readiness():
+    """
+    Return the readiness check results, cached for a few seconds.
+
+    Only one thread per process refreshes an expired result, the others
+    keep answering with the previous one meanwhile.
+    """
+    global _cached
+    expires, results = _cached
+    if results is not None and time.monotonic() < expires:
+        metrics.record_cache('readiness', True)
+        return results
+
+    if not _lock.acquire(blocking=results is None):
+        metrics.record_cache('readiness', True)
+        return results
+    try:
+        expires, results = _cached
+        if results is not None and time.monotonic() < expires:
+            metrics.record_cache('readiness', True)
+            return results
+        metrics.record_cache('readiness', False)
+        try:
+            results = run_checks()
+        finally:
+            close_old_connections()
+        _cached = (
+            time.monotonic() + settings.READINESS_CACHE_SECONDS, results
+        )
+        return results
+    finally:
+        _lock.release()
+
+
+def probe(path):
+    """Return the status code and body answering a probe path, or None"""
+    if path == LIVENESS_PATH:
+        return 200, {'healthy': True}
+    if path == READINESS_PATH:
+        results = readiness()
+        ready = all(results.values())
+        return 200 if ready else 503, {'ready': ready, 'checks': results}
+    return None
+
+
+HEADERS = [
+    ('Content-Type', 'application/json'),
+    ('Cache-Control', 'no-store'),
+]
+
+
+def _respond(start_response, status, body):
+    content = json.dumps(body).encode()
+    start_response(f'{status} {HTTPStatus(status).phrase}', [
+        *HEADERS, ('Content-Length', str(len(content))),
+    ])
+    return [content]
+
+
+class ProbeWSGIApplication:
+    """Answer the probe paths directly, pass everything else to Django"""
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        answer = probe(environ.get('PATH_INFO'))
+        if answer is None:
+            return self.application(environ, start_response)
+        return _respond(start_response, *answer)
@@ -0,0 +1,109 @@
+"""
+Fixed-size hash tables shared by the workers of a host
+
+A SharedTable lives in a memory-mapped file that every worker maps.
+Each slot is a struct starting with the hash of its key, 0 for a free
+slot. A key probes a few slots from its hash and the table decides
+which one it takes. Reads and updates hold an flock on the file, so
+updating a slot is atomic across workers and takes a few microseconds.
+"""
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import mmap
+import os
+import threading
+import weakref
+
+from django.conf import settings
+
+_tables = weakref.WeakSet()
+
+
+def key_hash(key):
+    """Return the non-zero 64-bit hash of a key"""
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+class SharedTable:
+    """
+    Base class of tables of fixed-size slots in a shared mapped file.
+
+    Subclasses set `slot`, a struct whose first field is the key hash,
+    and `file_setting` and `slots_setting`, the names of the settings
+    with the path of the file and its number of slots.
+    """
+    slot = None
+    file_setting = None
+    slots_setting = None
+    probes = 8
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fd = None
+        self._mmap = None
+        self.slots = 0
+        _tables.add(self)
+
+    def _open(self):
+        """Map the table file, creating or resizing it if needed"""
+        path = getattr(settings, self.file_setting)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.slots = getattr(settings, self.slots_setting)
+        size = self.slots * self.slot.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._mmap = mmap.mmap(self._fd, size)
+
+    def _forget(self):
+        """Drop the mapping inherited from the parent of a new worker"""
+        self._lock = threading.Lock()
+        if self._mmap is not None:
+            self._mmap.close()
+            os.close(self._fd)
+        self._fd = None
+        self._mmap = None
+
+    @contextmanager
+    def locked(self):
+        """Hold the table against other threads and workers"""
+        with self._lock:
+            if self._mmap is None:
+                self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def probe(self, key_hash):
+        """Yield the offset and fields of each slot a key probes"""
+        start = key_hash % self.slots
+        for probe in range(self.probes):
+            offset = (start + probe) % self.slots * self.slot.size
+            yield offset, self.slot.unpack_from(self._mmap, offset)
+
+    def write(self, offset, *fields):
+        """Store the fields of the slot at an offset"""
+        self.slot.pack_into(self._mmap, offset, *fields)
+
+    def clear(self):
+        """Empty every slot"""
+        with self.locked():
+            self._mmap[:] = bytes(len(self._mmap))
+
+
+def _after_fork():
+    for table in list(_tables):
+        table._forget()
+
+
+# The file lock is per open file, so every worker opens its own.
+os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,195 @@
+"""
+Slow query logging with EXPLAIN capture
+"""
+from datetime import datetime, timezone
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+MAX_SQL_LENGTH = 2000
+STACK_DEPTH = 8
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+# SELECTs that lock rows, create tables or advance sequences.
+_WRITES = re.compile(
+    r'\bINTO\b|\bFOR\s+(?:NO\s+KEY\s+UPDATE|UPDATE|KEY\s+SHARE|SHARE)\b'
+    r'|\b(?:nextval|setval)\s*\(',
+    re.IGNORECASE,
+)
+
+
+def normalize(sql):
+    """Replace literals and parameters so equal queries compare equal"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    """Return a short stable id for a normalized query"""
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()[:12]
+
+
+def read_only(sql):
+    """Return whether a SELECT can be run again without side effects"""
+    return _WRITES.search(sql) is None
+
+
+def call_site():
+    """Return the innermost frames of project code that ran the query"""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(base_dir) and
+        'site-packages' not in frame.filename and
+        frame.filename != __file__
+    ]
+    return [
+        f'{os.path.relpath(frame.filename, base_dir)}:{frame.lineno} '
+        f'in {frame.name}'
+        for frame in frames[-STACK_DEPTH:]
+    ]
+
+
+class SlowQueryLogger:
+    """
+    Database execute wrapper that records queries over a threshold.
+
+    Slow SELECTs are explained on a separate cursor, and a sampled
+    fraction of read-only ones is run again under EXPLAIN ANALYZE on
+    PostgreSQL. Plans are taken in a savepoint that is always rolled
+    back, so a failing EXPLAIN does not abort the request's transaction.
+    Every slow query is appended as one JSON line to SLOW_QUERY_LOG.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(self._local, 'explaining', False):
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - start
+
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        if threshold > 0 and duration * 1000 >= threshold:
+            self._record(sql, params, many, context['connection'], duration)
+        return result
+
+    def _explain(self, connection, sql, params):
+        """Return the plan of a SELECT and whether it was analyzed"""
+        analyze = (
+            connection.vendor == 'postgresql' and
+            read_only(sql) and
+            random.random() < settings.SLOW_QUERY_ANALYZE_SAMPLE_RATE
+        )
+        if connection.vendor == 'postgresql':
+            prefix = 'EXPLAIN ANALYZE ' if analyze else 'EXPLAIN '
+        elif connection.vendor == 'sqlite':
+            prefix = 'EXPLAIN QUERY PLAN '
+        else:
+            prefix = 'EXPLAIN '
+
+        self._local.explaining = True
+        try:
+            with transaction.atomic(using=connection.alias, savepoint=True):
+                with connection.cursor() as cursor:
+                    cursor.execute(prefix + sql, params)
+                    rows = cursor.fetchall()
+                transaction.set_rollback(True, using=connection.alias)
+        except Exception:
+            logger.exception('Could not explain slow query')
+            return None, False
+        finally:
+            self._local.explaining = False
+        return '\n'.join(' '.join(map(str, row)) for row in rows), analyze
+
+    def _record(self, sql, params, many, connection, duration):
+        normalized = normalize(sql)
+        plan, analyzed = None, False
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            plan, analyzed = self._explain(connection, sql, params)
+
+        entry = {
+            'time': datetime.now(timezone.utc).isoformat(),
+            'alias': connection.alias,
+            'fingerprint': fingerprint(normalized),
+            'normalized': normalized,
+            'sql': sql[:MAX_SQL_LENGTH],
+            'duration_ms': round(duration * 1000, 2),
+            'stack': call_site(),
+            'plan': plan,
+            'analyzed': analyzed,
+        }
+        logger.warning(
+            'Slow query %s took %.1f ms', entry['fingerprint'],
+            entry['duration_ms'],
+        )
+        try:
+            os.makedirs(os.path.dirname(settings.SLOW_QUERY_LOG),
+                        exist_ok=True)
+            with open(settings.SLOW_QUERY_LOG, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+        except OSError:
+            logger.exception('Could not write the slow query log')
+
+
+slow_query_logger = SlowQueryLogger()
+
+
+def install(sender, connection, **kwargs):
+    """Attach the slow query logger to a new database connection"""
+    if slow_query_logger not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_logger)
+
+
+def read_log(path):
+    """Aggregate logged slow queries per fingerprint"""
+    report = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            stats = report.setdefault(entry['fingerprint'], {
+                'fingerprint': entry['fingerprint'],
+                'normalized': entry['normalized'],
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'call_sites': {},
+                'plan': None,
+                'analyzed': False,
+            })
+            stats['count'] += 1
+            stats['total_ms'] += entry['duration_ms']
+            stats['max_ms'] = max(stats['max_ms'], entry['duration_ms'])
+            site = entry['stack'][-1] if entry['stack'] else 'unknown'
+            stats['call_sites'][site] = stats['call_sites'].get(site, 0) + 1
+            # Prefer the latest analyzed plan, then the latest plan.
+            if entry['plan'] and (entry['analyzed'] or
+                                  not stats['analyzed']):
+                stats['plan'] = entry['plan']
+                stats['analyzed'] = entry['analyzed']
+    for stats in report.values():
+        stats['avg_ms'] = stats['total_ms'] / stats['count']
+    return sorted(report.values(), key=lambda s: s['total_ms'], reverse=True)
@@ -0,0 +1,147 @@
+"""
+Change feed of a user's recipe data
+
+Recipes, tags and ingredients carry an indexed `updated_at`, and
+deleting one leaves a Tombstone on the same shard. `changes()` returns
+what changed after a cursor, oldest first, so a sync reads as many rows
+as there are changes whatever the size of the account.
+
+Changes are ordered by (timestamp, source, pk) and a cursor is the
+position of the last change a client got, or once it has them all, the
+end of the feed at the time of the sync. Changes younger than
+SYNC_SETTLE_SECONDS are held back: timestamps are taken before commit,
+so a slow transaction could otherwise land behind a cursor already
+handed out. Tombstones are kept for SYNC_TOMBSTONE_TTL_DAYS, older
+cursors must start over with a full sync, but an idle account syncing
+within that time keeps its cursor fresh. Deleting a user leaves no
+tombstones, nobody is left to sync them.
+"""
+import base64
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+import heapq
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from core.models import Ingredient, Recipe, Tag, Tombstone
+
+# Deletions sort before changes with the same timestamp, so objects
+# moved to another shard are dropped by clients before they reappear
+# under their new id.
+SOURCES = (
+    (Tombstone.objects.all(), 'deleted_at'),
+    (Tag.objects.all(), 'updated_at'),
+    (Ingredient.objects.all(), 'updated_at'),
+    (Recipe.objects.prefetch_related('tags', 'ingredients'), 'updated_at'),
+)
+
+
+class Position(NamedTuple):
+    """Place of a change in the feed"""
+    timestamp: datetime
+    source: int
+    pk: int
+
+
+class CursorExpired(APIException):
+    """The deletions since a cursor are no longer known"""
+    status_code = status.HTTP_410_GONE
+    default_detail = 'This cursor has expired, sync again without one.'
+    default_code = 'cursor_expired'
+
+
+def encode_cursor(position):
+    """Return the opaque cursor of a position"""
+    value = f'{position.timestamp.isoformat()}|{position.source}|{position.pk}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the position of a cursor, ValueError if it is invalid"""
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, source, pk = value.split('|')
+        position = Position(
+            datetime.fromisoformat(timestamp), int(source), int(pk)
+        )
+    except (TypeError, UnicodeError, ValueError):
+        raise ValueError(f'Invalid cursor {cursor!r}')
+    if timezone.is_naive(position.timestamp):
+        raise ValueError(f'Invalid cursor {cursor!r}')
+    return position
+
+
+# Django 3.2 does not tell a cascade from a direct delete, so users being
+# deleted are tracked from their pre_delete to their post_delete.
+_deleting_users = ContextVar('deleting_users', default=frozenset())
+
+
+def user_deleting(sender, instance, **kwargs):
+    """Skip tombstones for the data of a user being deleted"""
+    _deleting_users.set(_deleting_users.get() | {instance.pk})
+
+
+def user_deleted(sender, instance, **kwargs):
+    """Leave tombstones for the user's deletions again"""
+    _deleting_users.set(_deleting_users.get() - {instance.pk})
+
+
+def record_deletion(sender, instance, using, **kwargs):
+    """Leave a tombstone where a recipe, tag or ingredient was deleted"""
+    if instance.user_id in _deleting_users.get():
+        return
+    Tombstone.objects.using(using).create(
+        user_id=instance.user_id,
+        model=instance._meta.model_name,
+        object_id=instance.pk,
+    )
+
+
+def _after(field, index, position):
+    """Filter for the rows of a source after a position"""
+    later = Q(**{f'{field}__gt': position.timestamp})
+    if index > position.source:
+        return later | Q(**{field: position.timestamp})
+    if index == position.source:
+        return later | Q(**{field: position.timestamp, 'pk__gt': position.pk})
+    return later
+
+
+def _read(index, queryset, field, user, position, until, limit):
+    queryset = queryset.filter(user=user, **{f'{field}__lte': until})
+    if position is not None:
+        queryset = queryset.filter(_after(field, index, position))
+    return [
+        (Position(getattr(obj, field), index, obj.pk), obj)
+        for obj in queryset.order_by(field, 'pk')[:limit]
+    ]
+
+
+def changes(user, position=None, limit=500):
+    """
+    Return up to `limit` (position, object) changes after a position.
+
+    Deletions come as Tombstone objects. Also return the position to
+    resume from and whether more changes follow.
+    """
+    now = timezone.now()
+    expiry = now - timedelta(days=settings.SYNC_TOMBSTONE_TTL_DAYS)
+    if position is not None and position.timestamp < expiry:
+        raise CursorExpired
+    until = now - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+    # Each source reads at most one page, one query each.
+    streams = [
+        _read(index, queryset, field, user, position, until, limit + 1)
+        for index, (queryset, field) in enumerate(SOURCES)
+    ]
+    merged = list(heapq.merge(*streams, key=lambda change: change[0]))
+    if len(merged) > limit:
+        return merged[:limit], merged[limit - 1][0], True
+    # Past every source at `until`, so the cursor ages with the syncs
+    # rather than with the last change.
+    return merged, Position(until, len(SOURCES), 0), False
@@ -0,0 +1,129 @@
+"""
+Test helpers for query-count budgets and scaling checks
+"""
+from abc import ABC, abstractmethod
+import importlib
+import logging
+
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver
+
+# Transaction and session setup, the same for every request of a view.
+SETUP_SQL = ('SET ',)
+
+
+def url_names(urlconf):
+    """Return the namespaced names of every URL pattern in a urlconf"""
+    module = importlib.import_module(urlconf)
+
+    def collect(patterns):
+        names = set()
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                names |= collect(pattern.url_patterns)
+            elif isinstance(pattern, URLPattern) and pattern.name:
+                names.add(f'{module.app_name}:{pattern.name}')
+        return names
+
+    return collect(module.urlpatterns)
+
+
+def count_queries(request):
+    """Call `request` and return the response and the queries it ran"""
+    with CaptureQueriesContext(connection) as captured:
+        res = request()
+        # Streamed bodies run their queries while being consumed.
+        if getattr(res, 'streaming', False):
+            b''.join(res.streaming_content)
+    # Savepoints count: a write's transaction runs as one inside the test
+    # case's, standing for its BEGIN and COMMIT in production, and any
+    # savepoint nested in it costs the same in production. SET LOCAL
+    # statement_timeout is one statement per transaction, budgets count
+    # what the endpoint itself runs.
+    queries = [
+        query for query in captured.captured_queries
+        if not query['sql'].startswith(SETUP_SQL)
+    ]
+    return res, len(queries)
+
+
+class QueryBudgetMixin(ABC):
+    """
+    Mixin for TestCase classes that check endpoints against a budget.
+
+    Subclasses set `query_budgets` to a table keyed by
+    (method, url name) and implement `grow(count)` to add `count`
+    more rows of whatever the endpoint scales with.
+    """
+    query_budgets = {}
+    sizes = [1, 10, 30]
+
+    @abstractmethod
+    def grow(self, count):
+        """Add `count` rows of what the tested endpoints scale with"""
+
+    def assertQueryBudget(self, method, name, request, prepare=None):
+        """
+        Assert an endpoint stays in budget and does not scale with N.
+
+        If `prepare` is given it runs before each request, outside the
+        measurement, and its return value is passed to `request`.
+        """
+        budget = self.query_budgets[(method, name)]
+
+        def call():
+            if prepare is None:
+                return count_queries(request)
+            args = prepare()
+            return count_queries(lambda: request(args))
+
+        # Warm up per-process caches such as content types.
+        call()
+
+        counts = {}
+        current = 0
+        for size in self.sizes:
+            self.grow(size - current)
+            current = size
+            res, counts[size] = call()
+            self.assertLess(
+                res.status_code, 400,
+                f'{method} {name} returned {res.status_code}',
+            )
+
+        if len(set(counts.values())) > 1:
+            self.fail(
+                f'{method} {name} query count grows with N: {counts}'
+            )
+        used = max(counts.values())
+        if used > budget:
+            self.fail(
+                f'{method} {name} runs {used} queries, budget is {budget}'
+            )
+
+    def assertBudgetsCoverUrls(self, urlconf):
+        """Assert every named route of a urlconf has a declared budget"""
+        budgeted = {name for _, name in self.query_budgets}
+        missing = url_names(urlconf) - budgeted
+        self.assertFalse(missing, f'Routes without a query budget: {missing}')
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Test runner turning off throttling, which tests enable as needed.
+
+    The per-request log lines are quieted too, tests that check them
+    use assertLogs.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.throttling_off = override_settings(THROTTLE_ENABLED=False)
+        self.throttling_off.enable()
+        logging.getLogger('core.instrumentation').setLevel(logging.WARNING)
+
+    def teardown_test_environment(self, **kwargs):
+        self.throttling_off.disable()
+        super().teardown_test_environment(**kwargs)
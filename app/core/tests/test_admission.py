@@ -0,0 +1,77 @@
+"""
+Tests for admission control and load shedding
+"""
+import time
+from unittest.mock import patch
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core import admission
+
+LIMITS = {
+    'low': {'in_flight': 1, 'queue_ms': 100},
+    'normal': {'in_flight': 2, 'queue_ms': 1000},
+}
+
+
+def queued_for(seconds):
+    """X-Request-Start header of a request that queued for a while"""
+    return {'HTTP_X_REQUEST_START': f't={time.time() - seconds:.3f}'}
+
+
+@override_settings(ADMISSION_LIMITS=LIMITS, ADMISSION_RETRY_AFTER=5)
+@patch('core.admission.load', new_callable=admission.Load)
+class AdmissionControlTests(SimpleTestCase):
+    """Test shedding requests when the worker is overloaded"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = admission.AdmissionControlMiddleware(
+            lambda request: HttpResponse()
+        )
+
+    def _call(self, path, **extra):
+        return self.middleware(self.factory.get(path, **extra))
+
+    def test_admitted_when_idle(self, load):
+        """Test requests pass through and are counted out again"""
+        res = self._call('/api/recipe/recipes/', **queued_for(0.01))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(load.in_flight, 0)
+
+    def test_low_priority_shed_first_on_queue_time(self, load):
+        """Test a long queue sheds the schema but not recipes"""
+        for _ in range(5):
+            self._call('/api/recipe/recipes/', **queued_for(0.5))
+
+        res = self._call('/api/schema/', **queued_for(0.5))
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res['Retry-After'], '5')
+
+        res = self._call('/api/recipe/recipes/', **queued_for(0.5))
+        self.assertEqual(res.status_code, 200)
+
+    def test_normal_routes_shed_at_hard_limit(self, load):
+        """Test recipe requests are shed only past the normal limit"""
+        load.in_flight = 1
+        self.assertEqual(self._call('/api/schema/').status_code, 503)
+        self.assertEqual(self._call('/api/recipe/recipes/').status_code, 200)
+
+        load.in_flight = 2
+        self.assertEqual(self._call('/api/recipe/recipes/').status_code, 503)
+
+    def test_exempt_paths_never_shed(self, load):
+        """Test the health check is served however loaded the worker is"""
+        load.in_flight = 100
+
+        self.assertEqual(self._call('/api/health-check/').status_code, 200)
+
+    def test_queue_seconds(self, load):
+        """Test reading the queue time stamped by nginx"""
+        meta = {'HTTP_X_REQUEST_START': 't=1000.250'}
+
+        self.assertEqual(admission.queue_seconds(meta, now=1000.5), 0.25)
+        self.assertEqual(admission.queue_seconds(meta, now=999.0), 0.0)
+        self.assertEqual(admission.queue_seconds({}, now=1000.5), 0.0)
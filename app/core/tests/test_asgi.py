@@ -0,0 +1,116 @@
+"""
+Tests for the pooled ASGI handler
+"""
+import json
+
+from asgiref.sync import async_to_sync
+
+from django.test import RequestFactory, SimpleTestCase
+from django.urls import reverse
+
+from core import probes
+from core.asgi import PooledASGIHandler
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def call(handler, path, method='GET', messages=None):
+    """Run one ASGI request through the handler and return what it sent"""
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': b'',
+        'headers': [(b'host', b'testserver')],
+    }
+    if messages is None:
+        messages = [{'type': 'http.request'}]
+    received, sent = list(messages), []
+
+    async def receive():
+        return received.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    async_to_sync(handler)(scope, receive, send)
+    return sent
+
+
+def response_of(sent):
+    """Return the status and body of sent ASGI messages"""
+    body = b''.join(message.get('body', b'') for message in sent[1:])
+    return sent[0]['status'], body
+
+
+class PooledASGIHandlerTests(SimpleTestCase):
+    """Test serving requests from the ASGI thread pools"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.handler = PooledASGIHandler()
+
+    @classmethod
+    def tearDownClass(cls):
+        for pool in cls.handler.pools.values():
+            pool.shutdown()
+        super().tearDownClass()
+
+    def test_liveness_answered_on_the_loop(self):
+        """Test the liveness probe is answered without Django"""
+        status, body = response_of(call(self.handler, probes.LIVENESS_PATH))
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {'healthy': True})
+
+    def test_request_runs_through_django(self):
+        """Test API requests go through the middleware and view"""
+        status, body = response_of(call(self.handler, RECIPES_URL))
+
+        self.assertEqual(status, 401)
+        self.assertIn(b'Authentication credentials', body)
+
+    def test_request_body_is_read(self):
+        """Test request bodies sent in several messages are read"""
+        sent = call(self.handler, RECIPES_URL, method='POST', messages=[
+            {'type': 'http.request', 'body': b'{"ti', 'more_body': True},
+            {'type': 'http.request', 'body': b'tle": "Soup"}'},
+        ])
+
+        self.assertEqual(response_of(sent)[0], 401)
+
+    def test_reads_of_hot_routes_use_the_read_pool(self):
+        """Test only safe requests to read routes get the read pool"""
+        factory = RequestFactory()
+
+        self.assertEqual(
+            self.handler.pool_for(factory.get(RECIPES_URL)), 'read'
+        )
+        self.assertEqual(
+            self.handler.pool_for(factory.post(RECIPES_URL)), 'default'
+        )
+        self.assertEqual(
+            self.handler.pool_for(factory.get('/missing/')), 'default'
+        )
+
+    def test_lifespan(self):
+        """Test startup and shutdown events are acknowledged"""
+        handler = PooledASGIHandler()
+        sent = []
+        received = [
+            {'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'},
+        ]
+
+        async def receive():
+            return received.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        async_to_sync(handler)({'type': 'lifespan'}, receive, send)
+
+        self.assertEqual(
+            [message['type'] for message in sent],
+            ['lifespan.startup.complete', 'lifespan.shutdown.complete'],
+        )
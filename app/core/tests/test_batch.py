@@ -0,0 +1,144 @@
+"""
+Tests for the batch API
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from core.testing import count_queries
+
+BATCH_URL = reverse('batch')
+ME_URL = reverse('user:me')
+TAGS_URL = reverse('recipe:tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class PublicBatchApiTests(TestCase):
+    """Test unauthenticated batch requests"""
+
+    def test_auth_required(self):
+        """Test a batch needs a token"""
+        res = APIClient().post(
+            BATCH_URL, [{'method': 'GET', 'path': ME_URL}], format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateBatchApiTests(TestCase):
+    """Test batch requests of an authenticated user"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def _batch(self, requests):
+        return self.client.post(BATCH_URL, requests, format='json')
+
+    def test_responses_in_order(self):
+        """Test each sub-request gets its own response, in order"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self._batch([
+            {'method': 'GET', 'path': ME_URL},
+            {'method': 'GET', 'path': f'{TAGS_URL}?assigned_only=0'},
+            {'method': 'GET', 'path': '/api/recipe/missing/'},
+        ])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        me, tags, missing = res.json()
+        self.assertEqual(me['status'], 200)
+        self.assertEqual(me['body']['email'], self.user.email)
+        self.assertEqual(tags['status'], 200)
+        self.assertEqual([tag['name'] for tag in tags['body']], ['Vegan'])
+        self.assertEqual(missing, {'status': 404, 'body': None})
+
+    def test_authenticates_once(self):
+        """Test sub-requests skip the token lookup"""
+        requests = [{'method': 'GET', 'path': TAGS_URL}] * 3
+
+        res, queries = count_queries(lambda: self._batch(requests))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # The batch's token, then one query per tag list.
+        self.assertEqual(queries, 4)
+
+    def test_sub_responses_closed(self):
+        """Test each sub-response is closed, sending request_finished"""
+        finished = []
+
+        def receiver(sender, **kwargs):
+            finished.append(sender)
+
+        request_finished.connect(receiver)
+        self.addCleanup(request_finished.disconnect, receiver)
+        res = self._batch([{'method': 'GET', 'path': TAGS_URL}] * 2)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # Both sub-requests, then the batch itself.
+        self.assertEqual(len(finished), 3)
+
+    def test_sub_request_statuses(self):
+        """Test failing sub-requests do not fail the batch"""
+        res = self._batch([
+            {'method': 'POST', 'path': RECIPES_URL, 'body': {'title': 'x'}},
+            {
+                'method': 'POST',
+                'path': RECIPES_URL,
+                'body': {'title': 'Soup', 'time_minutes': 5, 'price': '1'},
+            },
+        ])
+
+        invalid, created = res.json()
+        self.assertEqual(invalid['status'], 400)
+        self.assertIn('time_minutes', invalid['body'])
+        self.assertEqual(created['status'], 201)
+        recipe = Recipe.objects.get()
+        self.assertEqual(recipe.user, self.user)
+        self.assertEqual(created['body']['id'], recipe.id)
+
+    @patch('recipe.views.TagViewSet.list', side_effect=RuntimeError)
+    def test_crashing_sub_request(self, patched_list):
+        """Test a crashing sub-request gives a 500 entry"""
+        with self.assertLogs('core.batch', 'ERROR'):
+            res = self._batch([
+                {'method': 'GET', 'path': TAGS_URL},
+                {'method': 'GET', 'path': ME_URL},
+            ])
+
+        crashed, me = res.json()
+        self.assertEqual(crashed, {'status': 500, 'body': None})
+        self.assertEqual(me['status'], 200)
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_batch_size_capped(self):
+        """Test batches over the limit are refused"""
+        res = self._batch([{'method': 'GET', 'path': ME_URL}] * 3)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_sub_requests(self):
+        """Test empty batches, other paths and nested batches are refused"""
+        for requests in (
+            [],
+            [{'method': 'GET', 'path': '/admin/'}],
+            [{'method': 'POST', 'path': BATCH_URL, 'body': []}],
+            [{'method': 'TRACE', 'path': ME_URL}],
+        ):
+            res = self._batch(requests)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,10 +1,20 @@
-from unittest.mock import patch
+from io import StringIO
+from unittest.mock import MagicMock, patch
+import json
+import os
+import tempfile
 
 from psycopg2 import OperationalError as Psycopg2Error
 
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections, models
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.management.commands.seed_data import zipf_sizes
+from core.models import Recipe
+from core.throttling import ScopedBucketThrottle
 
 
 # Mock the check method of the Command
@@ -35,3 +45,200 @@ class CommandTests(SimpleTestCase):
         # Verify that the check method was called 6 times
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+    @patch('time.sleep')
+    def test_wait_for_db_backoff(self, patched_sleep, patched_check):
+        """Test the delay between attempts grows up to the maximum"""
+        patched_check.side_effect = [OperationalError] * 6 + [True]
+
+        with patch('random.uniform', return_value=1):
+            call_command('wait_for_db', max_delay=1, stdout=StringIO())
+
+        delays = [c.args[0] for c in patched_sleep.call_args_list]
+        self.assertEqual(delays, [0.1, 0.2, 0.4, 0.8, 1, 1])
+
+    @patch('time.sleep')
+    def test_wait_for_db_timeout(self, patched_sleep, patched_check):
+        """Test the command gives up after the timeout"""
+        patched_check.side_effect = OperationalError
+
+        with patch('time.monotonic', side_effect=[0, 1, 2, 3]):
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout=2, stdout=StringIO())
+
+
+@patch('core.management.commands.prepare_release.call_command')
+class PrepareReleaseCommandTests(TestCase):
+    """Test the release preparation command"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def _prepare(self, **options):
+        with override_settings(STATIC_ROOT=self.tmpdir.name):
+            call_command('prepare_release', stdout=StringIO(), **options)
+
+    def test_skips_unchanged_static_files(self, patched_call):
+        """Test collectstatic only runs when static sources change"""
+        self._prepare()
+        self._prepare()
+
+        commands = [c.args[0] for c in patched_call.call_args_list]
+        self.assertEqual(commands, ['collectstatic'])
+
+    def test_force_runs_everything(self, patched_call):
+        """Test --force collects static files and migrates"""
+        self._prepare()
+        self._prepare(force=True)
+
+        commands = [c.args[0] for c in patched_call.call_args_list]
+        self.assertEqual(commands, ['collectstatic', 'collectstatic',
+                                    'migrate'])
+
+    def test_migrates_when_plan_not_empty(self, patched_call):
+        """Test migrate runs when there are unapplied migrations"""
+        with patch(
+            'core.management.commands.prepare_release.MigrationExecutor'
+            '.migration_plan',
+            return_value=[('migration', False)],
+        ):
+            self._prepare()
+
+        commands = [c.args[0] for c in patched_call.call_args_list]
+        self.assertIn('migrate', commands)
+
+    @override_settings(DATABASE_SHARDS=['default', 'shard1'])
+    def test_migrates_every_shard_needing_it(self, patched_call):
+        """Test each shard is checked and migrated on its own"""
+        def executor(connection):
+            plan = [] if connection.alias == 'default' else [('m', False)]
+            return MagicMock(**{'migration_plan.return_value': plan})
+
+        databases = {
+            'default': connections['default'],
+            'shard1': MagicMock(alias='shard1'),
+        }
+        with patch(
+            'core.management.commands.prepare_release.MigrationExecutor',
+            side_effect=executor,
+        ), patch(
+            'core.management.commands.prepare_release.connections',
+            databases,
+        ):
+            self._prepare()
+
+        migrations = [
+            c for c in patched_call.call_args_list if c.args[0] == 'migrate'
+        ]
+        self.assertEqual(len(migrations), 1)
+        self.assertEqual(migrations[0].kwargs['database'], 'shard1')
+
+
+class BenchCommandTests(TestCase):
+    """Test the benchmark command"""
+
+    def test_bench_reports_every_endpoint(self):
+        """Test bench reports latency, queries and memory per endpoint"""
+        out = StringIO()
+        call_command(
+            'bench',
+            users=1,
+            recipes=3,
+            tags=2,
+            ingredients=2,
+            iterations=2,
+            in_place=True,
+            stdout=out,
+        )
+
+        report = json.loads(out.getvalue())
+        self.assertIn('GET recipe:recipe-list', report['endpoints'])
+        self.assertIn('POST user:token', report['endpoints'])
+        for result in report['endpoints'].values():
+            for key in ['p50_ms', 'p95_ms', 'p99_ms', 'queries',
+                        'sql_ms', 'peak_memory_bytes']:
+                self.assertIn(key, result)
+
+    @patch.dict(ScopedBucketThrottle.THROTTLE_RATES, {
+        'login': '1/hour', 'signup': '1/hour', 'recipe-write': '1/hour',
+    })
+    def test_bench_ignores_throttling(self):
+        """Test bench runs with throttling on, as it is by default"""
+        throttle_file = os.path.join(tempfile.mkdtemp(), 'buckets.db')
+        out = StringIO()
+        with self.settings(THROTTLE_ENABLED=True, THROTTLE_FILE=throttle_file):
+            call_command(
+                'bench', users=1, recipes=1, tags=1, ingredients=1,
+                iterations=2, in_place=True, stdout=out,
+            )
+
+        report = json.loads(out.getvalue())
+        self.assertIn('PATCH recipe:recipe-detail', report['endpoints'])
+
+
+class SeedDataCommandTests(TestCase):
+    """Test the synthetic data generator"""
+
+    def _seed(self, prefix):
+        call_command(
+            'seed_data',
+            seed=7,
+            users=6,
+            max_recipes=20,
+            heavy_users=1,
+            vocabulary=30,
+            email_prefix=prefix,
+            stdout=StringIO(),
+        )
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe__user__email__startswith=prefix
+        ).values_list('recipe__user__email', 'recipe__title', 'tag__name')
+        return sorted(
+            (email[len(prefix):], title, tag)
+            for email, title, tag in recipe_tags
+        )
+
+    def test_zipf_sizes(self):
+        """Test heavy users get the maximum and the rest decay"""
+        sizes = zipf_sizes(5, 100, 1.0, heavy=2)
+
+        self.assertEqual(sizes, [100, 100, 50, 33, 25])
+
+    def test_seed_data_is_deterministic(self):
+        """Test the same seed produces the same dataset"""
+        first = self._seed('a-')
+        second = self._seed('b-')
+
+        self.assertTrue(first)
+        self.assertEqual(first, second)
+
+    def test_join_rows_stay_within_owner(self):
+        """Test recipes only link tags and ingredients of their owner"""
+        self._seed('seed-')
+
+        self.assertFalse(
+            Recipe.tags.through.objects.exclude(
+                tag__user=models.F('recipe__user')
+            ).exists()
+        )
+        self.assertFalse(
+            Recipe.ingredients.through.objects.exclude(
+                ingredient__user=models.F('recipe__user')
+            ).exists()
+        )
+
+
+class ImportTimeCommandTests(SimpleTestCase):
+    """Test the import time report"""
+
+    def test_import_time_reports_modules_and_warmup(self):
+        """Test the report lists the slowest imports and warmup steps"""
+        out = StringIO()
+
+        call_command('import_time', limit=5, json=True, stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(len(report['top']), 5)
+        self.assertEqual(report['top'][0]['module'], 'app.wsgi')
+        self.assertIn('serializers', report['warmup_ms'])
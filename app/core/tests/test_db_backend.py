@@ -0,0 +1,98 @@
+"""
+Tests for the health-checked PostgreSQL backend
+"""
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+
+from core.db.postgresql.base import DatabaseWrapper
+
+
+def make_wrapper(**settings):
+    settings_dict = {
+        'NAME': 'app', 'USER': '', 'PASSWORD': '', 'HOST': '', 'PORT': '',
+        'OPTIONS': {}, 'TIME_ZONE': None, 'AUTOCOMMIT': True,
+        'ATOMIC_REQUESTS': False, 'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True, 'CONN_MAX_AGE_JITTER': 0.2, 'TEST': {},
+    }
+    settings_dict.update(settings)
+    return DatabaseWrapper(settings_dict, alias='backend-test')
+
+
+@patch.object(DatabaseWrapper, 'init_connection_state')
+@patch.object(DatabaseWrapper, 'get_new_connection')
+class DatabaseWrapperTests(SimpleTestCase):
+    """Test reusing, checking and expiring connections"""
+
+    def _connect(self, wrapper):
+        with patch('core.db.postgresql.base.time.monotonic',
+                   return_value=1000.0):
+            wrapper.connect()
+
+    def test_max_age_is_jittered(self, patched_new, patched_init):
+        """Test connections expire within the jitter window"""
+        patched_new.return_value = MagicMock(autocommit=True)
+        wrapper = make_wrapper()
+
+        with patch('core.db.postgresql.base.random.uniform',
+                   return_value=0.1) as patched_uniform:
+            self._connect(wrapper)
+
+        patched_uniform.assert_called_once_with(0, 0.2)
+        self.assertEqual(wrapper.close_at, 1000.0 + 600 - 60)
+
+    def test_reused_connection_is_checked_once(
+            self, patched_new, patched_init):
+        """Test a reused connection is checked on first use per request"""
+        patched_new.return_value = MagicMock(autocommit=True)
+        wrapper = make_wrapper()
+        wrapper.ensure_connection()
+        wrapper.close_if_unusable_or_obsolete()
+
+        with patch.object(wrapper, 'is_usable',
+                          return_value=True) as patched_usable:
+            wrapper.ensure_connection()
+            wrapper.ensure_connection()
+
+        patched_usable.assert_called_once()
+        patched_new.assert_called_once()
+
+    def test_failed_health_check_reconnects(
+            self, patched_new, patched_init):
+        """Test a dead connection is replaced before it is used"""
+        patched_new.return_value = MagicMock(autocommit=True)
+        wrapper = make_wrapper()
+        wrapper.ensure_connection()
+        dead = wrapper.connection
+        wrapper.close_if_unusable_or_obsolete()
+
+        with patch.object(wrapper, 'is_usable', return_value=False):
+            wrapper.ensure_connection()
+
+        dead.close.assert_called_once()
+        self.assertEqual(patched_new.call_count, 2)
+
+    def test_health_checks_can_be_disabled(
+            self, patched_new, patched_init):
+        """Test connections are reused blindly without health checks"""
+        patched_new.return_value = MagicMock(autocommit=True)
+        wrapper = make_wrapper(CONN_HEALTH_CHECKS=False)
+        wrapper.ensure_connection()
+        wrapper.close_if_unusable_or_obsolete()
+
+        with patch.object(wrapper, 'is_usable') as patched_usable:
+            wrapper.ensure_connection()
+
+        patched_usable.assert_not_called()
+
+    def test_expired_connection_is_closed(self, patched_new, patched_init):
+        """Test connections past their max age close between requests"""
+        patched_new.return_value = MagicMock(autocommit=True)
+        wrapper = make_wrapper(CONN_MAX_AGE_JITTER=0)
+        self._connect(wrapper)
+
+        with patch('core.db.postgresql.base.time.monotonic',
+                   return_value=1600.0):
+            wrapper.close_if_unusable_or_obsolete()
+
+        self.assertIsNone(wrapper.connection)
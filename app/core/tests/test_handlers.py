@@ -0,0 +1,107 @@
+"""
+Tests for the route-aware WSGI handler
+"""
+from io import StringIO
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.db import close_old_connections
+from django.conf import settings
+from django.test import RequestFactory, TestCase, override_settings
+
+from rest_framework.authtoken.models import Token
+
+from core.handlers import RouteAwareWSGIHandler
+
+
+class StackMarkerMiddleware:
+    """Mark responses that went through the stack it is part of"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        response['X-Stack'] = 'api'
+        return response
+
+
+class RouteAwareWSGIHandlerTests(TestCase):
+    """Test requests are dispatched to the right middleware stack"""
+
+    def setUp(self):
+        # Keep the test transaction's connection open, as the test client
+        # does.
+        request_started.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.handler = RouteAwareWSGIHandler()
+        self.factory = RequestFactory()
+
+    def _call(self, path, **extra):
+        result = {}
+
+        def start_response(status, headers):
+            result['status'] = status
+            result['headers'] = dict(headers)
+
+        environ = self.factory.get(path, **extra).environ
+        response = self.handler(environ, start_response)
+        result['body'] = b''.join(response)
+        response.close()
+        return result
+
+    def test_api_requests_skip_session_middleware(self):
+        """Test token-authenticated API requests use the lean stack"""
+        user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        token = Token.objects.create(user=user)
+
+        res = self._call(
+            '/api/user/me', HTTP_AUTHORIZATION=f'Token {token.key}'
+        )
+
+        self.assertEqual(res['status'], '200 OK')
+        self.assertEqual(json.loads(res['body'])['email'], user.email)
+        self.assertNotIn('Cookie', res['headers'].get('Vary', ''))
+
+    def test_admin_keeps_full_stack(self):
+        """Test the admin still gets sessions and CSRF"""
+        res = self._call('/admin/login/')
+
+        self.assertEqual(res['status'], '200 OK')
+        self.assertIn('csrftoken', res['headers'].get('Set-Cookie', ''))
+
+    def test_api_requests_use_api_middleware(self):
+        """Test /api/ requests run through API_MIDDLEWARE only"""
+        marker = 'core.tests.test_handlers.StackMarkerMiddleware'
+        middleware = list(settings.MIDDLEWARE)
+        with override_settings(
+            API_MIDDLEWARE=[*settings.API_MIDDLEWARE, marker],
+        ):
+            self.handler = RouteAwareWSGIHandler()
+
+        api = self._call('/api/health-check/')
+        admin = self._call('/admin/login/')
+
+        self.assertEqual(api['headers'].get('X-Stack'), 'api')
+        self.assertNotIn('X-Stack', admin['headers'])
+        self.assertEqual(settings.MIDDLEWARE, middleware)
+
+    def test_stacks_differ(self):
+        """Test the API stack leaves out session and CSRF middleware"""
+        self.assertTrue(self.handler.full_handler._view_middleware)
+        self.assertFalse(self.handler.api_handler._view_middleware)
+
+    def test_bench_middleware_command(self):
+        """Test the middleware benchmark reports both stacks"""
+        out = StringIO()
+
+        call_command('bench_middleware', iterations=5, stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertIn('full_stack_us', report)
+        self.assertIn('api_stack_us', report)
@@ -0,0 +1,160 @@
+"""
+Tests for password hashing on the bounded executor
+"""
+import fcntl
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import hashing
+
+TOKEN_URL = reverse('user:token')
+
+
+def block_executor():
+    """Occupy every executor thread until the returned event is set"""
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def hold():
+        started.release()
+        release.wait()
+
+    def occupy():
+        try:
+            hashing.run(hold)
+        except hashing.HashingBusy:
+            # Tests with a short timeout stop waiting, the hash runs on.
+            pass
+
+    threads = []
+    for _ in range(hashing.settings.PASSWORD_HASHING_THREADS):
+        thread = threading.Thread(target=occupy)
+        thread.start()
+        started.acquire()
+        threads.append(thread)
+    return release, threads
+
+
+@override_settings(
+    PASSWORD_HASH_ITERATIONS=1000,
+    PASSWORD_HASHING_THREADS=1,
+    PASSWORD_HASHING_QUEUE=0,
+    PASSWORD_HASHING_TIMEOUT=5,
+    PASSWORD_HASHING_HOST_SLOTS=2,
+    PASSWORD_HASHING_SLOTS_FILE=os.path.join(tempfile.mkdtemp(), 'slots'),
+)
+class HashingTests(TestCase):
+    """Test checking passwords on the hashing executor"""
+
+    def setUp(self):
+        # A fresh executor, sized by the settings above.
+        hashing._pool = (None, None, None, None)
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+
+    def tearDown(self):
+        hashing._pool = (None, None, None, None)
+
+    def test_login(self):
+        """Test valid credentials authenticate and wrong ones don't"""
+        self.assertEqual(
+            authenticate(username='user@example.com', password='testpass123'),
+            self.user,
+        )
+        self.assertIsNone(
+            authenticate(username='user@example.com', password='wrong')
+        )
+        self.assertIsNone(
+            authenticate(username='other@example.com', password='wrong')
+        )
+
+    def test_outdated_hash_upgraded_on_login(self):
+        """Test hashes made with other parameters are replaced on login"""
+        self.assertIn('$1000$', self.user.password)
+
+        with self.settings(PASSWORD_HASH_ITERATIONS=1200):
+            authenticate(username='user@example.com', password='testpass123')
+
+        self.user.refresh_from_db()
+        self.assertIn('$1200$', self.user.password)
+        self.assertTrue(self.user.check_password('testpass123'))
+
+    def test_busy_executor_refuses_logins(self):
+        """Test logins get a 503 when the executor is full"""
+        release, threads = block_executor()
+        try:
+            res = APIClient().post(TOKEN_URL, {
+                'email': 'user@example.com',
+                'password': 'testpass123',
+            })
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '1')
+
+    def test_busy_executor_refuses_admin_logins(self):
+        """Test the admin shows a busy executor as a login error"""
+        release, threads = block_executor()
+        try:
+            res = self.client.post(reverse('admin:login'), {
+                'username': 'user@example.com',
+                'password': 'testpass123',
+            })
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertContains(res, 'Too many logins in progress')
+
+    @override_settings(PASSWORD_HASHING_HOST_SLOTS=1)
+    def test_host_slots_shared_between_processes(self):
+        """Test hashes fail fast while other workers hold every slot"""
+        self.assertTrue(hashing.run(lambda: True))
+        ready_read, ready_write = os.pipe()
+        done_read, done_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            fd = os.open(settings.PASSWORD_HASHING_SLOTS_FILE, os.O_RDWR)
+            fcntl.lockf(fd, fcntl.LOCK_EX, 1, 0)
+            os.write(ready_write, b'x')
+            os.read(done_read, 1)
+            os._exit(0)
+        try:
+            os.read(ready_read, 1)
+            with self.assertRaises(hashing.HashingBusy):
+                hashing.run(lambda: True)
+        finally:
+            os.write(done_write, b'x')
+            os.waitpid(pid, 0)
+
+        self.assertTrue(hashing.run(lambda: True))
+
+    @override_settings(PASSWORD_HASHING_QUEUE=1, PASSWORD_HASHING_TIMEOUT=0.05)
+    def test_queued_hash_times_out(self):
+        """Test a hash waiting too long for a thread is given up"""
+        release, threads = block_executor()
+        try:
+            with self.assertRaises(hashing.HashingBusy):
+                hashing.run(hashing.hashers.make_password, 'testpass123')
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertTrue(hashing.run(lambda: True))
@@ -0,0 +1,187 @@
+"""
+Tests for idempotency keys on recipe writes
+"""
+from datetime import timedelta
+from io import BytesIO, StringIO
+import os
+import tempfile
+from unittest.mock import patch
+import zlib
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import IdempotencyKey, Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+PAYLOAD = {'title': 'Soup', 'time_minutes': 5, 'price': '1.00'}
+
+
+def noise_image(name):
+    """Return an uploaded JPEG of random pixels, tens of kilobytes"""
+    image = Image.frombytes('RGB', (100, 100), os.urandom(100 * 100 * 3))
+    content = BytesIO()
+    image.save(content, format='JPEG')
+    return SimpleUploadedFile(name, content.getvalue(), 'image/jpeg')
+
+
+class IdempotencyTests(TestCase):
+    """Test replaying writes retried with the same Idempotency-Key"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _post(self, key, payload=PAYLOAD):
+        return self.client.post(
+            RECIPES_URL, payload, format='json', HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def _in_flight(self, key, fingerprint):
+        return IdempotencyKey.objects.create(
+            user=self.user, key=key, fingerprint=fingerprint,
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+
+    def test_retry_replays_first_response(self):
+        """Test a retried create returns the first response"""
+        first = self._post('key-1')
+        retry = self._post('key-1')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_other_keys_and_no_key_run_again(self):
+        """Test only requests with the same key are replayed"""
+        self._post('key-1')
+        self._post('key-2')
+        self.client.post(RECIPES_URL, PAYLOAD, format='json')
+
+        self.assertEqual(Recipe.objects.count(), 3)
+
+    def test_key_reused_for_other_request(self):
+        """Test a key sent with a different body is refused"""
+        self._post('key-1')
+        res = self._post('key-1', {**PAYLOAD, 'title': 'Stew'})
+
+        self.assertEqual(
+            res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    @patch('core.idempotency.fingerprint', return_value='request-hash')
+    @patch('core.idempotency.time.sleep')
+    def test_duplicate_waits_for_in_flight_request(
+        self, patched_sleep, patched_fingerprint
+    ):
+        """Test a duplicate waits for the first request's response"""
+        record = self._in_flight('key-1', 'request-hash')
+
+        def first_request_finishes(seconds):
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                status_code=201,
+                content_type='application/json',
+                body=zlib.compress(b'{"id": 7}'),
+            )
+
+        patched_sleep.side_effect = first_request_finishes
+        res = self._post('key-1')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.content, b'{"id": 7}')
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    @patch('core.idempotency.fingerprint', return_value='request-hash')
+    def test_in_flight_too_long(self, patched_fingerprint):
+        """Test a duplicate gets a 409 if the first request runs on"""
+        self._in_flight('key-1', 'request-hash')
+
+        res = self._post('key-1')
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Recipe.objects.exists())
+
+    @patch('recipe.views.RecipeViewSet.perform_create',
+           side_effect=RuntimeError)
+    def test_failed_request_releases_key(self, patched_create):
+        """Test a retry runs again after the first request crashed"""
+        with self.assertRaises(RuntimeError):
+            self._post('key-1')
+
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    @patch('core.idempotency.fingerprint', return_value='request-hash')
+    def test_expired_lease_taken_over(self, patched_fingerprint):
+        """Test a claim past its lease is taken over by a retry"""
+        record = self._in_flight('key-1', 'request-hash')
+        record.expires_at = timezone.now() - timedelta(seconds=1)
+        record.save()
+
+        res = self._post('key-1')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Recipe.objects.count(), 1)
+        record = IdempotencyKey.objects.get()
+        self.assertEqual(record.status_code, 201)
+        self.assertGreater(
+            record.expires_at, timezone.now() + timedelta(hours=1)
+        )
+
+    @override_settings(
+        DATA_UPLOAD_MAX_MEMORY_SIZE=1000,
+        MEDIA_ROOT=tempfile.mkdtemp(),
+    )
+    def test_image_upload_retry_replayed(self):
+        """Test image uploads are told apart by content, not body size"""
+        recipe = Recipe.objects.create(user=self.user, **PAYLOAD)
+        url = reverse('recipe:recipe-upload-image', args=[recipe.id])
+        image = noise_image('photo.jpg')
+
+        def upload(image):
+            image.seek(0)
+            return self.client.post(
+                url, {'image': image}, format='multipart',
+                HTTP_IDEMPOTENCY_KEY='key-1',
+            )
+
+        first = upload(image)
+        retry = upload(image)
+        other = upload(noise_image('photo.jpg'))
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(
+            other.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+
+    def test_purge_expired_keys(self):
+        """Test the purge command deletes expired keys only"""
+        self._in_flight('live', 'a')
+        expired = self._in_flight('expired', 'b')
+        expired.expires_at = timezone.now() - timedelta(seconds=1)
+        expired.save()
+
+        call_command('purge_idempotency_keys', stdout=StringIO())
+
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list('key', flat=True)),
+            ['live'],
+        )
@@ -0,0 +1,86 @@
+"""
+Tests for request instrumentation
+"""
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class RequestTimingMiddlewareTests(TestCase):
+    """Test the request timing middleware"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+            is_staff=True,
+        )
+        token = Token.objects.create(user=user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        """Test API responses to staff report per-phase timings"""
+        with self.assertLogs('core.instrumentation', level='INFO') as logs:
+            res = self.client.get(RECIPES_URL)
+
+        header = res['Server-Timing']
+        for name in ['auth', 'view', 'python', 'render', 'total', 'db']:
+            self.assertIn(f'{name};dur=', header)
+        self.assertIn('queries"', header)
+        self.assertIn('"route": "recipe:recipe-list"', logs.output[0])
+
+    def test_server_timing_off_by_default(self):
+        """Test the header is not sent unless turned on"""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn('Server-Timing', res)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_staff_only(self):
+        """Test other users do not get the header"""
+        user = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+
+        res = client.get(RECIPES_URL)
+
+        self.assertNotIn('Server-Timing', res)
+
+    def test_slow_requests_are_profiled(self):
+        """Test sampled requests over the threshold save a profile"""
+        with tempfile.TemporaryDirectory() as profile_dir:
+            with override_settings(
+                REQUEST_PROFILE_SAMPLE_RATE=1,
+                REQUEST_PROFILE_THRESHOLD_MS=0,
+                REQUEST_PROFILE_DIR=profile_dir,
+            ):
+                self.client.get(RECIPES_URL)
+
+            profiles = os.listdir(profile_dir)
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(profiles[0].endswith('.prof'))
+
+    def test_profiling_off_by_default(self):
+        """Test no profile is written when sampling is disabled"""
+        with tempfile.TemporaryDirectory() as profile_dir:
+            with override_settings(
+                REQUEST_PROFILE_SAMPLE_RATE=0,
+                REQUEST_PROFILE_THRESHOLD_MS=0,
+                REQUEST_PROFILE_DIR=profile_dir,
+            ):
+                self.client.get(RECIPES_URL)
+
+            self.assertEqual(os.listdir(profile_dir), [])
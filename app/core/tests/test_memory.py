@@ -0,0 +1,88 @@
+"""
+Tests for memory profiling
+"""
+import json
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import memory
+
+MEMORY_URL = reverse('memory-profile')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class MemoryProfileApiTests(TestCase):
+    """Test the memory profiling endpoint"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _enable(self):
+        memory.start(frames=1)
+        self.addCleanup(memory.stop)
+
+    def test_staff_required(self):
+        """Test non-staff users cannot read memory reports"""
+        res = self.client.get(MEMORY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_disabled_returns_not_found(self):
+        """Test the endpoint reports when profiling is off"""
+        self.user.is_staff = True
+        self.user.save()
+
+        res = self.client.get(MEMORY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_report_top_allocations(self):
+        """Test staff get the top allocation sites since the baseline"""
+        self.user.is_staff = True
+        self.user.save()
+        self._enable()
+        retained = [bytearray(1024) for _ in range(100)]
+
+        res = self.client.get(MEMORY_URL, {'limit': 5})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['pid'], os.getpid())
+        self.assertLessEqual(len(res.data['top']), 5)
+        self.assertIn('size_diff', res.data['top'][0])
+        self.assertTrue(retained)
+
+    def test_signal_handler_writes_report(self):
+        """Test the signal handler saves a report file"""
+        self._enable()
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            with override_settings(MEMORY_SNAPSHOT_DIR=snapshot_dir):
+                memory.write_report()
+
+            files = os.listdir(snapshot_dir)
+            self.assertEqual(len(files), 1)
+            with open(os.path.join(snapshot_dir, files[0])) as f:
+                self.assertIn('top', json.load(f))
+
+    @override_settings(MEMORY_PROFILING=True)
+    def test_peak_memory_recorded_for_tracked_routes(self):
+        """Test tracked routes report their peak memory"""
+        self._enable()
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.get(RECIPES_URL)
+
+        self.assertIn('X-Peak-Memory', res)
+        self.assertNotIn('X-Peak-Memory', client.get(MEMORY_URL))
@@ -0,0 +1,152 @@
+"""
+Tests for multi-process metrics
+"""
+from io import StringIO
+import json
+import os
+import tempfile
+import threading
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import metrics
+
+METRICS_URL = reverse('metrics')
+
+
+class MetricsStoreTests(SimpleTestCase):
+    """Test recording and aggregating metrics"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.override = override_settings(METRICS_DIR=self.tmpdir.name)
+        self.override.enable()
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+        self.override.disable()
+        self.tmpdir.cleanup()
+
+    def test_counter_aggregates_across_processes(self):
+        """Test counters of forked workers are summed"""
+        counter = metrics.Counter('test_forked', 'Test counter.', ['route'])
+        self.addCleanup(metrics.Metric.registry.remove, counter)
+        counter.labels('a').inc(2)
+
+        pid = os.fork()
+        if pid == 0:
+            counter.labels('a').inc(3)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), 2)
+        self.assertIn('test_forked_total{route="a"} 5.0', metrics.render())
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test histogram output uses cumulative buckets"""
+        histogram = metrics.Histogram(
+            'test_latency', 'Test histogram.', buckets=[0.1, 1.0]
+        )
+        self.addCleanup(metrics.Metric.registry.remove, histogram)
+        for value in [0.05, 0.5, 0.7, 5]:
+            histogram.observe(value)
+
+        output = metrics.render()
+
+        self.assertIn('test_latency_bucket{le="0.1"} 1.0', output)
+        self.assertIn('test_latency_bucket{le="1.0"} 3.0', output)
+        self.assertIn('test_latency_bucket{le="+Inf"} 4.0', output)
+        self.assertIn('test_latency_count 4.0', output)
+        self.assertIn('test_latency_sum 6.25', output)
+
+    def test_threads_do_not_lose_increments(self):
+        """Test concurrent increments from threads of a worker all count"""
+        counter = metrics.Counter('test_threads', 'Test counter.', ['n'])
+        self.addCleanup(metrics.Metric.registry.remove, counter)
+
+        def record():
+            for n in range(2000):
+                # New series grow the mapping while others increment.
+                counter.labels(n % 500).inc()
+                counter.labels('shared').inc()
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIn(
+            'test_threads_total{n="shared"} 8000.0', metrics.render()
+        )
+
+    def test_store_adds_segments(self):
+        """Test new segments are mapped when many series are recorded"""
+        counter = metrics.Counter('test_many', 'Test counter.', ['n'])
+        self.addCleanup(metrics.Metric.registry.remove, counter)
+        for n in range(3000):
+            counter.labels(n).inc()
+
+        self.assertIn('test_many_total{n="2999"} 1.0', metrics.render())
+        self.assertGreater(len(os.listdir(self.tmpdir.name)), 1)
+
+    def test_bench_metrics_command(self):
+        """Test the benchmark reports the cost of each update"""
+        out = StringIO()
+
+        call_command('bench_metrics', iterations=10, stdout=out)
+
+        result = json.loads(out.getvalue())
+        self.assertGreater(result['counter_inc_ns'], 0)
+        self.assertGreater(result['histogram_observe_ns'], 0)
+
+
+class MetricsApiTests(TestCase):
+    """Test the metrics endpoint"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.override = override_settings(
+            METRICS_DIR=self.tmpdir.name, METRICS_TOKEN='secret'
+        )
+        self.override.enable()
+        metrics.reset()
+        self.client = APIClient()
+
+    def tearDown(self):
+        metrics.reset()
+        self.override.disable()
+        self.tmpdir.cleanup()
+
+    def test_request_latency_recorded_by_route(self):
+        """Test requests are recorded under their route name"""
+        self.client.get(reverse('health-check'))
+
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer secret')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            'http_request_duration_seconds_count'
+            '{route="health-check",method="GET"} 1.0',
+            res.content.decode(),
+        )
+
+    def test_metrics_token_required(self):
+        """Test the endpoint requires the configured token"""
+        for header in ('', 'Bearer wrong', 'Bearer secret2'):
+            res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION=header)
+
+            self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_no_token_configured(self):
+        """Test the endpoint is closed when no token is configured"""
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer ')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
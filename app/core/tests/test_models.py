@@ -4,7 +4,9 @@ Tests for models
 from unittest.mock import patch
 from decimal import Decimal
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 
 from core import models
@@ -96,4 +98,96 @@ class ModelTests(TestCase):
         mock_uuid.return_value = uuid
         file_path = models.recipe_image_file_path(None, 'example.jpg')
 
-        self.assertEqual(file_path, f'uploads/recipe/{uuid}.jpg')
\ No newline at end of file
+        self.assertEqual(file_path, f'uploads/recipe/{uuid}.jpg')
+
+
+class DirtyFieldsTests(TestCase):
+    """Test saving only the changed fields of a model"""
+
+    def setUp(self):
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='Soup',
+            time_minutes=5,
+            price=Decimal('1.00'),
+            description='A long description',
+        )
+        self.recipe = models.Recipe.objects.get(pk=recipe.pk)
+
+    def _updates(self, func):
+        with CaptureQueriesContext(connection) as captured:
+            func()
+        return [
+            query['sql'] for query in captured.captured_queries
+            if query['sql'].startswith('UPDATE')
+        ]
+
+    def test_changed_fields(self):
+        """Test only fields set to new values count as changed"""
+        self.recipe.title = 'Stew'
+        self.recipe.price = Decimal('1.0')
+        self.recipe.description = 'A long description'
+
+        self.assertEqual(self.recipe.changed_fields(), ['title'])
+
+    def test_values_prepared_only_when_compared(self):
+        """Test loading rows prepares no values, comparing them does"""
+        with patch.object(
+            models.Recipe._meta.get_field('price'), 'get_prep_value',
+            wraps=models.Recipe._meta.get_field('price').get_prep_value,
+        ) as patched_prep:
+            recipe = models.Recipe.objects.get(pk=self.recipe.pk)
+            self.assertEqual(patched_prep.call_count, 0)
+
+            recipe.price = '1.00'
+            self.assertEqual(recipe.changed_fields(), [])
+            self.assertEqual(patched_prep.call_count, 2)
+
+    def test_only_changed_columns_written(self):
+        """Test saving writes the changed fields and updated_at only"""
+        before = self.recipe.updated_at
+        self.recipe.title = 'Stew'
+
+        updates = self._updates(self.recipe.save_changes)
+
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"title"', updates[0])
+        self.assertIn('"updated_at"', updates[0])
+        self.assertNotIn('"description"', updates[0])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'Stew')
+        self.assertGreater(self.recipe.updated_at, before)
+        self.assertEqual(self.recipe.changed_fields(), [])
+
+    def test_unchanged_save_skipped(self):
+        """Test saving an unchanged instance runs no UPDATE"""
+        self.recipe.title = 'Soup'
+
+        with self.assertNumQueries(0):
+            self.assertFalse(self.recipe.save_changes())
+
+        updates = self._updates(
+            lambda: self.recipe.save_changes(touch=True)
+        )
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"title"', updates[0])
+
+    def test_deferred_fields_tracked_once_loaded(self):
+        """Test fields loaded later are tracked too"""
+        recipe = models.Recipe.objects.defer('description').get()
+
+        self.assertEqual(recipe.changed_fields(), [])
+        recipe.description = 'Shorter'
+        self.assertEqual(recipe.changed_fields(), ['description'])
+
+    def test_new_instances_saved_in_full(self):
+        """Test instances not loaded from the database are not tracked"""
+        recipe = models.Recipe(
+            user=self.recipe.user, title='Stew', time_minutes=5,
+            price=Decimal('2.00'),
+        )
+
+        self.assertIsNone(recipe.changed_fields())
+        self.assertTrue(recipe.save_changes())
+        self.assertEqual(recipe.changed_fields(), [])
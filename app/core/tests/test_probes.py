@@ -0,0 +1,100 @@
+"""
+Tests for the liveness and readiness probes
+"""
+import json
+import tempfile
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase, override_settings
+
+from core import probes
+
+
+def call_probe(path):
+    """Call the probe application and return the status and body"""
+    django_app = MagicMock()
+    start_response = MagicMock()
+    app = probes.ProbeWSGIApplication(django_app)
+
+    body = app({'PATH_INFO': path}, start_response)
+
+    django_app.assert_not_called()
+    status = start_response.call_args[0][0]
+    return status, json.loads(b''.join(body))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ProbeTests(TestCase):
+    """Test the probes answered in front of Django"""
+
+    def setUp(self):
+        probes._cached = (0.0, None)
+        probes._migrated = False
+
+    def test_liveness(self):
+        """Test the liveness probe answers without touching Django"""
+        status, body = call_probe(probes.LIVENESS_PATH)
+
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(body, {'healthy': True})
+
+    def test_readiness(self):
+        """Test readiness reports every check"""
+        status, body = call_probe(probes.READINESS_PATH)
+
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(
+            body['checks'],
+            {'database': True, 'media': True, 'migrations': True},
+        )
+
+    @patch('core.probes.check_migrations', side_effect=Exception)
+    def test_readiness_failure(self, patched_check):
+        """Test a failing check makes the probe return 503"""
+        with patch.dict(probes.CHECKS, migrations=patched_check):
+            status, body = call_probe(probes.READINESS_PATH)
+
+        self.assertEqual(status, '503 Service Unavailable')
+        self.assertFalse(body['checks']['migrations'])
+
+    @override_settings(DATABASE_SHARDS=['default', 'shard_1'])
+    @patch('core.probes.connections')
+    @patch('core.probes.MigrationExecutor')
+    def test_migrations_checked_on_every_shard(
+        self, patched_executor, patched_connections
+    ):
+        """Test a shard behind on migrations fails the check until done"""
+        pending = {'shard_1': [('core', '0009')]}
+
+        def executor(connection):
+            return MagicMock(**{
+                'migration_plan.return_value': pending.get(connection, []),
+            })
+
+        patched_connections.__getitem__.side_effect = lambda alias: alias
+        patched_executor.side_effect = executor
+
+        self.assertFalse(probes.check_migrations())
+        pending.clear()
+        self.assertTrue(probes.check_migrations())
+        self.assertEqual(patched_executor.call_count, 4)
+
+        self.assertTrue(probes.check_migrations())
+        self.assertEqual(patched_executor.call_count, 4)
+
+    def test_readiness_is_cached(self):
+        """Test repeated probes reuse the cached result"""
+        with patch('core.probes.run_checks', return_value={'x': True}) as run:
+            call_probe(probes.READINESS_PATH)
+            call_probe(probes.READINESS_PATH)
+
+        run.assert_called_once()
+
+    def test_other_paths_reach_django(self):
+        """Test the wrapper passes other requests through"""
+        django_app = MagicMock(return_value=[b'ok'])
+        app = probes.ProbeWSGIApplication(django_app)
+
+        app({'PATH_INFO': '/api/health-check/'}, MagicMock())
+
+        django_app.assert_called_once()
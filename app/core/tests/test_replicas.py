@@ -0,0 +1,143 @@
+"""
+Tests for read-replica routing
+"""
+import os
+import tempfile
+import time
+from unittest.mock import MagicMock, patch
+
+from django.conf import settings
+from django.db import router
+from django.db.utils import OperationalError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core.db import replicas
+from core.models import Recipe
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica1'],
+    REPLICA_PIN_SECONDS=5,
+    REPLICA_RETRY_SECONDS=30,
+    REPLICA_PIN_FILE=os.path.join(tempfile.mkdtemp(), 'pins.db'),
+    REPLICA_PIN_SLOTS=64,
+)
+@patch('core.db.replicas.replica_available', return_value=True)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Test choosing the database reads go to"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        replicas.reset()
+        self.addCleanup(replicas.reset)
+        if os.path.exists(settings.REPLICA_PIN_FILE):
+            os.remove(settings.REPLICA_PIN_FILE)
+
+    def _read_db(self, request, write=False):
+        """Return the read alias seen by the view, and the response"""
+        seen = {}
+
+        def view(request):
+            if write:
+                router.db_for_write(Recipe)
+            seen['db'] = Recipe.objects.all().db
+            return HttpResponse(status=201 if write else 200)
+
+        response = replicas.ReplicaRoutingMiddleware(view)(request)
+        return seen['db'], response
+
+    def test_safe_requests_read_from_replica(self, patched_available):
+        """Test GET requests read from the replica"""
+        db, res = self._read_db(self.factory.get('/api/recipe/recipes/'))
+
+        self.assertEqual(db, 'replica1')
+        self.assertNotIn(replicas.PIN_COOKIE, res.cookies)
+        self.assertEqual(Recipe.objects.all().db, 'default')
+
+    def test_writes_pin_the_client(self, patched_available):
+        """Test writes read from the primary and set the pin cookie"""
+        db, res = self._read_db(
+            self.factory.post('/api/recipe/recipes/'), write=True
+        )
+
+        self.assertEqual(db, 'default')
+        self.assertEqual(res.cookies[replicas.PIN_COOKIE]['max-age'], 5)
+
+    def test_pinned_client_reads_from_primary(self, patched_available):
+        """Test reads right after a write stay on the primary"""
+        request = self.factory.get('/api/recipe/recipes/')
+        request.COOKIES[replicas.PIN_COOKIE] = str(time.time() + 4)
+
+        db, res = self._read_db(request)
+
+        self.assertEqual(db, 'default')
+
+    def test_token_clients_pinned_without_cookie(self, patched_available):
+        """Test a token's writes pin its reads, whatever the cookies"""
+        self._read_db(
+            self.factory.post(
+                '/api/recipe/recipes/', HTTP_AUTHORIZATION='Token abc'
+            ),
+            write=True,
+        )
+
+        same, _ = self._read_db(self.factory.get(
+            '/api/recipe/recipes/', HTTP_AUTHORIZATION='Token abc'
+        ))
+        other, _ = self._read_db(self.factory.get(
+            '/api/recipe/recipes/', HTTP_AUTHORIZATION='Token xyz'
+        ))
+
+        self.assertEqual(same, 'default')
+        self.assertEqual(other, 'replica1')
+
+    def test_pin_cannot_outlast_the_window(self, patched_available):
+        """Test a forged far-future pin is ignored"""
+        request = self.factory.get('/api/recipe/recipes/')
+        request.COOKIES[replicas.PIN_COOKIE] = str(time.time() + 3600)
+
+        db, res = self._read_db(request)
+
+        self.assertEqual(db, 'replica1')
+
+    def test_write_during_read_request_switches_to_primary(
+            self, patched_available):
+        """Test a request reads its own writes"""
+        db, res = self._read_db(
+            self.factory.get('/api/recipe/recipes/'), write=True
+        )
+
+        self.assertEqual(db, 'default')
+
+    def test_unavailable_replica_falls_back(self, patched_available):
+        """Test reads go to the primary when no replica is reachable"""
+        patched_available.return_value = False
+
+        db, res = self._read_db(self.factory.get('/api/recipe/recipes/'))
+
+        self.assertEqual(db, 'default')
+
+    def test_replicas_are_not_migrated(self, patched_available):
+        """Test migrations only run on the primary"""
+        self.assertFalse(router.allow_migrate('replica1', 'core'))
+        self.assertTrue(router.allow_migrate('default', 'core'))
+
+
+@override_settings(REPLICA_RETRY_SECONDS=30)
+class ReplicaAvailabilityTests(SimpleTestCase):
+    """Test detecting unreachable replicas"""
+
+    def tearDown(self):
+        replicas._down_until.clear()
+
+    def test_failed_replica_is_skipped_until_retry(self):
+        """Test a replica that failed to connect is not retried at once"""
+        replica = MagicMock()
+        replica.ensure_connection.side_effect = OperationalError
+
+        with patch('core.db.replicas.connections', {'replica1': replica}):
+            self.assertFalse(replicas.replica_available('replica1'))
+            self.assertFalse(replicas.replica_available('replica1'))
+
+        replica.ensure_connection.assert_called_once()
@@ -0,0 +1,259 @@
+"""
+Tests for sharding recipe data by user
+"""
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.db import sharding
+from core.management.commands.bench import seed
+from core.models import Ingredient, Recipe, Tag, Tombstone
+
+# A second shard, configured by app.settings_test.
+SHARD = 'shard_test'
+HAS_SHARD = SHARD in settings.DATABASES
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class HashRingTests(SimpleTestCase):
+    """Test placing keys with consistent hashing"""
+
+    def test_keys_spread_over_shards(self):
+        """Test every shard gets a fair share of keys"""
+        ring = sharding.HashRing(['default', 'shard1', 'shard2'])
+
+        counts = {}
+        for key in range(3000):
+            shard = ring.shard_for(key)
+            counts[shard] = counts.get(shard, 0) + 1
+
+        self.assertEqual(set(counts), {'default', 'shard1', 'shard2'})
+        self.assertGreater(min(counts.values()), 600)
+
+    def test_adding_a_shard_moves_few_keys(self):
+        """Test only keys taken by the new shard change place"""
+        before = sharding.HashRing(['default', 'shard1'])
+        after = sharding.HashRing(['default', 'shard1', 'shard2'])
+
+        moved = [
+            key for key in range(3000)
+            if before.shard_for(key) != after.shard_for(key)
+        ]
+
+        self.assertTrue(all(after.shard_for(key) == 'shard2'
+                            for key in moved))
+        self.assertLess(len(moved), 1500)
+
+
+class ShardRouterTests(SimpleTestCase):
+    """Test routing sharded models"""
+
+    def test_sharded_models_follow_the_current_shard(self):
+        """Test recipe data goes to the shard set for the request"""
+        token = sharding._shard.set('shard1')
+        try:
+            self.assertEqual(Recipe.objects.all().db, 'shard1')
+            self.assertEqual(Recipe.tags.through.objects.all().db, 'shard1')
+            self.assertEqual(get_user_model().objects.all().db, 'default')
+        finally:
+            sharding._shard.reset(token)
+
+        self.assertEqual(Recipe.objects.all().db, 'default')
+
+    def test_users_are_read_from_default(self):
+        """Test the owner of a sharded row is looked up on default"""
+        tag = Tag(name='Vegan')
+        tag._state.db = 'shard1'
+
+        self.assertEqual(
+            sharding.ShardRouter().db_for_read(
+                get_user_model(), instance=tag
+            ),
+            'default',
+        )
+
+    def test_relations_within_one_shard_only(self):
+        """Test rows on different shards cannot be related"""
+        router = sharding.ShardRouter()
+        recipe, tag = Recipe(), Tag()
+        recipe._state.db, tag._state.db = 'shard1', 'shard2'
+        user = get_user_model()()
+        user._state.db = 'default'
+
+        self.assertFalse(router.allow_relation(recipe, tag))
+        self.assertTrue(router.allow_relation(recipe, user))
+
+
+class ShardedViewTests(TestCase):
+    """Test views of sharded data"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_writes_refused_while_moving(self):
+        """Test writes get a 503 while the user's data is moved"""
+        self.user.shard_moving = True
+
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Soup', 'time_minutes': 5, 'price': '1.00',
+        })
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '5')
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_writes_recheck_the_stored_shard(self):
+        """Test writes of a user loaded before a move started are refused"""
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            shard_moving=True
+        )
+
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Soup', 'time_minutes': 5, 'price': '1.00',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(DATABASE_SHARDS=['default', 'shard1'])
+    def test_new_users_are_placed_on_the_ring(self):
+        """Test new users get the shard picked by the ring"""
+        user = get_user_model().objects.create_user(
+            email='new@example.com',
+            password='testpass123',
+        )
+
+        user.refresh_from_db()
+        self.assertEqual(user.shard, sharding.ring_shard(user.pk))
+
+
+@skipUnless(HAS_SHARD, 'Needs the shard_test database of app.settings_test')
+@override_settings(DATABASE_SHARDS=['default', SHARD])
+class RebalanceUserCommandTests(TestCase):
+    """Test moving a user's data between shards"""
+    databases = {'default', SHARD} if HAS_SHARD else {'default'}
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Leek')
+        )
+
+    def test_user_data_is_moved(self):
+        """Test the user's rows are copied to the shard and removed"""
+        call_command(
+            'rebalance_user', self.user.email, to=SHARD, stdout=StringIO()
+        )
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.shard, SHARD)
+        self.assertFalse(self.user.shard_moving)
+        self.assertFalse(Recipe.objects.using('default').exists())
+        recipe = Recipe.objects.using(SHARD).get(user=self.user)
+        self.assertEqual(
+            [tag.name for tag in recipe.tags.all()], ['Vegan']
+        )
+        self.assertEqual(
+            [i.name for i in recipe.ingredients.all()], ['Leek']
+        )
+
+    def test_old_ids_are_tombstoned(self):
+        """Test syncing clients are told to drop the moved rows' old ids"""
+        recipe = Recipe.objects.get()
+        old_ids = {
+            ('recipe', recipe.id),
+            ('tag', Tag.objects.get().id),
+            ('ingredient', Ingredient.objects.get().id),
+            ('tag', 99),
+        }
+        Tombstone.objects.create(user=self.user, model='tag', object_id=99)
+
+        call_command(
+            'rebalance_user', self.user.email, to=SHARD, stdout=StringIO()
+        )
+
+        self.assertFalse(Tombstone.objects.using('default').exists())
+        tombstones = Tombstone.objects.using(SHARD).filter(user=self.user)
+        self.assertEqual(
+            set(tombstones.values_list('model', 'object_id')), old_ids
+        )
+        moved = Recipe.objects.using(SHARD).get(user=self.user)
+        for tombstone in tombstones:
+            self.assertLessEqual(tombstone.deleted_at, moved.updated_at)
+
+    def test_moved_user_is_served_from_shard(self):
+        """Test the API reads and writes a moved user's shard"""
+        call_command(
+            'rebalance_user', self.user.email, to=SHARD, stdout=StringIO()
+        )
+        self.user.refresh_from_db()
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.post(RECIPES_URL, {
+            'title': 'Stew', 'time_minutes': 5, 'price': '2.00',
+            'tags': [{'name': 'Vegan'}],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        res = client.get(RECIPES_URL)
+        self.assertEqual(
+            sorted(recipe['title'] for recipe in res.data), ['Soup', 'Stew']
+        )
+        self.assertEqual(Tag.objects.using(SHARD).count(), 1)
+
+
+@skipUnless(HAS_SHARD, 'Needs the shard_test database of app.settings_test')
+@override_settings(DATABASE_SHARDS=['default', SHARD])
+class BenchSeedTests(TestCase):
+    """Test the benchmark seeds users' data on their shards"""
+    databases = {'default', SHARD} if HAS_SHARD else {'default'}
+
+    def test_data_seeded_on_user_shards(self):
+        """Test each user's recipes, tags and links are on its shard"""
+        ctx = seed(users=6, recipes=3, tags=2, ingredients=2)
+
+        users = get_user_model().objects.all()
+        self.assertEqual(
+            {user.shard for user in users}, {'default', SHARD}
+        )
+        for user in users:
+            shard = sharding.shard_for_user(user)
+            other = SHARD if shard == 'default' else 'default'
+            recipes = Recipe.objects.using(shard).filter(user=user)
+            self.assertEqual(recipes.count(), 3)
+            self.assertEqual(
+                Recipe.tags.through.objects.using(shard).filter(
+                    recipe__user=user
+                ).count(),
+                3,
+            )
+            self.assertFalse(
+                Recipe.objects.using(other).filter(user=user).exists()
+            )
+        self.assertEqual(
+            ctx['recipe']._state.db, sharding.shard_for_user(ctx['user'])
+        )
@@ -0,0 +1,63 @@
+"""
+Tests for the tables shared by the workers of a host
+"""
+import os
+import struct
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+
+from core.shared_tables import SharedTable, key_hash
+
+
+class CountTable(SharedTable):
+    slot = struct.Struct('<Qq')
+    file_setting = 'THROTTLE_FILE'
+    slots_setting = 'THROTTLE_SLOTS'
+
+    def add(self, key):
+        hashed = key_hash(key)
+        with self.locked():
+            for offset, (slot_hash, count) in self.probe(hashed):
+                if slot_hash in (0, hashed):
+                    self.write(offset, hashed, count + 1)
+                    return count + 1
+
+
+class SharedTableTests(SimpleTestCase):
+    """Test the shared mapped table"""
+
+    def setUp(self):
+        path = os.path.join(tempfile.mkdtemp(), 'table.db')
+        settings = override_settings(THROTTLE_FILE=path, THROTTLE_SLOTS=16)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_key_hash_never_zero(self):
+        """Test keys never hash to the free slot marker"""
+        self.assertNotEqual(key_hash(''), 0)
+        self.assertEqual(key_hash('key'), key_hash('key'))
+
+    def test_tables_share_the_file(self):
+        """Test tables mapping the same file see each other's slots"""
+        worker1, worker2 = CountTable(), CountTable()
+
+        self.assertEqual(worker1.add('key'), 1)
+        self.assertEqual(worker2.add('key'), 2)
+
+        worker2.clear()
+        self.assertEqual(worker1.add('key'), 1)
+
+    def test_forked_worker_maps_again(self):
+        """Test a forked worker opens the file again and keeps its slots"""
+        table = CountTable()
+        table.add('key')
+
+        pid = os.fork()
+        if pid == 0:
+            mapped = table._mmap is None
+            os._exit(0 if mapped and table.add('key') == 2 else 1)
+        _, status = os.waitpid(pid, 0)
+
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertEqual(table.add('key'), 3)
@@ -0,0 +1,107 @@
+"""
+Tests for the slow query log
+"""
+from io import StringIO
+import json
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Recipe
+from core.slow_queries import fingerprint, normalize, read_only
+
+
+class NormalizeTests(SimpleTestCase):
+    """Test SQL fingerprinting and classification"""
+
+    def test_literals_and_in_lists_are_normalized(self):
+        """Test queries differing only in values share a fingerprint"""
+        first = normalize(
+            "SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'a'"
+        )
+        second = normalize(
+            "SELECT *  FROM t WHERE id IN (%s) AND name = 'it''s'"
+        )
+
+        self.assertEqual(
+            first, 'SELECT * FROM t WHERE id IN (...) AND name = ?'
+        )
+        self.assertEqual(fingerprint(first), fingerprint(second))
+
+    def test_only_read_only_selects_are_analyzed(self):
+        """Test SELECTs that lock or write are not run again"""
+        self.assertTrue(read_only('SELECT * FROM t WHERE id = %s'))
+        for sql in (
+            'SELECT * FROM t WHERE id = %s FOR UPDATE',
+            'SELECT * FROM t FOR NO KEY UPDATE',
+            'SELECT * FROM t FOR SHARE',
+            'SELECT * INTO copy FROM t',
+            "SELECT nextval('t_id_seq')",
+        ):
+            self.assertFalse(read_only(sql), sql)
+
+
+class SlowQueryLogTests(TestCase):
+    """Test logging and reporting slow queries"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.tmpdir.name, 'slow.jsonl')
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _run_slow_queries(self):
+        with override_settings(
+            SLOW_QUERY_THRESHOLD_MS=0.000001,
+            SLOW_QUERY_LOG=self.log,
+        ), self.assertLogs('core.slow_queries', level='WARNING'):
+            list(Recipe.objects.filter(user=self.user))
+            list(Recipe.objects.filter(user=self.user, id__in=[1, 2]))
+
+    def test_slow_select_is_logged_with_plan(self):
+        """Test slow SELECTs are logged with a plan and call site"""
+        self._run_slow_queries()
+
+        with open(self.log) as f:
+            entries = [json.loads(line) for line in f]
+        selects = [e for e in entries if e['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 2)
+        self.assertTrue(selects[0]['plan'])
+        self.assertIn('core/tests/test_slow_queries.py',
+                      selects[0]['stack'][-1])
+
+    def test_plan_taken_in_rolled_back_savepoint(self):
+        """Test EXPLAIN runs in a savepoint that is rolled back"""
+        with CaptureQueriesContext(connection) as captured:
+            self._run_slow_queries()
+
+        statements = [query['sql'] for query in captured.captured_queries]
+        explain = next(
+            i for i, sql in enumerate(statements) if sql.startswith('EXPLAIN')
+        )
+        self.assertTrue(statements[explain - 1].startswith('SAVEPOINT'))
+        self.assertTrue(
+            statements[explain + 1].startswith('ROLLBACK TO SAVEPOINT')
+        )
+
+    def test_report_aggregates_by_fingerprint(self):
+        """Test the report command groups queries by fingerprint"""
+        self._run_slow_queries()
+        self._run_slow_queries()
+        out = StringIO()
+
+        call_command('slow_queries', log=self.log, json=True, stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(len(report), 2)
+        self.assertEqual({stats['count'] for stats in report}, {2})
@@ -0,0 +1,253 @@
+"""
+Tests for the change feed of recipe data
+"""
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import sync
+from core.models import Ingredient, Recipe, Tag, Tombstone
+
+SYNC_URL = reverse('recipe:sync')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('2.50'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class CursorTests(SimpleTestCase):
+    """Test encoding feed positions"""
+
+    def test_cursor_round_trip(self):
+        """Test a cursor decodes to the position it was made from"""
+        position = sync.Position(timezone.now(), 2, 41)
+
+        self.assertEqual(
+            sync.decode_cursor(sync.encode_cursor(position)), position
+        )
+
+    def test_invalid_cursors(self):
+        """Test garbage and naive timestamps are refused"""
+        naive = sync.encode_cursor(sync.Position(
+            timezone.now().replace(tzinfo=None), 0, 1
+        ))
+        for cursor in ('garbage', 'a|b|c', naive):
+            with self.assertRaises(ValueError):
+                sync.decode_cursor(cursor)
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class SyncApiTests(TestCase):
+    """Test syncing a user's recipe data"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _sync(self, cursor=None):
+        params = {'since': cursor} if cursor else {}
+        res = self.client.get(SYNC_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def _changes(self, data):
+        return [
+            (change['type'], change['id'], change['deleted'])
+            for change in data['results']
+        ]
+
+    def test_auth_required(self):
+        """Test syncing needs authentication"""
+        res = APIClient().get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_full_sync_in_order(self):
+        """Test a first sync returns the user's objects, oldest first"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = create_recipe(user=self.user, description='Hearty')
+        recipe.tags.add(tag)
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        create_recipe(user=other)
+
+        data = self._sync()
+
+        self.assertEqual(
+            self._changes(data),
+            [('tag', tag.id, False), ('recipe', recipe.id, False)],
+        )
+        recipe_data = data['results'][1]['data']
+        self.assertEqual(recipe_data['description'], 'Hearty')
+        self.assertEqual(
+            recipe_data['tags'], [{'id': tag.id, 'name': 'Vegan'}]
+        )
+        self.assertFalse(data['has_more'])
+        self.assertTrue(data['cursor'])
+
+    def test_incremental_sync(self):
+        """Test a sync returns only what changed since the cursor"""
+        create_recipe(user=self.user, title='Kept')
+        changed = create_recipe(user=self.user, title='Changed')
+        deleted = Ingredient.objects.create(user=self.user, name='Leek')
+        cursor = self._sync()['cursor']
+
+        changed.title = 'Renamed'
+        changed.save()
+        deleted_id = deleted.id
+        deleted.delete()
+        data = self._sync(cursor)
+
+        self.assertEqual(self._changes(data), [
+            ('recipe', changed.id, False),
+            ('ingredient', deleted_id, True),
+        ])
+        self.assertEqual(data['results'][0]['data']['title'], 'Renamed')
+
+        data = self._sync(data['cursor'])
+        self.assertEqual(data['results'], [])
+        self.assertTrue(data['cursor'])
+
+    def test_deletes_through_the_api_are_tombstoned(self):
+        """Test deleting a recipe leaves a tombstone on its database"""
+        recipe = create_recipe(user=self.user)
+        recipe_id = recipe.id
+
+        res = self.client.delete(
+            reverse('recipe:recipe-detail', args=[recipe_id])
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        tombstone = Tombstone.objects.get()
+        self.assertEqual(
+            (tombstone.user, tombstone.model, tombstone.object_id),
+            (self.user, 'recipe', recipe_id),
+        )
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_pages_resume_from_cursor(self):
+        """Test a sync pages through changes with the same timestamp"""
+        now = timezone.now()
+        tags = [
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+            for i in range(3)
+        ]
+        recipe = create_recipe(user=self.user)
+        Tag.objects.update(updated_at=now)
+        Recipe.objects.update(updated_at=now)
+
+        first = self._sync()
+        second = self._sync(first['cursor'])
+
+        self.assertTrue(first['has_more'])
+        self.assertFalse(second['has_more'])
+        self.assertEqual(
+            self._changes(first) + self._changes(second),
+            [('tag', tag.id, False) for tag in tags]
+            + [('recipe', recipe.id, False)],
+        )
+
+    def test_deleting_user_leaves_no_tombstones(self):
+        """Test deleting a user tombstones none of their data"""
+        recipe = create_recipe(user=self.user)
+        Tag.objects.create(user=self.user, name='Vegan')
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+
+        self.user.delete()
+        Tag.objects.create(user=other, name='Vegan').delete()
+
+        self.assertFalse(Recipe.objects.filter(pk=recipe.pk).exists())
+        self.assertEqual(
+            list(Tombstone.objects.values_list('user', 'model')),
+            [(other.pk, 'tag')],
+        )
+
+    def test_recent_changes_held_back(self):
+        """Test changes younger than the settle window wait"""
+        create_recipe(user=self.user)
+
+        with self.settings(SYNC_SETTLE_SECONDS=60):
+            data = self._sync()
+        self.assertEqual(data['results'], [])
+
+        data = self._sync(data['cursor'])
+        self.assertEqual(len(data['results']), 1)
+
+    def test_idle_account_keeps_cursor(self):
+        """Test an account with only old changes can sync again"""
+        create_recipe(user=self.user)
+        Recipe.objects.update(updated_at=timezone.now() - timedelta(days=31))
+
+        with self.settings(SYNC_TOMBSTONE_TTL_DAYS=30):
+            first = self._sync()
+            second = self._sync(first['cursor'])
+
+        self.assertEqual(len(first['results']), 1)
+        self.assertEqual(second['results'], [])
+        self.assertFalse(second['has_more'])
+
+    def test_invalid_cursor(self):
+        """Test an invalid cursor is a client error"""
+        res = self.client.get(SYNC_URL, {'since': 'garbage'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_cursor(self):
+        """Test cursors older than the tombstones are refused"""
+        cursor = sync.encode_cursor(sync.Position(
+            timezone.now() - timedelta(days=31), 1, 1
+        ))
+
+        with self.settings(SYNC_TOMBSTONE_TTL_DAYS=30):
+            res = self.client.get(SYNC_URL, {'since': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+        self.assertEqual(res.data['detail'].code, 'cursor_expired')
+
+
+class PurgeTombstonesCommandTests(TestCase):
+    """Test deleting expired tombstones"""
+
+    @override_settings(SYNC_TOMBSTONE_TTL_DAYS=30)
+    def test_expired_tombstones_deleted(self):
+        """Test only tombstones older than the TTL are deleted"""
+        user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        Tombstone.objects.create(user=user, model='tag', object_id=1)
+        Tombstone.objects.create(
+            user=user, model='tag', object_id=2,
+            deleted_at=timezone.now() - timedelta(days=31),
+        )
+
+        call_command('purge_tombstones', stdout=StringIO())
+
+        self.assertEqual(
+            list(Tombstone.objects.values_list('object_id', flat=True)), [1]
+        )
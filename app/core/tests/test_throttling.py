@@ -0,0 +1,129 @@
+"""
+Tests for the token-bucket throttles
+"""
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import throttling
+
+TOKEN_URL = reverse('user:token')
+RECIPES_URL = reverse('recipe:recipe-list')
+RATES = {'login': '2/min', 'recipe-write': '1/hour'}
+
+
+def table_settings():
+    """Settings pointing the bucket table at a new temporary file"""
+    path = os.path.join(tempfile.mkdtemp(), 'buckets.db')
+    return override_settings(
+        THROTTLE_ENABLED=True, THROTTLE_FILE=path, THROTTLE_SLOTS=64,
+    )
+
+
+class BucketTableTests(SimpleTestCase):
+    """Test taking tokens from the shared buckets"""
+
+    def setUp(self):
+        settings = table_settings()
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    @patch('core.throttling.time.time', return_value=1000.0)
+    def test_burst_then_refill(self, patched_time):
+        """Test a full bucket allows a burst and refills over time"""
+        table = throttling.BucketTable()
+
+        self.assertEqual(table.take('key', 2, 0.5), 0)
+        self.assertEqual(table.take('key', 2, 0.5), 0)
+        self.assertEqual(table.take('key', 2, 0.5), 2.0)
+
+        patched_time.return_value = 1002.0
+        self.assertEqual(table.take('key', 2, 0.5), 0)
+        self.assertEqual(table.take('other', 2, 0.5), 0)
+
+    def test_buckets_shared_between_workers(self):
+        """Test tables mapping the same file share their buckets"""
+        worker1, worker2 = throttling.BucketTable(), throttling.BucketTable()
+
+        self.assertEqual(worker1.take('key', 1, 0.01), 0)
+        self.assertGreater(worker2.take('key', 1, 0.01), 0)
+
+    def test_full_table_recycles_slots(self):
+        """Test keys still get buckets when every slot is taken"""
+        table = throttling.BucketTable()
+
+        refused = [key for key in range(500) if table.take(str(key), 1, 1)]
+
+        self.assertEqual(refused, [])
+
+
+@patch.dict(throttling.ScopedBucketThrottle.THROTTLE_RATES, RATES)
+class ThrottledViewTests(TestCase):
+    """Test throttling the auth and write endpoints"""
+
+    def setUp(self):
+        settings = table_settings()
+        settings.enable()
+        self.addCleanup(settings.disable)
+        throttling.reset()
+        self.client = APIClient()
+
+    def test_login_throttled_per_ip(self):
+        """Test logins beyond the rate get a 429 without any query"""
+        payload = {'email': 'user@example.com', 'password': 'wrong'}
+        for _ in range(2):
+            res = self.client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with self.assertNumQueries(0):
+            res = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '30')
+
+        res = self.client.post(
+            TOKEN_URL, payload, REMOTE_ADDR='10.0.0.2'
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_spoofed_forwarded_for_ignored(self):
+        """Test addresses the client adds to X-Forwarded-For are ignored"""
+        payload = {'email': 'user@example.com', 'password': 'wrong'}
+        for spoofed in ('10.0.0.7', '10.0.0.8'):
+            res = self.client.post(
+                TOKEN_URL, payload,
+                HTTP_X_FORWARDED_FOR=f'{spoofed}, 192.0.2.1',
+            )
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(
+            TOKEN_URL, payload, HTTP_X_FORWARDED_FOR='10.0.0.9, 192.0.2.1'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_recipe_writes_throttled_per_user(self):
+        """Test only writes count against a user's bucket"""
+        user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(user)
+        payload = {'title': 'Soup', 'time_minutes': 5, 'price': '1.00'}
+
+        res = self.client.post(RECIPES_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        with self.assertNumQueries(0):
+            res = self.client.post(RECIPES_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,155 @@
+"""
+Tests for per-view statement timeouts
+"""
+from unittest import skipUnless
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.db import timeouts
+from recipe.views import RecipeViewSet
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class QueryCanceled(Exception):
+    """Stands in for psycopg2's QueryCanceled"""
+    pgcode = timeouts.QUERY_CANCELED
+
+
+def query_canceled():
+    """The error Django raises when Postgres cancels a statement"""
+    exc = OperationalError('canceling statement due to statement timeout')
+    exc.__cause__ = QueryCanceled()
+    return exc
+
+
+class SetLocalTimeoutTests(SimpleTestCase):
+    """Test setting the timeout with the first query"""
+
+    def test_timeout_set_once_before_first_query(self):
+        """Test SET LOCAL runs before the first query only"""
+        wrapper = timeouts.SetLocalTimeout(1500)
+        execute = MagicMock()
+        context = {'cursor': MagicMock()}
+
+        wrapper(execute, 'SELECT 1', None, False, context)
+        wrapper(execute, 'SELECT 2', None, False, context)
+
+        context['cursor'].cursor.execute.assert_called_once_with(
+            'SET LOCAL statement_timeout = %s', [1500]
+        )
+        self.assertEqual(execute.call_count, 2)
+
+    def test_statement_timeout_detected(self):
+        """Test only cancelled statements count as timeouts"""
+        self.assertTrue(timeouts.is_statement_timeout(query_canceled()))
+        self.assertFalse(
+            timeouts.is_statement_timeout(OperationalError('gone away'))
+        )
+
+
+@override_settings(RECIPE_FILTER_MAX_IDS=5)
+class RecipeTimeoutTests(TestCase):
+    """Test statement timeout budgets of the recipe views"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @patch('recipe.views.RecipeViewSet.get_queryset')
+    def test_timeout_returns_504(self, patched_queryset):
+        """Test a cancelled statement gives a clean 504"""
+        patched_queryset.side_effect = query_canceled()
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        self.assertEqual(res.data['detail'].code, 'statement_timeout')
+
+    def test_too_many_ids_refused_before_sql(self):
+        """Test filters with too many IDs are refused without a query"""
+        with CaptureQueriesContext(connection) as captured:
+            res = self.client.get(RECIPES_URL, {'tags': '1,2,3,4,5,6'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse([
+            query for query in captured.captured_queries
+            if 'core_recipe' in query['sql']
+        ])
+
+        res = self.client.get(RECIPES_URL, {'tags': '1,2,3,4,5'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_invalid_ids_refused(self):
+        """Test non-numeric IDs are a client error"""
+        res = self.client.get(RECIPES_URL, {'ingredients': '1,x'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_budget_by_url_name(self):
+        """Test views get their own budget or the default"""
+        with self.settings(
+            DB_STATEMENT_TIMEOUTS={'recipe:recipe-list': 250},
+            DB_STATEMENT_TIMEOUT_MS=4000,
+        ):
+            request = MagicMock()
+            request.resolver_match.view_name = 'recipe:recipe-list'
+            self.assertEqual(timeouts.timeout_for(request), 250)
+            request.resolver_match.view_name = 'recipe:tag-list'
+            self.assertEqual(timeouts.timeout_for(request), 4000)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs SET LOCAL')
+class StatementTimeoutTransactionTests(TransactionTestCase):
+    """Test the timeout against a real Postgres transaction"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _show_timeout(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            return cursor.fetchone()[0]
+
+    @override_settings(DB_STATEMENT_TIMEOUTS={'recipe:recipe-list': 250})
+    def test_timeout_scoped_to_view_transaction(self):
+        """Test SET LOCAL holds inside the view's transaction only"""
+        default = self._show_timeout()
+        seen = []
+        get_queryset = RecipeViewSet.get_queryset
+
+        def recording_get_queryset(view):
+            seen.append((connection.in_atomic_block, self._show_timeout()))
+            return get_queryset(view)
+
+        with patch.object(
+            RecipeViewSet, 'get_queryset', recording_get_queryset
+        ):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(seen), {(True, '250ms')})
+        self.assertFalse(connection.in_atomic_block)
+        self.assertEqual(self._show_timeout(), default)
@@ -0,0 +1,47 @@
+"""
+Tests for the pre-fork warmup
+"""
+import gc
+
+from django.test import SimpleTestCase
+
+from core import warmup
+from recipe import serializers as recipe_serializers
+from user.serializers import AuthTokenSerializer, UserSerializer
+
+
+class WarmupTests(SimpleTestCase):
+    """Test warming up the application"""
+
+    def test_serializers_of_every_view_are_found(self):
+        """Test serializers chosen per action are built too"""
+        classes = warmup.build_serializers(warmup.resolve_urls())
+
+        self.assertLessEqual({
+            recipe_serializers.RecipeSerializer,
+            recipe_serializers.RecipeDetailSerializer,
+            recipe_serializers.RecipeImageSerializer,
+            recipe_serializers.TagSerializer,
+            recipe_serializers.IngredientSerializer,
+            UserSerializer,
+            AuthTokenSerializer,
+        }, classes)
+
+    def test_url_regexes_are_compiled(self):
+        """Test every URL pattern has its regex cached"""
+        resolver = warmup.resolve_urls()
+
+        for pattern in warmup._walk(resolver.url_patterns):
+            self.assertIn('regex', pattern.pattern.__dict__)
+
+    def test_warmup_freezes_objects(self):
+        """Test warmup reports every step and freezes the heap"""
+        self.addCleanup(gc.unfreeze)
+
+        with self.assertLogs('core.warmup', level='INFO'):
+            timings = warmup.warmup()
+
+        self.assertEqual(
+            list(timings), ['imports', 'urls', 'serializers', 'gc']
+        )
+        self.assertGreater(gc.get_freeze_count(), 0)
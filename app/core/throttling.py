@@ -0,0 +1,130 @@
+"""
+Token-bucket throttles shared across workers
+
+Buckets live in a SharedTable in THROTTLE_FILE, which every worker on
+the host maps. Taking a token locks the file for a few microseconds,
+so the check never touches the database or a cache server. A rate of
+'N/period' allows bursts of N requests, refilled evenly over the
+period.
+
+Each slot holds a key hash, the tokens left and the time they were
+counted. A key probes a few slots from its hash; when none is free, the
+least recently used one is taken over. An idle bucket refills to full,
+so dropping it loses nothing.
+"""
+import struct
+import time
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import SimpleRateThrottle
+
+from core import metrics
+from core.shared_tables import SharedTable, key_hash
+
+THROTTLED = metrics.Counter(
+    'throttled_requests',
+    'Requests refused by a throttle, by scope.',
+    ['scope'],
+)
+
+
+class BucketTable(SharedTable):
+    """Token buckets of every worker, in a shared memory-mapped file"""
+    slot = struct.Struct('<Qdd')
+    file_setting = 'THROTTLE_FILE'
+    slots_setting = 'THROTTLE_SLOTS'
+
+    def _find(self, key_hash):
+        """Return the offset and state of a key's slot"""
+        oldest, oldest_at = None, None
+        for offset, (slot_hash, tokens, updated) in self.probe(key_hash):
+            if slot_hash == key_hash:
+                return offset, tokens, updated
+            if slot_hash == 0:
+                return offset, None, None
+            if oldest_at is None or updated < oldest_at:
+                oldest, oldest_at = offset, updated
+        return oldest, None, None
+
+    def take(self, key, capacity, rate):
+        """
+        Take a token from a key's bucket.
+
+        Return 0 if a token was taken, otherwise the seconds until
+        the next one.
+        """
+        hashed = key_hash(key)
+        with self.locked():
+            now = time.time()
+            offset, tokens, updated = self._find(hashed)
+            if tokens is None:
+                tokens = capacity
+            else:
+                tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self.write(offset, hashed, tokens, now)
+        return wait
+
+
+_table = BucketTable()
+
+
+def reset():
+    """Map the table again, used in tests"""
+    global _table
+    _table = BucketTable()
+
+
+class ScopedBucketThrottle(SimpleRateThrottle):
+    """
+    Token-bucket version of DRF's ScopedRateThrottle.
+
+    Views set `throttle_scope` to a key of DEFAULT_THROTTLE_RATES.
+    Authenticated requests are limited per user, others per IP.
+    """
+    scope_attr = 'throttle_scope'
+
+    def __init__(self):
+        # The rate depends on the view, see allow_request().
+        self.wait_seconds = 0.0
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope or not settings.THROTTLE_ENABLED:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        self.wait_seconds = _table.take(
+            self.get_cache_key(request, view),
+            self.num_requests,
+            self.num_requests / self.duration,
+        )
+        if self.wait_seconds:
+            THROTTLED.labels(self.scope).inc()
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class WriteThrottledViewMixin:
+    """Throttle only the requests of a view that write"""
+
+    def get_throttles(self):
+        if self.request.method in SAFE_METHODS:
+            return []
+        return super().get_throttles()
@@ -1,10 +1,93 @@
 """
 Core views for app
 """
+import hmac
+import tracemalloc
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from drf_spectacular.utils import extend_schema
+from rest_framework import authentication, permissions, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import batch, memory, metrics
+from core.instrumentation import InstrumentedViewMixin
 
 @api_view(['GET'])
 def health_check(request):
     """Return succesful response"""
-    return Response({'healthy':True})
\ No newline at end of file
+    return Response({'healthy':True})
+
+
+def metrics_view(request):
+    """Return metrics of all workers in Prometheus text format"""
+    if not settings.METRICS_TOKEN:
+        return HttpResponseForbidden()
+    expected = f'Bearer {settings.METRICS_TOKEN}'.encode()
+    given = request.META.get('HTTP_AUTHORIZATION', '').encode()
+    if not hmac.compare_digest(given, expected):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+class MemoryProfileView(APIView):
+    """Report allocation growth of the worker serving the request"""
+    authentication_classes = [batch.BatchTokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        """Return the top allocation sites since the baseline"""
+        if not tracemalloc.is_tracing():
+            return Response(
+                {'detail': 'Memory profiling is disabled.'},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        key_type = request.query_params.get('group_by', 'lineno')
+        if key_type not in ('lineno', 'filename', 'traceback'):
+            return Response(
+                {'group_by': 'Must be lineno, filename or traceback.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response(
+                {'limit': 'Must be an integer.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        data = memory.report(limit=limit, key_type=key_type)
+        if request.query_params.get('reset') == '1':
+            memory.take_baseline()
+        return Response(data)
+
+
+class BatchView(InstrumentedViewMixin, APIView):
+    """Run several API requests in one, see core.batch"""
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(
+        request=batch.SubRequestSerializer(many=True),
+        responses=batch.SubResponseSerializer(many=True),
+    )
+    def post(self, request):
+        """Return the responses to a list of sub-requests"""
+        serializer = batch.SubRequestSerializer(
+            data=request.data, many=True, allow_empty=False
+        )
+        serializer.is_valid(raise_exception=True)
+        limit = settings.BATCH_MAX_REQUESTS
+        if len(serializer.validated_data) > limit:
+            return Response(
+                {'detail': f'At most {limit} requests can be batched.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return HttpResponse(
+            batch.run(request, serializer.validated_data),
+            content_type='application/json',
+        )
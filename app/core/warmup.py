@@ -0,0 +1,134 @@
+"""
+Warm up the application before uWSGI forks its workers
+
+uWSGI imports app.wsgi once in the master and forks the workers from
+it, so everything built here is shared copy-on-write instead of being
+rebuilt lazily by the first requests of every worker.
+"""
+import gc
+import importlib
+import logging
+import time
+
+from django.apps import apps
+from django.db import connections
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+# Imported lazily by DRF and drf-spectacular on first use.
+MODULES = [
+    'rest_framework.authtoken.models',
+    'rest_framework.negotiation',
+    'rest_framework.metadata',
+    'rest_framework.pagination',
+    'drf_spectacular.openapi',
+    'drf_spectacular.renderers',
+    'drf_spectacular.contrib',
+]
+
+
+def import_modules():
+    """Import every app's models and the lazily imported modules"""
+    for app_config in apps.get_app_configs():
+        app_config.get_models()
+    for name in MODULES:
+        importlib.import_module(name)
+    # DRF imports the classes named in its settings on first access.
+    for name in api_settings.import_strings:
+        getattr(api_settings, name, None)
+
+
+def _walk(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield pattern
+            yield from _walk(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            yield pattern
+
+
+def resolve_urls():
+    """Compile every URL regex and populate the reverse lookups"""
+    resolver = get_resolver()
+    # Populates the reverse and namespace dicts of the whole tree.
+    resolver.reverse_dict
+    resolver.namespace_dict
+    for pattern in _walk(resolver.url_patterns):
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            pattern.reverse_dict
+    return resolver
+
+
+def _serializer_classes(callback):
+    view_class = getattr(callback, 'cls', None)
+    if view_class is None:
+        return set()
+    view = view_class(**getattr(callback, 'initkwargs', {}))
+    actions = getattr(callback, 'actions', None) or {None: None}
+
+    classes = set()
+    for action in actions.values():
+        view.action = action
+        try:
+            serializer_class = view.get_serializer_class()
+        except (AttributeError, AssertionError):
+            serializer_class = getattr(view, 'serializer_class', None)
+        if serializer_class is not None:
+            classes.add(serializer_class)
+    return classes
+
+
+def _build_fields(serializer):
+    for field in serializer.fields.values():
+        if isinstance(field, serializers.ListSerializer):
+            field = field.child
+        if isinstance(field, serializers.BaseSerializer):
+            _build_fields(field)
+
+
+def build_serializers(resolver):
+    """Instantiate the fields of every serializer used by a view"""
+    classes = set()
+    for pattern in _walk(resolver.url_patterns):
+        if isinstance(pattern, URLPattern):
+            classes |= _serializer_classes(pattern.callback)
+    for serializer_class in classes:
+        _build_fields(serializer_class(context={}))
+    return classes
+
+
+def freeze_objects():
+    """Move every object to the permanent generation"""
+    gc.collect()
+    # Keep the collector from touching, and so copying, the warm pages.
+    gc.freeze()
+
+
+def warmup():
+    """Run every warmup step and return how long each one took in ms"""
+    timings = {}
+
+    def step(name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[name] = (time.perf_counter() - start) * 1000
+        return result
+
+    step('imports', import_modules)
+    resolver = step('urls', resolve_urls)
+    step('serializers', build_serializers, resolver)
+    # Connections must not be shared with the forked workers.
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.close()
+    step('gc', freeze_objects)
+
+    logger.info(
+        'Warmup done in %.1fms (%s)', sum(timings.values()),
+        ', '.join(f'{name}={ms:.1f}ms' for name, ms in timings.items()),
+    )
+    return timings
@@ -0,0 +1,23 @@
+"""
+SQL query budgets for the recipe API
+
+Keyed by (HTTP method, URL name). Counts include token authentication,
+and for writes the check that the user's data is not being moved and
+the transaction's BEGIN and COMMIT. They must stay flat as the amount
+of data a user owns grows. Change a budget in the same commit as the
+code that changes the query count.
+"""
+QUERY_BUDGETS = {
+    ('GET', 'recipe:api-root'): 0,
+    ('GET', 'recipe:recipe-list'): 4,
+    ('POST', 'recipe:recipe-list'): 11,
+    ('GET', 'recipe:recipe-detail'): 4,
+    ('PATCH', 'recipe:recipe-detail'): 9,
+    ('DELETE', 'recipe:recipe-detail'): 11,
+    ('POST', 'recipe:recipe-upload-image'): 8,
+    ('GET', 'recipe:tag-list'): 2,
+    ('PATCH', 'recipe:tag-detail'): 6,
+    ('GET', 'recipe:ingredient-list'): 2,
+    ('PATCH', 'recipe:ingredient-detail'): 6,
+    ('GET', 'recipe:sync'): 7,
+}
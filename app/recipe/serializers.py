@@ -84,7 +84,10 @@ class RecipeSerializer(serializers.ModelSerializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
-        instance.save()
+        # New tags or ingredients change the recipe in the sync feed too.
+        instance.save_changes(
+            touch=tags is not None or ingredients is not None
+        )
         return instance          
 
 
@@ -0,0 +1,110 @@
+"""
+Streaming list responses for the recipe APIs
+"""
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework import mixins
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+class StreamingJSONRenderer(JSONRenderer):
+    """Render a JSON array incrementally, one chunk of items at a time"""
+
+    def render_stream(self, chunks, renderer_context=None):
+        """Yield the bytes of a JSON array built from lists of items"""
+        yield b'['
+        first = True
+        for chunk in chunks:
+            # Each chunk is rendered as its own array, then the
+            # surrounding brackets are dropped so it can be spliced in.
+            body = self.render(chunk, renderer_context=renderer_context)
+            body = body.strip()[1:-1]
+            if not body.strip():
+                continue
+            if not first:
+                yield b','
+            yield body
+            first = False
+        yield b']'
+
+
+class StreamingListModelMixin(mixins.ListModelMixin):
+    """
+    List a queryset by streaming it in chunks.
+
+    Results that fit in a single chunk are returned as a normal
+    response, larger ones are serialized chunk by chunk so only
+    one chunk of model instances is held in memory at a time.
+
+    Later chunks are read by keyset: each starts after the last row of
+    the one before in the queryset's ordering, which gets the primary
+    key as a tiebreaker so rows are neither repeated nor skipped.
+
+    They are read while the response is sent, after the middleware
+    returned, so the request's SQL count and timings only cover the
+    first chunk.
+    """
+    stream_chunk_size = 500
+    stream_renderer_class = StreamingJSONRenderer
+
+    @staticmethod
+    def _ordering(queryset):
+        """Return the ordering of a queryset, ending with its primary key"""
+        ordering = list(queryset.query.order_by)
+        pk_names = ('pk', queryset.model._meta.pk.name)
+        if not ordering or ordering[-1].lstrip('-') not in pk_names:
+            ordering.append('pk')
+        return ordering
+
+    @staticmethod
+    def _after(ordering, obj):
+        """Filter for the rows after an object in an ordering"""
+        after = Q()
+        equal = {}
+        for field in ordering:
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            value = getattr(obj, name)
+            after |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return after
+
+    def _iter_chunks(self, queryset, ordering, first_chunk):
+        """Yield serialized chunks of the queryset"""
+        chunk_size = self.stream_chunk_size
+        chunk = first_chunk
+        while chunk:
+            yield self.get_serializer(chunk, many=True).data
+            if len(chunk) < chunk_size:
+                break
+            after = self._after(ordering, chunk[-1])
+            chunk = self.read_chunk(queryset.filter(after)[:chunk_size])
+
+    def read_chunk(self, queryset):
+        """Read one later chunk of the queryset"""
+        return list(queryset)
+
+    def list(self, request, *args, **kwargs):
+        """List objects, streaming the response for large results"""
+        if (self.paginator is not None or
+                getattr(request.accepted_renderer, 'format', None) != 'json'):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        # Later chunks are read after the view returned, pin the database
+        # the request's routing chose.
+        queryset = queryset.using(queryset.db)
+        ordering = self._ordering(queryset)
+        queryset = queryset.order_by(*ordering)
+        first_chunk = list(queryset[:self.stream_chunk_size])
+        if len(first_chunk) < self.stream_chunk_size:
+            serializer = self.get_serializer(first_chunk, many=True)
+            return Response(serializer.data)
+
+        renderer = self.stream_renderer_class()
+        content = renderer.render_stream(
+            self._iter_chunks(queryset, ordering, first_chunk),
+            renderer_context=self.get_renderer_context(),
+        )
+        return StreamingHttpResponse(content, content_type=renderer.media_type)
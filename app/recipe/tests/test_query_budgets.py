@@ -0,0 +1,205 @@
+"""
+Tests for recipe API query budgets
+"""
+from decimal import Decimal
+import tempfile
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from core.testing import QueryBudgetMixin
+from recipe.query_budgets import QUERY_BUDGETS
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Test recipe endpoints stay within their query budgets"""
+    query_budgets = QUERY_BUDGETS
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.recipe = create_recipe(user=self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Tag')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Ingredient'
+        )
+
+    def grow(self, count):
+        """Add recipes, tags and ingredients to the user's account"""
+        for i in range(count):
+            recipe = create_recipe(user=self.user, title=f'Recipe {i}')
+            tag = Tag.objects.create(user=self.user, name=f'Tag {i}')
+            ingredient = Ingredient.objects.create(
+                user=self.user, name=f'Ingredient {i}'
+            )
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+            self.recipe.tags.add(tag)
+            self.recipe.ingredients.add(ingredient)
+
+    def _detail_url(self, recipe_id=None):
+        return reverse(
+            'recipe:recipe-detail', args=[recipe_id or self.recipe.id]
+        )
+
+    def test_budgets_cover_all_routes(self):
+        """Test every recipe route has a declared query budget"""
+        self.assertBudgetsCoverUrls('recipe.urls')
+
+    def test_api_root(self):
+        """Test the API root stays in budget"""
+        self.assertQueryBudget(
+            'GET', 'recipe:api-root',
+            lambda: self.client.get(reverse('recipe:api-root')),
+        )
+
+    def test_recipe_list(self):
+        """Test listing recipes stays in budget"""
+        self.assertQueryBudget(
+            'GET', 'recipe:recipe-list',
+            lambda: self.client.get(reverse('recipe:recipe-list')),
+        )
+
+    def test_recipe_list_by_ids(self):
+        """Test fetching recipes by id stays in budget"""
+        self.assertQueryBudget(
+            'GET', 'recipe:recipe-list',
+            lambda ids: self.client.get(
+                reverse('recipe:recipe-list'), {'ids': ids}
+            ),
+            prepare=lambda: ','.join(
+                str(pk) for pk in
+                Recipe.objects.values_list('id', flat=True)[:100]
+            ),
+        )
+
+    def test_recipe_create(self):
+        """Test creating a recipe stays in budget"""
+        payload = {
+            'title': 'New recipe',
+            'time_minutes': 5,
+            'price': '1.50',
+            'tags': [{'name': 'Tag'}],
+            'ingredients': [{'name': 'Ingredient'}],
+        }
+        self.assertQueryBudget(
+            'POST', 'recipe:recipe-list',
+            lambda: self.client.post(
+                reverse('recipe:recipe-list'), payload, format='json'
+            ),
+        )
+
+    def test_recipe_detail(self):
+        """Test retrieving a recipe stays in budget"""
+        self.assertQueryBudget(
+            'GET', 'recipe:recipe-detail',
+            lambda: self.client.get(self._detail_url()),
+        )
+
+    def test_recipe_partial_update(self):
+        """Test updating a recipe stays in budget"""
+        self.assertQueryBudget(
+            'PATCH', 'recipe:recipe-detail',
+            lambda: self.client.patch(
+                self._detail_url(), {'title': 'Updated'}, format='json'
+            ),
+        )
+
+    def test_recipe_delete(self):
+        """Test deleting a recipe stays in budget"""
+        self.assertQueryBudget(
+            'DELETE', 'recipe:recipe-detail',
+            lambda recipe: self.client.delete(self._detail_url(recipe.id)),
+            prepare=lambda: create_recipe(user=self.user),
+        )
+
+    def test_recipe_upload_image(self):
+        """Test uploading an image stays in budget"""
+        def upload():
+            with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+                Image.new('RGB', (10, 10)).save(image_file, format='JPEG')
+                image_file.seek(0)
+                return self.client.post(
+                    reverse(
+                        'recipe:recipe-upload-image', args=[self.recipe.id]
+                    ),
+                    {'image': image_file},
+                    format='multipart',
+                )
+
+        self.assertQueryBudget('POST', 'recipe:recipe-upload-image', upload)
+
+    @override_settings(SYNC_SETTLE_SECONDS=0)
+    def test_sync(self):
+        """Test syncing recipe data stays in budget"""
+        self.assertQueryBudget(
+            'GET', 'recipe:sync',
+            lambda: self.client.get(reverse('recipe:sync')),
+        )
+
+    def test_tag_list(self):
+        """Test listing tags stays in budget"""
+        self.assertQueryBudget(
+            'GET', 'recipe:tag-list',
+            lambda: self.client.get(
+                reverse('recipe:tag-list'), {'assigned_only': 1}
+            ),
+        )
+
+    def test_tag_partial_update(self):
+        """Test updating a tag stays in budget"""
+        self.assertQueryBudget(
+            'PATCH', 'recipe:tag-detail',
+            lambda: self.client.patch(
+                reverse('recipe:tag-detail', args=[self.tag.id]),
+                {'name': 'Renamed'},
+            ),
+        )
+
+    def test_ingredient_list(self):
+        """Test listing ingredients stays in budget"""
+        self.assertQueryBudget(
+            'GET', 'recipe:ingredient-list',
+            lambda: self.client.get(reverse('recipe:ingredient-list')),
+        )
+
+    def test_ingredient_partial_update(self):
+        """Test updating an ingredient stays in budget"""
+        self.assertQueryBudget(
+            'PATCH', 'recipe:ingredient-detail',
+            lambda: self.client.patch(
+                reverse(
+                    'recipe:ingredient-detail', args=[self.ingredient.id]
+                ),
+                {'name': 'Renamed'},
+            ),
+        )
@@ -8,7 +8,9 @@ import os
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -157,6 +159,23 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(recipe.link, original_link)
         self.assertEqual(recipe.user, self.user)
 
+    def test_partial_update_writes_changed_columns_only(self):
+        """Test a PATCH writes the changed fields, and nothing if unchanged"""
+        recipe = create_recipe(user=self.user, description="Long text")
+        url = detail_url(recipe.id)
+
+        with CaptureQueriesContext(connection) as captured:
+            self.client.patch(url, {'title': 'New title!'})
+            self.client.patch(url, {'title': 'New title!'})
+
+        updates = [
+            query['sql'] for query in captured.captured_queries
+            if query['sql'].startswith('UPDATE "core_recipe"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"title"', updates[0])
+        self.assertNotIn('"description"', updates[0])
+
     def test_full_update(self):
         """Test full update of a recipe"""
         recipe = create_recipe(
@@ -452,6 +471,33 @@ class PrivateRecipeAPITests(TestCase):
         self.assertIn(s2.data, res.data)
         self.assertNotIn(s3.data, res.data)
 
+    def test_get_recipes_by_ids(self):
+        """Test fetching the details of several recipes at once"""
+        r1 = create_recipe(user=self.user, description="First")
+        r2 = create_recipe(user=self.user, description="Second")
+        r3 = create_recipe(user=self.user)
+        other_user = User.objects.create(
+            email="test2@example.com",
+            password="pass12345"
+        )
+        other = create_recipe(user=other_user)
+
+        params = {'ids': f'{r1.id},{r2.id},{other.id}'}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data, RecipeDetailSerializer([r2, r1], many=True).data
+        )
+        self.assertNotIn(r3.id, [recipe['id'] for recipe in res.data])
+
+    @override_settings(RECIPE_MULTI_GET_MAX_IDS=3)
+    def test_get_recipes_by_too_many_ids(self):
+        """Test multi-gets are capped"""
+        res = self.client.get(RECIPES_URL, {'ids': '1,2,3,4'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class ImageUploadTests(TestCase):
     """Tests for the image upload API"""
@@ -0,0 +1,109 @@
+"""
+Tests for streaming list responses
+"""
+from decimal import Decimal
+import json
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+)
+from recipe.serializers import (
+    RecipeSerializer,
+    TagSerializer,
+)
+from recipe.views import (
+    RecipeViewSet,
+    TagViewSet,
+)
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class StreamingListTests(TestCase):
+    """Test streamed list responses"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _streamed_json(self, res):
+        """Return the decoded body of a streaming response"""
+        self.assertIsInstance(res, StreamingHttpResponse)
+        return json.loads(b''.join(res.streaming_content))
+
+    @patch.object(RecipeViewSet, 'stream_chunk_size', 2)
+    def test_large_recipe_list_is_streamed(self):
+        """Test recipe lists larger than a chunk are streamed"""
+        for i in range(5):
+            recipe = create_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f'T{i}'))
+
+        res = self.client.get(RECIPES_URL)
+
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
+        serializer = RecipeSerializer(recipes, many=True)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self._streamed_json(res),
+            json.loads(json.dumps(serializer.data)),
+        )
+
+    @patch.object(TagViewSet, 'stream_chunk_size', 2)
+    def test_exact_multiple_of_chunk_size(self):
+        """Test streaming a list that fills every chunk"""
+        for name in ['A', 'B', 'C', 'D']:
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL)
+
+        tags = Tag.objects.filter(user=self.user).order_by('-name')
+        serializer = TagSerializer(tags, many=True)
+        self.assertEqual(self._streamed_json(res), serializer.data)
+
+    @patch.object(TagViewSet, 'stream_chunk_size', 2)
+    def test_equal_names_across_chunks(self):
+        """Test rows sharing a sort key are streamed exactly once"""
+        for name in ['A', 'B', 'B', 'B', 'C']:
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL)
+
+        tags = Tag.objects.filter(user=self.user).order_by('-name', '-id')
+        serializer = TagSerializer(tags, many=True)
+        self.assertEqual(self._streamed_json(res), serializer.data)
+
+    def test_small_list_is_not_streamed(self):
+        """Test lists smaller than a chunk use a normal response"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertNotIsInstance(res, StreamingHttpResponse)
+        self.assertEqual(len(res.data), 1)
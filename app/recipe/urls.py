@@ -18,5 +18,6 @@ router.register('ingredients',views.IngredientsViewSet)
 app_name = 'recipe'
 
 urlpatterns = [
+    path('sync/', views.SyncView.as_view(), name='sync'),
     path('', include(router.urls)),
 ]
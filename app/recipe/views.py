@@ -1,6 +1,9 @@
 """
 Views for the recipe API
 """
+import time
+
+from django.conf import settings
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
@@ -8,21 +11,31 @@ from drf_spectacular.utils import (
     OpenApiTypes,
 )
 from rest_framework import (
+    generics,
     viewsets,
     mixins,
     status,
 )
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
+from core import metrics, sync
+from core.batch import BatchTokenAuthentication
+from core.db.sharding import ShardedViewMixin
+from core.db.timeouts import StatementTimeoutMixin
+from core.idempotency import IdempotentViewMixin
+from core.instrumentation import InstrumentedViewMixin
+from core.throttling import WriteThrottledViewMixin
 from core.models import (
     Recipe,
     Tag,
     Ingredient,
+    Tombstone,
 )
 from recipe import serializers
+from recipe.streaming import StreamingListModelMixin
 
 @extend_schema_view(
     list=extend_schema(
@@ -35,13 +48,18 @@ from recipe import serializers
         ]
     )
 )
-class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
+class BaseRecipeAttrViewSet(InstrumentedViewMixin,
+                            StatementTimeoutMixin,
+                            ShardedViewMixin,
+                            WriteThrottledViewMixin,
+                            mixins.DestroyModelMixin,
                             mixins.UpdateModelMixin,
-                            mixins.ListModelMixin,
+                            StreamingListModelMixin,
                             viewsets.GenericViewSet):
     """Base viewset for user owned recipe attributes"""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [BatchTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'recipe-write'
 
     def get_queryset(self):
         """Filter queryset to authenticate user"""
@@ -54,7 +72,7 @@ class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
 
         return queryset.filter(
             user=self.request.user
-        ).order_by('-name').distinct()
+        ).order_by('-name', '-id').distinct()
 
 
 @extend_schema_view(
@@ -69,20 +87,45 @@ class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
                 'ingredients',
                 OpenApiTypes.STR,
                 description='Comma separated list of ingredient IDs to filter',
-            )
+            ),
+            OpenApiParameter(
+                'ids',
+                OpenApiTypes.STR,
+                description=(
+                    'Comma separated list of recipe IDs to fetch in full, '
+                    'with their description and image'
+                ),
+            ),
         ]
     )
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(InstrumentedViewMixin,
+                    StatementTimeoutMixin,
+                    ShardedViewMixin,
+                    IdempotentViewMixin,
+                    WriteThrottledViewMixin,
+                    StreamingListModelMixin,
+                    viewsets.ModelViewSet):
     """View for manage recipe APIs"""
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [BatchTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'recipe-write'
+    idempotent_actions = (
+        'create', 'update', 'partial_update', 'upload_image',
+    )
 
-    def _params_to_ints(self, qs):
+    def _params_to_ints(self, qs, limit=None):
         """Convert a list of string to integers"""
-        return [int(str_id) for str_id in qs.split(',')]
+        # Checked before building the query, huge IN lists are slow.
+        limit = limit or settings.RECIPE_FILTER_MAX_IDS
+        if qs.count(',') >= limit:
+            raise ValidationError(f'At most {limit} IDs can be given.')
+        try:
+            return [int(str_id) for str_id in qs.split(',')]
+        except ValueError:
+            raise ValidationError('IDs must be integers.')
 
     def get_queryset(self):
         """Retrieve recipes for authenticated user"""
@@ -90,7 +133,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
         # operate on this filtered queryset.
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        ids = self.request.query_params.get('ids')
         queryset = self.queryset
+        if ids:
+            # Multi-get for clients syncing many recipes at once.
+            queryset = queryset.filter(id__in=self._params_to_ints(
+                ids, limit=settings.RECIPE_MULTI_GET_MAX_IDS
+            ))
         if tags:
             tag_ids = self._params_to_ints(tags)
             queryset = queryset.filter(tags__id__in=tag_ids)
@@ -100,11 +149,15 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return queryset.filter(
             user=self.request.user
-        ).order_by('-id').distinct()
+        ).order_by('-id').distinct().prefetch_related('tags', 'ingredients')
 
     def get_serializer_class(self):
         """Return the serializer class for request"""
         if self.action == 'list':
+            # Warmup builds the serializers of views without a request.
+            request = getattr(self, 'request', None)
+            if request is not None and request.query_params.get('ids'):
+                return serializers.RecipeDetailSerializer
             return serializers.RecipeSerializer
         if self.action == 'upload_image':
             return serializers.RecipeImageSerializer
@@ -113,7 +166,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         """Create a new recipe"""
-        # Any view with authentication_classes = [TokenAuthentication]
+        # Any view with authentication_classes = [BatchTokenAuthentication]
         # can access self.request.user.
         serializer.save(user=self.request.user)
     
@@ -127,8 +180,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
         recipe = self.get_object()
         serializer = self.get_serializer(recipe, data=request.data)
 
+        start = time.perf_counter()
         if serializer.is_valid():
             serializer.save()
+            metrics.IMAGE_PROCESSING.observe(time.perf_counter() - start)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -143,3 +198,66 @@ class IngredientsViewSet(BaseRecipeAttrViewSet):
     """Manage ingredients in the database"""
     serializer_class = serializers.IngredientSerializer
     queryset = Ingredient.objects.all()
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            'since',
+            OpenApiTypes.STR,
+            description='Cursor returned by the previous sync',
+        )
+    ],
+    responses=OpenApiTypes.OBJECT,
+)
+class SyncView(InstrumentedViewMixin,
+               StatementTimeoutMixin,
+               ShardedViewMixin,
+               generics.GenericAPIView):
+    """
+    Changes to the user's recipes, tags and ingredients since a cursor.
+
+    Changes younger than SYNC_SETTLE_SECONDS are held back, since their
+    timestamps are taken before commit. A write whose transaction stays
+    open longer than that can commit behind a cursor already handed out,
+    and clients miss it until the object changes again.
+    """
+    queryset = Recipe.objects.all()
+    authentication_classes = [BatchTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_classes = {
+        'recipe': serializers.RecipeDetailSerializer,
+        'tag': serializers.TagSerializer,
+        'ingredient': serializers.IngredientSerializer,
+    }
+
+    def _change(self, obj):
+        if isinstance(obj, Tombstone):
+            return {'type': obj.model, 'id': obj.object_id, 'deleted': True}
+        model_name = obj._meta.model_name
+        serializer = self.serializer_classes[model_name](
+            obj, context=self.get_serializer_context()
+        )
+        return {
+            'type': model_name,
+            'id': obj.pk,
+            'deleted': False,
+            'data': serializer.data,
+        }
+
+    def get(self, request):
+        """Return a page of changes, oldest first, and the next cursor"""
+        since = request.query_params.get('since')
+        try:
+            position = sync.decode_cursor(since) if since else None
+        except ValueError:
+            raise ValidationError({'since': 'Invalid cursor.'})
+
+        changes, position, has_more = sync.changes(
+            request.user, position, settings.SYNC_PAGE_SIZE
+        )
+        return Response({
+            'results': [self._change(obj) for _, obj in changes],
+            'cursor': sync.encode_cursor(position),
+            'has_more': has_more,
+        })
@@ -0,0 +1,13 @@
+"""
+SQL query budgets for the user API
+
+Keyed by (HTTP method, URL name). Counts include token authentication
+where the endpoint requires it. Change a budget in the same commit as
+the code that changes the query count.
+"""
+QUERY_BUDGETS = {
+    ('POST', 'user:create'): 2,
+    ('POST', 'user:token'): 2,
+    ('GET', 'user:me'): 1,
+    ('PATCH', 'user:me'): 2,
+}
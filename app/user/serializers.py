@@ -25,13 +25,15 @@ class UserSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         """Update and return user"""
         password = validated_data.pop('password', None)
-        user = super().update(instance, validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
 
         if password:
-            user.set_password(password)
-            user.save()
+            instance.set_password(password)
 
-        return user
+        # One UPDATE of the changed columns, none if nothing changed.
+        instance.save_changes()
+        return instance
 
 
 # Because we are not basing this serializer in a model
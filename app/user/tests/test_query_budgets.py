@@ -0,0 +1,81 @@
+"""
+Tests for user API query budgets
+"""
+from decimal import Decimal
+import itertools
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.testing import QueryBudgetMixin
+from user.query_budgets import QUERY_BUDGETS
+
+
+class UserQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Test user endpoints stay within their query budgets"""
+    query_budgets = QUERY_BUDGETS
+
+    def setUp(self):
+        self.password = 'testpass123'
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password=self.password,
+        )
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def grow(self, count):
+        """Add recipes to the user's account"""
+        for i in range(count):
+            Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {i}',
+                time_minutes=5,
+                price=Decimal('1.00'),
+            )
+
+    def test_budgets_cover_all_routes(self):
+        """Test every user route has a declared query budget"""
+        self.assertBudgetsCoverUrls('user.urls')
+
+    def test_create_user(self):
+        """Test creating a user stays in budget"""
+        emails = (f'new{i}@example.com' for i in itertools.count())
+        self.assertQueryBudget(
+            'POST', 'user:create',
+            lambda: APIClient().post(reverse('user:create'), {
+                'email': next(emails),
+                'password': self.password,
+                'name': 'New user',
+            }),
+        )
+
+    def test_create_token(self):
+        """Test creating a token stays in budget"""
+        self.assertQueryBudget(
+            'POST', 'user:token',
+            lambda: APIClient().post(reverse('user:token'), {
+                'email': self.user.email,
+                'password': self.password,
+            }),
+        )
+
+    def test_retrieve_me(self):
+        """Test retrieving the profile stays in budget"""
+        self.assertQueryBudget(
+            'GET', 'user:me',
+            lambda: self.client.get(reverse('user:me')),
+        )
+
+    def test_update_me(self):
+        """Test updating the profile stays in budget"""
+        self.assertQueryBudget(
+            'PATCH', 'user:me',
+            lambda: self.client.patch(reverse('user:me'), {'name': 'New'}),
+        )
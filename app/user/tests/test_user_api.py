@@ -1,7 +1,9 @@
 """
 Test User endpoints
 """
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
@@ -166,3 +168,18 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_update_writes_changed_columns_only(self):
+        """Test a profile update writes only what changed"""
+        with CaptureQueriesContext(connection) as captured:
+            res = self.client.patch(ME_URL, {'name': 'new name'})
+            self.client.patch(ME_URL, {'name': 'new name'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        updates = [
+            query['sql'] for query in captured.captured_queries
+            if query['sql'].startswith('UPDATE')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"name"', updates[0])
+        self.assertNotIn('"password"', updates[0])
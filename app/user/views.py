@@ -1,31 +1,38 @@
 """
 Views for the user API
 """
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from core.batch import BatchTokenAuthentication
+from core.instrumentation import InstrumentedViewMixin
+from core.throttling import ScopedBucketThrottle
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
 )
 
 
-class CreateUserView(generics.CreateAPIView):
+class CreateUserView(InstrumentedViewMixin, generics.CreateAPIView):
     """Create a new user in the system"""
     serializer_class = UserSerializer
+    throttle_scope = 'signup'
 
 
-class CreateTokenView(ObtainAuthToken):
+class CreateTokenView(InstrumentedViewMixin, ObtainAuthToken):
     """Create a new auth token for the user"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # ObtainAuthToken turns throttling off.
+    throttle_classes = [ScopedBucketThrottle]
+    throttle_scope = 'login'
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(InstrumentedViewMixin, generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [BatchTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
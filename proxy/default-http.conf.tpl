@@ -0,0 +1,18 @@
+server {
+    listen ${LISTEN_PORT};  # ← Replaced with an env variable (e.g., 80 or 443)
+
+    # Serve static files (CSS, JS, images) directly from /vol/static
+    location /static {
+        alias /vol/static;
+    }
+
+    # Proxy all other requests to Django (via the ASGI server)
+    location / {
+        proxy_pass           http://${APP_HOST}:${APP_PORT};  # ← e.g., `app:9000`
+        proxy_set_header     Host $host;
+        proxy_set_header     X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header     X-Forwarded-Proto $scheme;
+        proxy_set_header     X-Request-Start "t=${msec}";  # Queue time for admission control
+        client_max_body_size 10M;  # Allow file uploads up to 10MB
+    }
+}
\ No newline at end of file
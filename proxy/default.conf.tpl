@@ -10,6 +10,8 @@ server {
     location / {
         uwsgi_pass           ${APP_HOST}:${APP_PORT};  # ← e.g., `app:9000`
         include              /etc/nginx/uwsgi_params;  # Standard uWSGI settings
+        uwsgi_param          HTTP_X_REQUEST_START "t=${msec}";  # Queue time for admission control
+        uwsgi_param          HTTP_X_FORWARDED_FOR $proxy_add_x_forwarded_for;  # Client address for throttling (NUM_PROXIES)
         client_max_body_size 10M;  # Allow file uploads up to 10MB
     }
 }
\ No newline at end of file
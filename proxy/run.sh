@@ -2,5 +2,12 @@
 
 set -e
 
-envsubst < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf
-nginx -g 'daemon off;'
\ No newline at end of file
+# uwsgi for the default uWSGI app server, http for SERVER_MODE=asgi
+if [ "${APP_PROTOCOL:-uwsgi}" = "http" ]; then
+    template=/etc/nginx/default-http.conf.tpl
+else
+    template=/etc/nginx/default.conf.tpl
+fi
+
+envsubst '${LISTEN_PORT} ${APP_HOST} ${APP_PORT}' < "$template" > /etc/nginx/conf.d/default.conf
+nginx -g 'daemon off;'
@@ -2,8 +2,15 @@
 
 set -e
 
-python manage.py wait_for_db
-python manage.py collectstatic --noinput
-python manage.py migrate
+python manage.py wait_for_db --timeout 300
+python manage.py prepare_release
 
-uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
\ No newline at end of file
+rm -rf "${METRICS_DIR:-/vol/metrics}"
+
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+    # Speaks HTTP: run the proxy with APP_PROTOCOL=http.
+    exec uvicorn app.asgi:application --host 0.0.0.0 --port 9000 \
+        --workers "${ASGI_WORKERS:-2}" --no-access-log
+fi
+
+uwsgi --socket :9000 --workers 4 --master --enable-threads --py-call-osafterfork --module app.wsgi